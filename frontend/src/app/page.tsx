@@ -1,4 +1,4 @@
-type Printable = { id: number; name: string; };
+type Printable = { id: number; name: string; thumbnail_url?: string | null };
 
 async function getPrintables(): Promise<Printable[]> {
   try {
@@ -37,6 +37,17 @@ export default async function Home() {
               key={p.id}
               className="glass p-4 sm:p-5 hover:shadow-2xl transition-shadow"
             >
+              {p.thumbnail_url && (
+                // eslint-disable-next-line @next/next/no-img-element -- served pre-sized by the API
+                <img
+                  src={p.thumbnail_url}
+                  alt=""
+                  width={256}
+                  height={256}
+                  loading="lazy"
+                  className="mx-auto mb-3 h-32 w-32"
+                />
+              )}
               <div className="flex items-center justify-between mb-2">
                 <h3 className="text-lg font-medium text-zinc-100">{p.name}</h3>
               </div>
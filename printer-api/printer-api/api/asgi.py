@@ -9,8 +9,89 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+class APIHandler(ASGIHandler):
+    """Serves /api/ through ``API_MIDDLEWARE`` instead of ``MIDDLEWARE``.
+
+    Under ASGI, Django runs each middleware that isn't async-capable (all of
+    the contrib ones) on the thread shared by sync code, several times per
+    request. The API uses none of them, and the hops would serialize even
+    the requests that never leave the event loop.
+    """
+
+    def load_middleware(self, is_async=False):
+        # BaseHandler.load_middleware reads settings.MIDDLEWARE; this builds
+        # the same chain from API_MIDDLEWARE, which must all be async-capable
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._exception_middleware = []
+
+        handler = convert_exception_to_response(self._get_response_async)
+        for middleware_path in reversed(settings.API_MIDDLEWARE):
+            middleware = import_string(middleware_path)
+            if not getattr(middleware, "async_capable", False):
+                raise ImproperlyConfigured(
+                    f"API_MIDDLEWARE entry {middleware_path} is not async-capable"
+                )
+            try:
+                mw_instance = middleware(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(mw_instance, "process_view"):
+                self._view_middleware.insert(
+                    0, self.adapt_method_mode(True, mw_instance.process_view)
+                )
+            if hasattr(mw_instance, "process_template_response"):
+                self._template_response_middleware.append(
+                    self.adapt_method_mode(True, mw_instance.process_template_response)
+                )
+            if hasattr(mw_instance, "process_exception"):
+                # Django runs the exception hooks synchronously
+                self._exception_middleware.append(
+                    self.adapt_method_mode(False, mw_instance.process_exception)
+                )
+            handler = convert_exception_to_response(mw_instance)
+        self._middleware_chain = handler
+
+
+api_application = APIHandler()
+
+
+async def lifespan(receive, send) -> None:
+    """Background work that lives as long as the server, not the import."""
+    from core.fleet import warm_on_startup
+    from core.heartbeat import heartbeats
+    from core.progress import job_progress
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Pre-load printer state before the first heartbeat wave arrives
+            await sync_to_async(warm_on_startup)()
+            heartbeats.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await sync_to_async(heartbeats.stop)()
+            await sync_to_async(job_progress.flush)()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"].startswith("/api/"):
+        return await api_application(scope, receive, send)
+    return await django_application(scope, receive, send)
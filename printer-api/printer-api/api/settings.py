@@ -51,6 +51,12 @@ MIDDLEWARE = [
     "core.middleware.SimpleCORS",
 ]
 
+# Middleware for /api/ when served over ASGI (see api/asgi.py). Only async-
+# capable middleware belongs here; the API needs no sessions, auth or CSRF.
+API_MIDDLEWARE = [
+    "core.middleware.SimpleCORS",
+]
+
 ROOT_URLCONF = "api.urls"
 
 TEMPLATES = [
@@ -78,6 +84,10 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction starts: one that read first
+        # could not upgrade while another connection writes, and would fail
+        # with "database is locked" instead of waiting its turn
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
     }
 }
 
@@ -131,3 +141,73 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
+
+# Printer heartbeats are buffered in memory and written in batches
+HEARTBEAT_FLUSH_INTERVAL = 5.0  # seconds
+
+# Queued orders are dispatched from memory; re-read the queue this often
+DISPATCH_RESYNC_INTERVAL = 30.0  # seconds
+
+# Upper bound on orders accepted by one POST /api/orders/bulk request
+BULK_ORDERS_MAX = 10000
+
+# Upper bound on pings accepted by one POST /api/printers/ping/batch request
+PING_BATCH_MAX = 1000
+
+# Ping answers tell each printer when to ping next (see core.pacing)
+PING_INTERVAL_SOON = 2.0  # seconds, idle while orders are waiting
+PING_INTERVAL_PRINTING = 5.0  # seconds
+PING_INTERVAL_IDLE = 15.0  # seconds, idle with an empty queue
+PING_INTERVAL_MAX = 60.0  # seconds
+PING_RATE_TARGET = 500.0  # pings per second from the whole fleet
+PING_JITTER = 0.2  # +/- fraction of the interval
+
+# Serialized GET /api/printables* responses kept in memory (LRU)
+CATALOG_CACHE_MAX_ENTRIES = 1024
+
+# GET /api/printables keyset pagination
+PRINTABLES_PAGE_SIZE = 100
+PRINTABLES_MAX_PAGE_SIZE = 10000
+PRINTABLES_STREAM_THRESHOLD = 500  # larger pages are streamed, not cached
+PRINTABLES_STREAM_CHUNK = 500  # rows read per query while streaming
+
+# Hand file downloads to the front proxy: None, "x-sendfile" (Apache,
+# lighttpd) or "x-accel-redirect" (nginx, with an internal location that
+# maps SENDFILE_ACCEL_PREFIX onto MEDIA_ROOT)
+SENDFILE_BACKEND = None
+SENDFILE_ACCEL_PREFIX = "/protected-media/"
+
+# ASCII STL uploads are rewritten as binary STL on ingest; keep the
+# original under stl/originals/ only when asked to
+STL_TRANSCODE_ASCII = True
+STL_KEEP_ORIGINAL = False
+
+# Decimated preview meshes served by GET /api/printables/<id>/stl?lod=<name>,
+# as name -> triangle budget ("full" is always available)
+STL_LOD_LEVELS = {"5k": 5_000, "50k": 50_000}
+
+# Resumable uploads (POST /api/uploads): largest accepted file, and worker
+# processes for ingest (0 runs it inline, in the request)
+UPLOAD_MAX_SIZE = 1 << 30  # bytes
+UPLOAD_PROCESS_WORKERS = 2
+
+# Server-rendered PNG thumbnails (GET /api/printables/<id>/thumbnail?size=)
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_CACHE_MAX_BYTES = 256 << 20  # least recently used are evicted
+THUMBNAIL_MAX_TRIANGLES = 50_000  # rendered from the densest LOD within this
+
+# Order status push: GET /api/orders/<id>?since=<version> waits at most this
+# long for a change; GET /api/orders/<id>/events sends a comment this often
+# so proxies keep the stream open
+ORDER_WAIT_MAX_TIMEOUT = 25.0  # seconds
+ORDER_EVENTS_KEEPALIVE = 15.0  # seconds
+
+# Print progress reported by pings: kept per job in a ring buffer, stored
+# every PROGRESS_FLUSH_INTERVAL seconds at most one sample per job per
+# PROGRESS_SAMPLE_INTERVAL; GET /api/orders/<id>/progress returns up to
+# PROGRESS_HISTORY_POINTS samples of history
+PROGRESS_FLUSH_INTERVAL = 30.0  # seconds
+PROGRESS_SAMPLE_INTERVAL = 60.0  # seconds
+PROGRESS_BUFFER_SIZE = 720  # samples per job between flushes
+PROGRESS_STALE_AFTER = 3600.0  # seconds without a sample before a job is dropped
+PROGRESS_HISTORY_POINTS = 200
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
 
 application = get_wsgi_application()
+
+# Write buffered heartbeats even when no ping comes along to do it
+from core.heartbeat import heartbeats  # noqa: E402
+
+heartbeats.start()
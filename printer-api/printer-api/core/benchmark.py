@@ -0,0 +1,436 @@
+"""Load test of the order lifecycle: the API under a simulated fleet.
+
+``run`` serves the application with uvicorn in this process and drives it
+with the printer mock's fleet (``printer-mock/fleet.py``), while a customer
+side creates orders at a fixed rate and polls each one until it is done.
+Latencies are measured by the clients, per endpoint. Database queries are
+counted on the server, per endpoint, by an execute wrapper on every
+connection. Queue wait is the time from sending an order to the ping that
+hands it to a printer.
+
+Clients and server share one process and event loop, so absolute numbers are
+pessimistic; they are meant for comparing commits on the same machine.
+"""
+
+import asyncio
+import contextvars
+import importlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+from .catalog import catalog
+from .dispatch import dispatcher
+from .events import TERMINAL_STATUSES, order_events
+from .fleet import fleet
+from .heartbeat import heartbeats
+from .progress import job_progress
+
+ENDPOINTS = (
+    "printer_ping",
+    "printer_ping_batch",
+    "job_complete",
+    "create_order",
+    "order_status",
+)
+
+# Process state that would otherwise carry over from one run to the next
+IN_MEMORY = (heartbeats, fleet, dispatcher, order_events, job_progress)
+
+_endpoint = contextvars.ContextVar("benchmark_endpoint", default=None)
+
+
+def mock_module(name: str):
+    """A module of the printer mock, which lives next to the project."""
+    path = str(settings.BASE_DIR.parent / "printer-mock")
+    if path not in sys.path:
+        sys.path.append(path)
+    return importlib.import_module(name)
+
+
+def reset_state() -> None:
+    for store in IN_MEMORY:
+        store.reset()
+    catalog.invalidate()
+
+
+@contextmanager
+def scratch_database():
+    """Run on a freshly migrated database instead of the configured one."""
+    with tempfile.TemporaryDirectory() as tmp:
+        if connection.vendor == "sqlite":
+            # Threads share it, so not the usual in-memory test database
+            test = connection.settings_dict.setdefault("TEST", {})
+            test["NAME"] = os.path.join(tmp, "scratch.sqlite3")
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            reset_state()
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            reset_state()
+
+
+def endpoint_name(path: str) -> str | None:
+    try:
+        return resolve(path.split("?", 1)[0]).url_name
+    except Resolver404:
+        return None
+
+
+def percentiles(values: list[float], scale: float = 1.0) -> dict:
+    """p50/p95/p99 (nearest rank) and mean of ``values``, times ``scale``."""
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    result = {
+        f"p{p}": values[min(len(values) - 1, len(values) * p // 100)] * scale
+        for p in (50, 95, 99)
+    }
+    result["mean"] = sum(values) / len(values) * scale
+    return result
+
+
+class QueryCounter:
+    """Requests served and queries they ran, per endpoint, while ``enabled``.
+
+    A request counts if it arrives while enabled, and then so do all of its
+    queries, including those it runs on a thread (``sync_to_async``): the
+    endpoint is a context variable, and those threads run in a copy of the
+    request's context.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.requests = Counter()
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        name = _endpoint.get()
+        if name is not None:
+            with self._lock:
+                self.queries[name] += 1
+        return execute(sql, params, many, context)
+
+    def _connected(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self) -> None:
+        connection_created.connect(self._connected)
+        for connection in connections.all(initialized_only=True):
+            self._connected(None, connection)
+
+    def uninstall(self) -> None:
+        connection_created.disconnect(self._connected)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def wrap(self, application):
+        """``application`` with each HTTP request tagged with its endpoint."""
+
+        async def counted(scope, receive, send):
+            name = None
+            if scope["type"] == "http" and self.enabled:
+                name = endpoint_name(scope["path"])
+            if name is not None:
+                with self._lock:
+                    self.requests[name] += 1
+            token = _endpoint.set(name)
+            try:
+                return await application(scope, receive, send)
+            finally:
+                _endpoint.reset(token)
+
+        return counted
+
+    def per_request(self, name: str) -> float | None:
+        requests = self.requests[name]
+        return self.queries[name] / requests if requests else None
+
+
+def endpoint_stats(base):
+    """A subclass of the mock's ``Stats`` that keeps what a run reports."""
+
+    class EndpointStats(base):
+        def __init__(self):
+            super().__init__()
+            self.measuring = False
+            self.latencies = defaultdict(list)
+            self.errors = Counter()
+            self.created: dict[int, float] = {}
+            self.started: dict[int, float] = {}
+            self.completed = 0
+
+        def request(self, seconds: float, ok: bool, path: str = "") -> None:
+            super().request(seconds, ok, path)
+            if self.measuring:
+                name = endpoint_name(path)
+                self.latencies[name].append(seconds)
+                if not ok:
+                    self.errors[name] += 1
+
+        def order_created(self, order_id: int, at: float) -> None:
+            if self.measuring:
+                self.created[order_id] = at
+
+        def job_started(self, job_id: int) -> None:
+            super().job_started(job_id)
+            # Also outside the window: an order may be sent just before it ends
+            self.started[job_id] = time.monotonic()
+
+        def job_completed(self, job_id: int) -> None:
+            super().job_completed(job_id)
+            if self.measuring:
+                self.completed += 1
+
+        def queue_waits(self) -> list[float]:
+            return [
+                self.started[i] - at
+                for i, at in self.created.items()
+                if i in self.started
+            ]
+
+    return EndpointStats
+
+
+async def _serve(application):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(
+            application,
+            host="127.0.0.1",
+            port=0,
+            lifespan="off",
+            access_log=False,
+            log_level="warning",
+        )
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+            raise RuntimeError("uvicorn exited before starting")
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def _order(pool, stats, items, poll: float, stop: asyncio.Event) -> None:
+    sent = time.monotonic()
+    try:
+        status, body = await pool.request("POST", "/api/orders", {"items": items})
+        if status != 201:
+            return
+        stats.order_created(body["order_id"], sent)
+        path = f"/api/orders/{body['order_id']}"
+        while True:
+            try:
+                await asyncio.wait_for(stop.wait(), poll)
+                return
+            except asyncio.TimeoutError:
+                pass
+            status, body = await pool.request("GET", path)
+            if status == 200 and body.get("status") in TERMINAL_STATUSES:
+                return
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        pass
+
+
+async def _inject(pool, stats, rate, printable_ids, poll, rng, stop) -> None:
+    """Send ``rate`` orders per minute, evenly spaced, until ``stop``."""
+    loop = asyncio.get_running_loop()
+    orders = set()
+    due = loop.time()
+    while not stop.is_set():
+        items = [{"printable_id": rng.choice(printable_ids), "qty": 1}]
+        task = asyncio.create_task(_order(pool, stats, items, poll, stop))
+        orders.add(task)
+        task.add_done_callback(orders.discard)
+        due += 60.0 / rate
+        try:
+            await asyncio.wait_for(stop.wait(), max(0.0, due - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+    await asyncio.gather(*orders, return_exceptions=True)
+
+
+async def run(
+    config,
+    order_rate: float,
+    printable_ids: list[int],
+    duration: float = 60.0,
+    warmup: float = 10.0,
+    status_interval: float = 2.0,
+) -> dict:
+    """Run the fleet of ``config`` (a mock ``FleetConfig``) against the API.
+
+    Orders for random ``printable_ids`` are sent at ``order_rate`` per minute
+    from the start; only the last ``duration`` seconds, after ``warmup``, are
+    measured. Needs the ``asgi`` extra (uvicorn).
+    """
+    mock = mock_module("fleet")
+    counter = QueryCounter()
+    application = import_string(
+        getattr(settings, "ASGI_APPLICATION", "api.asgi.application")
+    )
+    # On the thread sync code runs on, which may be connected already
+    await sync_to_async(counter.install)()
+    server, serving, api_base = await _serve(counter.wrap(application))
+
+    stats = endpoint_stats(mock.Stats)()
+    rng = random.Random(config.seed)
+    printer_pool = mock.ConnectionPool(
+        api_base, config.connections, config.timeout, stats
+    )
+    customer_pool = mock.ConnectionPool(
+        api_base, config.connections, config.timeout, stats
+    )
+    printers = [
+        mock.VirtualPrinter(
+            name, None, printer_pool, stats, config, random.Random(rng.random())
+        )
+        for name in mock.printer_names(config.printers, config.seed)
+    ]
+    stop = asyncio.Event()
+    tasks = mock.start(printers, config, rng, stop)
+    tasks.append(
+        asyncio.create_task(
+            _inject(
+                customer_pool,
+                stats,
+                order_rate,
+                printable_ids,
+                status_interval,
+                random.Random(rng.random()),
+                stop,
+            )
+        )
+    )
+    try:
+        await asyncio.sleep(warmup)
+        stats.measuring = counter.enabled = True
+        started, pings = time.monotonic(), stats.total["pings"]
+        await asyncio.sleep(duration)
+        stats.measuring = counter.enabled = False
+        elapsed = time.monotonic() - started
+        pings = stats.total["pings"] - pings
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        printer_pool.close()
+        customer_pool.close()
+        server.should_exit = True
+        await serving
+        await sync_to_async(counter.uninstall)()
+        # That thread keeps its connection otherwise
+        await sync_to_async(connections.close_all)()
+
+    endpoints = {}
+    for name in ENDPOINTS:
+        latencies = stats.latencies.get(name, [])
+        ms = percentiles(latencies, 1000)
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": stats.errors[name],
+            "per_second": len(latencies) / elapsed,
+            "p50_ms": ms["p50"],
+            "p95_ms": ms["p95"],
+            "p99_ms": ms["p99"],
+            "queries_per_request": counter.per_request(name),
+        }
+    waits = stats.queue_waits()
+    wait = percentiles(waits)
+    return {
+        "printers": config.printers,
+        "gateway": config.gateway,
+        "order_rate": order_rate,
+        "seconds": elapsed,
+        "pings_per_second": pings / elapsed,
+        "endpoints": endpoints,
+        "queue_wait": {
+            "orders": len(waits),
+            "not_started": len(stats.created) - len(waits),
+            "p50_s": wait["p50"],
+            "p95_s": wait["p95"],
+            "p99_s": wait["p99"],
+            "mean_s": wait["mean"],
+        },
+        "orders_created": len(stats.created),
+        "jobs_completed": stats.completed,
+        "jobs_per_minute": stats.completed * 60 / elapsed,
+    }
+
+
+async def run_bulk(
+    orders_per_request: int, requests: int, printable_ids: list[int], seed=None
+) -> dict:
+    """Send ``requests`` POST /api/orders/bulk of ``orders_per_request`` each.
+
+    One request at a time, so ``orders_per_second`` is what a single client
+    gets out of the endpoint. Needs the ``asgi`` extra (uvicorn).
+    """
+    mock = mock_module("fleet")
+    counter = QueryCounter()
+    application = import_string(
+        getattr(settings, "ASGI_APPLICATION", "api.asgi.application")
+    )
+    await sync_to_async(counter.install)()
+    server, serving, api_base = await _serve(counter.wrap(application))
+    pool = mock.ConnectionPool(api_base, size=1, timeout=120.0)
+    rng = random.Random(seed)
+    latencies = []
+    created = errors = 0
+    counter.enabled = True
+    try:
+        for _ in range(requests):
+            orders = [
+                {"items": [{"printable_id": rng.choice(printable_ids), "qty": 1}]}
+                for _ in range(orders_per_request)
+            ]
+            started = time.monotonic()
+            status, body = await pool.request(
+                "POST", "/api/orders/bulk", {"orders": orders}
+            )
+            latencies.append(time.monotonic() - started)
+            if status == 201:
+                created += sum("order_id" in o for o in body["orders"])
+            else:
+                errors += 1
+    finally:
+        counter.enabled = False
+        pool.close()
+        server.should_exit = True
+        await serving
+        await sync_to_async(counter.uninstall)()
+        await sync_to_async(connections.close_all)()
+
+    ms = percentiles(latencies, 1000)
+    return {
+        "orders_per_request": orders_per_request,
+        "requests": requests,
+        "errors": errors,
+        "orders_created": created,
+        "orders_per_second": created / sum(latencies),
+        "p50_ms": ms["p50"],
+        "p95_ms": ms["p95"],
+        "p99_ms": ms["p99"],
+        "queries_per_request": counter.per_request("create_orders_bulk"),
+    }
@@ -0,0 +1,100 @@
+"""Process-local cache of the printables catalog.
+
+Printables change rarely compared to how often they are read, so derived
+data (the id set used by order intake and the serialized catalog
+responses) is kept in memory. When a ``Printable`` is saved or deleted (see
+:mod:`core.signals`) the responses are dropped, but the id set is updated
+in place, so order intake doesn't reload every id after each upload.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+
+
+class Catalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._ids: frozenset[int] | None = None
+        self._responses: OrderedDict[Hashable, CachedResponse] = OrderedDict()
+
+    def printable_ids(self) -> frozenset[int]:
+        from .models import Printable
+
+        ids = self._ids
+        if ids is None:
+            generation = self._generation
+            ids = frozenset(
+                Printable.objects.filter(status="ready").values_list("id", flat=True)
+            )
+            with self._lock:
+                if generation == self._generation:
+                    self._ids = ids
+        return ids
+
+    def response(
+        self, key: Hashable, build: Callable[[], object | None]
+    ) -> CachedResponse | None:
+        """Return the serialized JSON for ``key``, building it on a miss.
+
+        ``build`` returns the data to serialize, or ``None`` if there is
+        nothing to serve (which is not cached).
+        """
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+                return cached
+            generation = self._generation
+
+        data = build()
+        if data is None:
+            return None
+        body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+        cached = CachedResponse(
+            body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        )
+
+        max_entries = getattr(settings, "CATALOG_CACHE_MAX_ENTRIES", 1024)
+        with self._lock:
+            # Don't store data read before a concurrent invalidation
+            if generation == self._generation:
+                self._responses[key] = cached
+                while len(self._responses) > max_entries:
+                    self._responses.popitem(last=False)
+        return cached
+
+    def changed(self, printable_id: int, orderable: bool) -> None:
+        """Printable ``printable_id`` was saved or deleted."""
+        with self._lock:
+            self._generation += 1
+            self._responses.clear()
+            ids = self._ids
+            if ids is not None and (printable_id in ids) != orderable:
+                # A new set rather than a mutation: callers may be reading it
+                if orderable:
+                    self._ids = ids | {printable_id}
+                else:
+                    self._ids = ids - {printable_id}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._ids = None
+            self._responses.clear()
+
+
+catalog = Catalog()
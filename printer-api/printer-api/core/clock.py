@@ -0,0 +1,75 @@
+"""The time as the API sees it.
+
+Code that timestamps or schedules reads ``clock.now()`` and
+``clock.monotonic()`` rather than the system clock, so that a simulation can
+run the app on virtual time (see ``core.simulation``) with ``clock.use()``.
+
+A ``VirtualClock`` only moves when told to. It also has the ``time()`` and
+``sleep()`` of the printer mock's clock, so the mock and the API can share
+one.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+
+class SystemClock:
+    def now(self) -> datetime:
+        return timezone.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock:
+    def __init__(self, start: datetime):
+        self._lock = threading.Lock()
+        self._now = start
+        # Carries on from the system clock, so timers set before the switch
+        # don't see time go backwards
+        self._base = time.monotonic() - start.timestamp()
+
+    def now(self) -> datetime:
+        with self._lock:
+            return self._now
+
+    def time(self) -> float:
+        return self.now().timestamp()
+
+    def monotonic(self) -> float:
+        return self._base + self.time()
+
+    def advance_to(self, at: datetime) -> None:
+        with self._lock:
+            if at > self._now:
+                self._now = at
+
+    def sleep(self, seconds: float) -> None:
+        with self._lock:
+            self._now += timedelta(seconds=max(0.0, seconds))
+
+
+class Clock:
+    def __init__(self):
+        self.source = SystemClock()
+
+    def now(self) -> datetime:
+        return self.source.now()
+
+    def monotonic(self) -> float:
+        return self.source.monotonic()
+
+    @contextmanager
+    def use(self, source):
+        previous, self.source = self.source, source
+        try:
+            yield source
+        finally:
+            self.source = previous
+
+
+clock = Clock()
@@ -0,0 +1,89 @@
+"""Pre-compressed variants of stored files, chosen by ``Accept-Encoding``.
+
+Variants live next to the original (``stl/cube.stl.gz``, ``.zst``) and are
+written once, when a printable is saved or on the first request that finds
+them missing or older than the original. zstd is used only when the
+optional ``zstandard`` package is installed.
+"""
+
+import gzip
+import os
+import shutil
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+from .derived import is_fresh, write_atomic
+
+
+def _gzip(src, dst):
+    with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=9, mtime=0) as gz:
+        shutil.copyfileobj(src, gz)
+
+
+def _zstd(src, dst):
+    zstandard.ZstdCompressor(level=19).copy_stream(src, dst)
+
+
+# Content-Encoding -> (file suffix, compressor), in order of preference
+ENCODINGS = {"gzip": (".gz", _gzip)}
+if zstandard is not None:
+    ENCODINGS = {"zstd": (".zst", _zstd), **ENCODINGS}
+
+
+def variant_path(path: str, encoding: str) -> str:
+    return path + ENCODINGS[encoding][0]
+
+
+def ensure_variant(path: str, encoding: str) -> str:
+    """Return the ``encoding`` variant of ``path``, (re)building it if stale."""
+    target = variant_path(path, encoding)
+    if not is_fresh(target, path):
+        write_atomic(target, lambda tmp: _compress(path, tmp, encoding))
+    return target
+
+
+def _compress(path: str, tmp: str, encoding: str) -> None:
+    with open(path, "rb") as src, open(tmp, "wb") as dst:
+        ENCODINGS[encoding][1](src, dst)
+
+
+def build_variants(path: str) -> None:
+    for encoding in ENCODINGS:
+        ensure_variant(path, encoding)
+
+
+def accepted_encodings(header: str) -> list[str]:
+    """Encodings we can serve, best first, per an ``Accept-Encoding`` value."""
+    weights = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+    default = weights.get("*", 0.0)
+    preference = list(ENCODINGS)
+    candidates = [enc for enc in preference if weights.get(enc, default) > 0]
+    # Stable sort: ties keep our own order of preference
+    return sorted(candidates, key=lambda enc: -weights.get(enc, default))
+
+
+def negotiate(path: str, header: str) -> tuple[str, str | None]:
+    """Pick the best acceptable variant that is smaller than ``path``.
+
+    Returns ``(path_to_serve, content_encoding)``; the encoding is ``None``
+    when the original should be sent as is.
+    """
+    size = os.stat(path).st_size
+    for encoding in accepted_encodings(header):
+        variant = ensure_variant(path, encoding)
+        if os.stat(variant).st_size < size:
+            return variant, encoding
+    return path, None
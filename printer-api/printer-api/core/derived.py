@@ -0,0 +1,33 @@
+"""Files derived from a stored upload and kept next to it.
+
+A derived file is rebuilt whenever it is missing or older than its source,
+and always written to a temp file that is then renamed into place, so
+readers never see a partial one.
+"""
+
+import os
+import tempfile
+from collections.abc import Callable
+
+from django.conf import settings
+
+
+def is_fresh(target: str, source: str) -> bool:
+    try:
+        return os.stat(target).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def write_atomic(target: str, write: Callable[[str], None]) -> None:
+    """Call ``write`` with a temp path, then move the result to ``target``."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        # mkstemp creates the file 0600; match what regular uploads get
+        os.chmod(tmp, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
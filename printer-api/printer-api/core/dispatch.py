@@ -0,0 +1,170 @@
+"""Job dispatcher owning the queue of queued orders.
+
+Queued orders are kept in a heap ordered by ``(created_at, id)``, so handing
+the oldest job to an idle printer costs O(log n) and an empty queue is
+answered from memory without opening a transaction. A job is claimed with a
+single conditional ``UPDATE ... WHERE status = 'queued'`` instead of
+``select_for_update``; a claim that matches no row (the order was changed
+elsewhere) just moves on to the next entry.
+
+The heap is rebuilt from the database on first use and merged with it every
+``DISPATCH_RESYNC_INTERVAL`` seconds, which picks up orders that were queued
+without going through this process.
+"""
+
+import heapq
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from .clock import clock
+
+
+class Dispatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: list[tuple[datetime, int]] = []
+        self._queued: set[int] = set()
+        self._synced_at: float | None = None
+
+    @staticmethod
+    def resync_interval() -> float:
+        return float(getattr(settings, "DISPATCH_RESYNC_INTERVAL", 30.0))
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def push(self, order_id: int, created_at: datetime) -> None:
+        with self._lock:
+            if order_id not in self._queued:
+                self._queued.add(order_id)
+                heapq.heappush(self._heap, (created_at, order_id))
+
+    def discard(self, order_id: int) -> None:
+        # The heap entry stays behind and is skipped when it reaches the head
+        with self._lock:
+            self._queued.discard(order_id)
+
+    def sync(self) -> None:
+        from .models import Order
+
+        rows = (
+            Order.objects.filter(status="queued")
+            .order_by("created_at")
+            .values_list("created_at", "id")
+        )
+        for created_at, order_id in rows:
+            self.push(order_id, created_at)
+        self._synced_at = clock.monotonic()
+
+    def needs_sync(self) -> bool:
+        return (
+            self._synced_at is None
+            or clock.monotonic() - self._synced_at >= self.resync_interval()
+        )
+
+    def _maybe_sync(self) -> None:
+        if self.needs_sync():
+            self.sync()
+
+    def _pop(self) -> tuple[datetime, int] | None:
+        with self._lock:
+            while self._heap:
+                created_at, order_id = heapq.heappop(self._heap)
+                if order_id in self._queued:
+                    self._queued.discard(order_id)
+                    return created_at, order_id
+        return None
+
+    def claim(self, printer_id: int):
+        """Assign the oldest queued order to ``printer_id``.
+
+        Returns the claimed ``Order`` (already marked printing), or ``None``
+        when there is nothing to do.
+        """
+        from .models import Order
+
+        self._maybe_sync()
+        while True:
+            entry = self._pop()
+            if entry is None:
+                return None
+            created_at, order_id = entry
+            try:
+                claimed = Order.objects.filter(pk=order_id, status="queued").update(
+                    status="printing",
+                    assigned_printer_id=printer_id,
+                    updated_at=clock.now(),
+                )
+            except Exception:
+                self.push(order_id, created_at)
+                raise
+            if claimed:
+                return Order.objects.get(pk=order_id)
+
+    def claim_many(self, printer_ids: list[int]) -> dict:
+        """Like ``claim`` for several printers; returns their orders by printer.
+
+        Each round reads the oldest queued orders, hands them out in order
+        with a single conditional ``UPDATE`` and goes again for the printers
+        left over, if the queue had orders that were no longer queued.
+        """
+        from .models import Order
+
+        self._maybe_sync()
+        claims = {}
+        waiting = list(printer_ids)
+        while waiting:
+            entries = []
+            while len(entries) < len(waiting) and (entry := self._pop()):
+                entries.append(entry)
+            if not entries:
+                break
+            queued = Order.objects.in_bulk([order_id for _, order_id in entries])
+            orders = [
+                queued[order_id]
+                for _, order_id in entries
+                if order_id in queued and queued[order_id].status == "queued"
+            ]
+            printer_for = {o.id: p for o, p in zip(orders, waiting)}
+            if not printer_for:
+                continue
+            now = clock.now()
+            assigned = Case(
+                *(When(pk=o, then=Value(p)) for o, p in printer_for.items()),
+                output_field=IntegerField(),
+            )
+            try:
+                claimed = Order.objects.filter(
+                    pk__in=printer_for, status="queued"
+                ).update(
+                    status="printing", assigned_printer_id=assigned, updated_at=now
+                )
+            except Exception:
+                for created_at, order_id in entries:
+                    self.push(order_id, created_at)
+                raise
+            if claimed == len(printer_for):
+                for order in orders:
+                    order.status = "printing"
+                    order.assigned_printer_id = printer_for[order.id]
+                    order.updated_at = now
+            else:
+                # Some were claimed in the meantime: read back which we got
+                orders = Order.objects.filter(pk__in=printer_for, updated_at=now)
+            for order in orders:
+                if order.assigned_printer_id == printer_for.get(order.id):
+                    claims[order.assigned_printer_id] = order
+            waiting = [p for p in waiting if p not in claims]
+        return claims
+
+    def reset(self) -> None:
+        with self._lock:
+            self._heap = []
+            self._queued = set()
+        self._synced_at = None
+
+
+dispatcher = Dispatcher()
@@ -0,0 +1,192 @@
+"""Serving stored files: content-hash ETags, byte ranges and proxy offload.
+
+``serve_file`` answers conditional requests (``If-None-Match`` /
+``If-Modified-Since``) with 304, single byte ranges with 206, and can hand
+the transfer to a front proxy via ``X-Sendfile`` or ``X-Accel-Redirect``
+(``SENDFILE_BACKEND``) so large downloads don't occupy a worker. Under
+ASGI the body is an async iterator whose reads run on worker threads.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+from .storage import blob_digest
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 64 * 1024
+
+_etag_lock = threading.Lock()
+_etags: dict[str, tuple[int, int, str]] = {}
+
+
+def file_etag(path: str) -> str:
+    """Strong ETag from the file's content, recomputed only when it changes.
+
+    A content-addressed blob is named by its SHA-256, which is used as is.
+    """
+    digest = blob_digest(path)
+    if digest:
+        return f'"{digest}"'
+    st = os.stat(path)
+    with _etag_lock:
+        cached = _etags.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    etag = f'"{digest.hexdigest()}"'
+    with _etag_lock:
+        _etags[path] = (st.st_mtime_ns, st.st_size, etag)
+    return etag
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single ``bytes=`` range into an inclusive ``(start, end)``.
+
+    Returns ``None`` for anything that isn't a single byte range (which is
+    served as a full response) and raises ``ValueError`` when the range is
+    unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def _iter_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def _aiter_range(path: str, start: int, length: int):
+    # Django's ASGI handler would drain a sync iterator into memory before
+    # sending the first byte; here each read runs on a worker thread instead
+    chunks = _iter_range(path, start, length)
+    read = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await read(chunks, None)) is not None:
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _range_applies(request, etag: str, last_modified: str) -> bool:
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return if_range == last_modified
+
+
+def _sendfile_response(path: str, name: str) -> HttpResponse | None:
+    # The proxy fills in the body, length and ranges
+    backend = getattr(settings, "SENDFILE_BACKEND", None)
+    if backend == "x-sendfile":
+        response = HttpResponse()
+        response["X-Sendfile"] = os.path.abspath(path)
+    elif backend == "x-accel-redirect":
+        prefix = getattr(settings, "SENDFILE_ACCEL_PREFIX", "/protected-media/")
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + name.lstrip("/")
+    else:
+        return None
+    return response
+
+
+def _file_response(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    if request.headers.get("Range") and _range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers["Range"], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    is_async = isinstance(request, ASGIRequest)
+    if byte_range is None and not is_async:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    elif byte_range is None:
+        response = StreamingHttpResponse(
+            _aiter_range(path, 0, size), content_type=content_type
+        )
+        response["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            (_aiter_range if is_async else _iter_range)(path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve_file(
+    request,
+    path: str,
+    name: str,
+    filename: str,
+    content_encoding: str | None = None,
+    as_attachment: bool = True,
+) -> HttpResponse:
+    """Serve ``path`` (stored as ``name`` under MEDIA_ROOT) as an attachment.
+
+    ``content_encoding`` marks ``path`` as a pre-compressed representation of
+    ``filename``; ETags and ranges then apply to the compressed bytes.
+    ``as_attachment=False`` serves it for display inline instead.
+    """
+    st = os.stat(path)
+    etag = file_etag(path)
+    last_modified = http_date(st.st_mtime)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(st.st_mtime)
+    )
+    if response is None:
+        response = _sendfile_response(path, name) or _file_response(
+            request, path, st.st_size, etag, last_modified, content_type
+        )
+        if response.status_code in (200, 206):
+            response["Content-Type"] = content_type
+            response["Content-Disposition"] = content_disposition_header(
+                as_attachment, filename
+            )
+            if content_encoding:
+                response["Content-Encoding"] = content_encoding
+    response["ETag"] = etag
+    response["Last-Modified"] = last_modified
+    return response
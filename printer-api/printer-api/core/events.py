@@ -0,0 +1,134 @@
+"""In-process event bus for order status changes.
+
+Watchers of an order (the ``?since=`` long poll and the server-sent event
+stream) wait on an asyncio future instead of polling the database, so an
+idle watcher costs a future and a set entry. Changes are published from
+whichever thread makes them; each waiter is woken on its own event loop.
+
+An order's version is its ``updated_at`` in microseconds. The latest event
+of each recently changed order is remembered, so a watcher that read the
+order just before a change still gets it. Like the fleet registry, the bus
+only sees changes made by this process.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+ORDER_FIELDS = ("id", "status", "assigned_printer_id", "updated_at")
+TERMINAL_STATUSES = frozenset({"complete", "failed"})
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def order_version(updated_at: datetime) -> int:
+    return (updated_at - _EPOCH) // timedelta(microseconds=1)
+
+
+@dataclass(frozen=True)
+class OrderEvent:
+    id: int
+    status: str
+    assigned_printer_id: int | None
+    version: int
+
+    @classmethod
+    def from_row(cls, row: dict) -> "OrderEvent":
+        """From ``Order.objects.values(*ORDER_FIELDS)``."""
+        return cls(
+            id=row["id"],
+            status=row["status"],
+            assigned_printer_id=row["assigned_printer_id"],
+            version=order_version(row["updated_at"]),
+        )
+
+    @classmethod
+    def from_order(cls, order) -> "OrderEvent":
+        return cls(
+            id=order.pk,
+            status=order.status,
+            assigned_printer_id=order.assigned_printer_id,
+            version=order_version(order.updated_at),
+        )
+
+    def data(self) -> dict:
+        return asdict(self)
+
+
+def _resolve(future: asyncio.Future, event: OrderEvent) -> None:
+    if not future.done():
+        future.set_result(event)
+
+
+class OrderEvents:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: OrderedDict[int, OrderEvent] = OrderedDict()
+        self._waiters: dict[int, set] = {}
+
+    @staticmethod
+    def max_tracked() -> int:
+        return int(getattr(settings, "ORDER_EVENTS_MAX_TRACKED", 10000))
+
+    def publish(self, event: OrderEvent) -> int:
+        """Wake the watchers of ``event.id``; returns how many there were.
+
+        Events no newer than one already published are dropped.
+        """
+        with self._lock:
+            latest = self._latest.get(event.id)
+            if latest is not None and latest.version >= event.version:
+                return 0
+            self._latest[event.id] = event
+            self._latest.move_to_end(event.id)
+            while len(self._latest) > self.max_tracked():
+                self._latest.popitem(last=False)
+            waiters = self._waiters.pop(event.id, ())
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, event)
+            except RuntimeError:
+                pass  # the watcher's loop is gone
+        return len(waiters)
+
+    async def wait(
+        self, order_id: int, since: int, timeout: float
+    ) -> OrderEvent | None:
+        """The first event of ``order_id`` newer than version ``since``.
+
+        Returns ``None`` if there is none within ``timeout`` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            latest = self._latest.get(order_id)
+            if latest is not None and latest.version > since:
+                return latest
+            self._waiters.setdefault(order_id, set()).add(waiter)
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(order_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[order_id]
+
+    def watchers(self) -> int:
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latest = OrderedDict()
+            self._waiters = {}
+
+
+order_events = OrderEvents()
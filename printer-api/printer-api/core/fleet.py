@@ -0,0 +1,209 @@
+"""Process-local registry of printer state.
+
+Holds what the ping path needs for every printer so a heartbeat can be
+answered without reading ``Printer`` rows. The database stays the durable
+store: state changes are written through immediately, heartbeats go through
+:mod:`core.heartbeat`. Entries are dropped whenever a ``Printer`` is saved or
+deleted through the ORM (e.g. from the admin) and reloaded on next use.
+
+The registry only knows about writes made by this process, so it assumes a
+single API process owns the printer protocol endpoints.
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import DatabaseError, connections
+
+from .heartbeat import heartbeats
+
+_FIELDS = ("id", "name", "status", "current_order_id", "last_ping_at")
+
+
+@dataclass
+class PrinterState:
+    id: int
+    name: str
+    status: str
+    current_order_id: int | None
+    last_ping_at: datetime | None
+
+
+class FleetRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._printers: dict[int, PrinterState] = {}
+        self._warm = False
+
+    def warm(self) -> int:
+        """Load every printer in one query; returns the number loaded."""
+        from .models import Printer
+
+        rows = list(Printer.objects.values(*_FIELDS))
+        with self._lock:
+            self._printers = {row["id"]: PrinterState(**row) for row in rows}
+            self._warm = True
+        return len(rows)
+
+    def get(self, printer_id: int) -> PrinterState | None:
+        from .models import Printer
+
+        if not self._warm:
+            self.warm()
+        with self._lock:
+            state = self._printers.get(printer_id)
+        if state is not None:
+            return state
+
+        # Invalidated, or created by someone else since the warm-up
+        row = Printer.objects.filter(pk=printer_id).values(*_FIELDS).first()
+        if row is None:
+            return None
+        state = PrinterState(**row)
+        with self._lock:
+            return self._printers.setdefault(printer_id, state)
+
+    def get_many(self, printer_ids) -> dict[int, PrinterState]:
+        """Like ``get`` for several printers, reading the missing ones in one query."""
+        from .models import Printer
+
+        if not self._warm:
+            self.warm()
+        with self._lock:
+            found = {i: self._printers[i] for i in printer_ids if i in self._printers}
+        missing = set(printer_ids) - found.keys()
+        if missing:
+            rows = Printer.objects.filter(pk__in=missing).values(*_FIELDS)
+            with self._lock:
+                for row in rows:
+                    found[row["id"]] = self._printers.setdefault(
+                        row["id"], PrinterState(**row)
+                    )
+        return found
+
+    def cached(self, printer_id: int) -> PrinterState | None:
+        """The registry's entry for ``printer_id``, never read from the database."""
+        with self._lock:
+            return self._printers.get(printer_id)
+
+    def create(self, name: str, status: str, last_ping_at: datetime) -> PrinterState:
+        from .models import Printer
+
+        printer = Printer.objects.create(
+            name=name, status=status, last_ping_at=last_ping_at
+        )
+        state = PrinterState(
+            id=printer.id,
+            name=printer.name,
+            status=printer.status,
+            current_order_id=None,
+            last_ping_at=printer.last_ping_at,
+        )
+        with self._lock:
+            self._printers[state.id] = state
+        return state
+
+    def create_many(
+        self, printers: list[tuple[str, str]], last_ping_at: datetime
+    ) -> list[PrinterState]:
+        """Register ``(name, status)`` printers with one INSERT."""
+        from .models import Printer
+
+        rows = Printer.objects.bulk_create(
+            Printer(name=name, status=status, last_ping_at=last_ping_at)
+            for name, status in printers
+        )
+        states = [
+            PrinterState(
+                id=row.id,
+                name=row.name,
+                status=row.status,
+                current_order_id=None,
+                last_ping_at=row.last_ping_at,
+            )
+            for row in rows
+        ]
+        with self._lock:
+            for state in states:
+                self._printers[state.id] = state
+        return states
+
+    def update(self, state: PrinterState, **changes) -> None:
+        """Write ``changes`` through to the database, then to the registry."""
+        from .models import Printer
+
+        Printer.objects.filter(pk=state.id).update(**changes)
+        with self._lock:
+            for field, value in changes.items():
+                setattr(state, field, value)
+
+    def update_many(self, changes: list[tuple[PrinterState, dict]]) -> None:
+        """Like ``update`` for several printers, with one ``bulk_update``."""
+        from .models import Printer
+
+        fields = sorted({field for _, c in changes for field in c})
+        if not fields:
+            return
+        Printer.objects.bulk_update(
+            [
+                Printer(pk=state.id, **{f: c.get(f, getattr(state, f)) for f in fields})
+                for state, c in changes
+            ],
+            fields,
+        )
+        with self._lock:
+            for state, c in changes:
+                for field, value in c.items():
+                    setattr(state, field, value)
+
+    def heartbeat(self, state: PrinterState, at: datetime) -> None:
+        state.last_ping_at = at
+        heartbeats.record(state.id, at)
+
+    def heartbeat_nowait(self, state: PrinterState, at: datetime) -> bool:
+        """Like ``heartbeat``, but returns whether a flush is due instead."""
+        state.last_ping_at = at
+        return heartbeats.buffer(state.id, at)
+
+    def invalidate(self, printer_id: int) -> None:
+        with self._lock:
+            self._printers.pop(printer_id, None)
+
+    def invalidate_order(self, order_id: int) -> None:
+        """Drop the printers working on ``order_id``, e.g. when it's deleted.
+
+        Deleting an order clears ``Printer.current_order`` in the database
+        (``SET_NULL``) without saving the printer, so no signal says so.
+        """
+        with self._lock:
+            for state in list(self._printers.values()):
+                if state.current_order_id == order_id:
+                    del self._printers[state.id]
+
+    def __len__(self) -> int:
+        return len(self._printers)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._printers = {}
+            self._warm = False
+
+
+fleet = FleetRegistry()
+
+
+def warm_on_startup() -> None:
+    """Pre-load the registry so the first ping wave after a deploy is warm.
+
+    Called from the ASGI lifespan startup, never at import: management
+    commands and tests load the application too. Without it (e.g. under
+    WSGI) the registry warms itself on first use.
+    """
+    try:
+        fleet.warm()
+    except DatabaseError:
+        # Not migrated yet; the registry warms itself on first use instead
+        fleet.reset()
+    finally:
+        connections.close_all()
@@ -0,0 +1,150 @@
+"""Write-coalescing buffer for printer heartbeats.
+
+A ping only has to move ``Printer.last_ping_at`` forward, so instead of a
+``save()`` per ping the latest timestamp per printer is kept in memory and
+written in one batched UPDATE every ``HEARTBEAT_FLUSH_INTERVAL`` seconds.
+Flushing piggybacks on the ping path: the ping that finds the interval
+elapsed writes everything collected since the previous flush. A server also
+runs ``start()``, which flushes from a thread when no ping comes along to do
+it, and once more when the process exits.
+"""
+
+import atexit
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+from .clock import clock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FlushStats:
+    pings: int
+    rows_written: int
+
+    @property
+    def writes_avoided(self) -> int:
+        return self.pings - self.rows_written
+
+
+class HeartbeatBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[int, datetime] = {}
+        self._pings = 0
+        self._last_flush = clock.monotonic()
+        self.last_stats: FlushStats | None = None
+        self.total_writes_avoided = 0
+        self._stopped = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+    @staticmethod
+    def interval() -> float:
+        return float(getattr(settings, "HEARTBEAT_FLUSH_INTERVAL", 5.0))
+
+    def record(self, printer_id: int, at: datetime) -> FlushStats | None:
+        """Buffer a heartbeat; flushes (and returns the stats) when due."""
+        return self.flush() if self.buffer(printer_id, at) else None
+
+    def buffer(self, printer_id: int, at: datetime) -> bool:
+        """Buffer a heartbeat without flushing; returns whether a flush is due.
+
+        For callers that mustn't block on the database, such as async views.
+        """
+        with self._lock:
+            previous = self._pending.get(printer_id)
+            if previous is None or at > previous:
+                self._pending[printer_id] = at
+            self._pings += 1
+            return clock.monotonic() - self._last_flush >= self.interval()
+
+    def pending(self, printer_id: int) -> datetime | None:
+        with self._lock:
+            return self._pending.get(printer_id)
+
+    def flush(self) -> FlushStats | None:
+        """Write what is buffered; returns ``None`` if the write failed.
+
+        On failure the heartbeats go back into the buffer for the next flush,
+        so the ping that triggered it still gets its answer.
+        """
+        from .models import Printer
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            pings, self._pings = self._pings, 0
+            self._last_flush = clock.monotonic()
+
+        if pending:
+            rows = [Printer(pk=pk, last_ping_at=at) for pk, at in pending.items()]
+            try:
+                with transaction.atomic():
+                    Printer.objects.bulk_update(rows, ["last_ping_at"], batch_size=500)
+            except DatabaseError as e:
+                logger.warning("Heartbeat flush failed: %s", e)
+                with self._lock:
+                    for pk, at in pending.items():
+                        newer = self._pending.get(pk)
+                        if newer is None or at > newer:
+                            self._pending[pk] = at
+                    self._pings += pings
+                return None
+
+        stats = FlushStats(pings=pings, rows_written=len(pending))
+        self.last_stats = stats
+        self.total_writes_avoided += stats.writes_avoided
+        return stats
+
+    def due(self) -> bool:
+        with self._lock:
+            return bool(self._pending) and (
+                clock.monotonic() - self._last_flush >= self.interval()
+            )
+
+    def start(self) -> None:
+        """Flush from a background thread whenever a flush is due."""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._stopped.clear()
+            self._flusher = threading.Thread(
+                target=self._run, name="heartbeat-flush", daemon=True
+            )
+        self._flusher.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stop the background thread and write what is still buffered."""
+        with self._lock:
+            flusher, self._flusher = self._flusher, None
+        if flusher is None:
+            return
+        self._stopped.set()
+        flusher.join()
+        atexit.unregister(self.stop)
+        self.flush()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self.interval() / 2):
+                if self.due():
+                    self.flush()
+        finally:
+            connections.close_all()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pending = {}
+            self._pings = 0
+            self._last_flush = clock.monotonic()
+        self.last_stats = None
+        self.total_writes_avoided = 0
+
+
+heartbeats = HeartbeatBuffer()
@@ -0,0 +1,153 @@
+"""Derived data built when a printable's STL is stored.
+
+``process_printable`` runs when a ``Printable`` is saved with a new STL
+(see :mod:`core.signals`); a color change only re-renders the thumbnail.
+Every step is idempotent and skips work whose output is already up to
+date, so re-running it is cheap. Derived files are
+keyed by the stored blob (see :mod:`core.storage`), so printables sharing a
+mesh share them too.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from .catalog import catalog
+from .compression import build_variants
+from .derived import write_atomic
+from .lod import build_lods
+from .mesh import ensure_mesh
+from .stl import analyze, binary_triangle_count, transcode_ascii
+from .storage import blob_digest, content_digest, original_path, release
+from .thumbnails import ensure_thumbnail
+
+GEOMETRY_FIELDS = [
+    "triangle_count",
+    "size_x",
+    "size_y",
+    "size_z",
+    "surface_area",
+    "volume",
+]
+
+
+def geometry_fields(geometry) -> dict:
+    size = geometry.size or (None, None, None)
+    return {
+        "triangle_count": geometry.triangle_count,
+        "size_x": size[0],
+        "size_y": size[1],
+        "size_z": size[2],
+        "surface_area": geometry.surface_area,
+        "volume": geometry.volume,
+    }
+
+
+def build_derived(path: str, triangle_count: int | None) -> None:
+    """LODs, compact meshes and compressed variants of a stored STL."""
+    for derived in [path, *build_lods(path, triangle_count)]:
+        build_variants(derived)
+        build_variants(ensure_mesh(derived))
+
+
+def _repoint(printable, name: str) -> None:
+    from .models import Printable
+
+    old = printable.stl.name
+    if name == old:
+        return
+    # update() rather than save(): no signals, so no re-entry into the pipeline
+    Printable.objects.filter(pk=printable.pk).update(stl=name)
+    printable.stl.name = name
+    storage = printable.stl.storage
+    transaction.on_commit(lambda: release(old, storage))
+
+
+def adopt_stl(printable) -> bool:
+    """Move an STL stored under its upload name into the content store."""
+    if blob_digest(printable.stl.name) is not None:
+        return False
+    storage = printable.stl.storage
+    with storage.open(printable.stl.name, "rb") as f:
+        name = storage.save(printable.stl.name, f)
+    _repoint(printable, name)
+    return True
+
+
+def transcode_stl(printable, keep_original: bool) -> bool:
+    """Store the binary form of an ASCII STL and point the printable at it."""
+    path = printable.stl.path
+    if binary_triangle_count(path) is not None:
+        return False
+    storage = printable.stl.storage
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        transcode_ascii(path, tmp)
+        with open(tmp, "rb") as f:
+            name = storage.save(printable.stl.name, File(f))
+    finally:
+        os.unlink(tmp)
+    if keep_original:
+        kept = original_path(storage.path(name))
+        os.makedirs(os.path.dirname(kept), exist_ok=True)
+        write_atomic(kept, lambda dst: shutil.copyfile(path, dst))
+    _repoint(printable, name)
+    return True
+
+
+def update_geometry(printable) -> None:
+    from .models import Printable
+
+    fields = None
+    if blob_digest(printable.stl.name):
+        # Same blob, same mesh: reuse what another printable already measured
+        fields = (
+            Printable.objects.filter(
+                stl=printable.stl.name, triangle_count__isnull=False
+            )
+            .exclude(pk=printable.pk)
+            .values(*GEOMETRY_FIELDS)
+            .first()
+        )
+    if fields is None:
+        fields = geometry_fields(analyze(printable.stl.path))
+    Printable.objects.filter(pk=printable.pk).update(**fields)
+    for field, value in fields.items():
+        setattr(printable, field, value)
+
+
+def process_printable(
+    printable, stl_changed: bool = True, transcode: bool | None = None
+) -> None:
+    if not printable.stl:
+        return
+    adopt_stl(printable)
+    if transcode is None:
+        transcode = getattr(settings, "STL_TRANSCODE_ASCII", True)
+    if transcode and transcode_stl(
+        printable, keep_original=getattr(settings, "STL_KEEP_ORIGINAL", False)
+    ):
+        stl_changed = True
+    if stl_changed or printable.triangle_count is None:
+        update_geometry(printable)
+    build_derived(printable.stl.path, printable.triangle_count)
+    refresh_thumbnail(printable)
+
+
+def refresh_thumbnail(printable) -> None:
+    """Render the default-size thumbnail for the printable's current color."""
+    if not printable.stl:
+        return
+    path = printable.stl.path
+    ensure_thumbnail(
+        path,
+        content_digest(printable.stl.name, path),
+        printable.color,
+        triangle_count=printable.triangle_count,
+    )
+    catalog.changed(printable.pk, printable.status == "ready")
@@ -0,0 +1,75 @@
+"""Decimated preview meshes of stored STL files, served by ``?lod=``.
+
+Each level in ``STL_LOD_LEVELS`` maps a name to a triangle budget. Its mesh
+lives next to the original (``stl/cube.stl.lod-5k.stl``) and is written when
+a printable is saved, or on the first request that finds it missing or
+older than the original. Meshes already within a level's budget have no
+file of their own; the level is then served by the original.
+"""
+
+from django.conf import settings
+
+from .derived import is_fresh, write_atomic
+from .stl import decimate, read_triangles, write_binary
+
+DEFAULT_LEVELS = {"5k": 5_000, "50k": 50_000}
+FULL = "full"
+
+
+def levels() -> dict[str, int]:
+    return getattr(settings, "STL_LOD_LEVELS", DEFAULT_LEVELS)
+
+
+def lod_path(path: str, level: str) -> str:
+    return f"{path}.lod-{level}.stl"
+
+
+def _write(target: str, triangles) -> None:
+    write_atomic(target, lambda tmp: write_binary(tmp, triangles))
+
+
+def ensure_lod(path: str, level: str, triangle_count: int | None = None) -> str:
+    """Return the file serving ``level`` of ``path``, (re)building it if stale.
+
+    ``triangle_count`` of the full mesh, when known, saves reading it just
+    to find that no decimation is needed.
+    """
+    if level == FULL:
+        return path
+    budget = levels()[level]
+    if triangle_count is not None and triangle_count <= budget:
+        return path
+    target = lod_path(path, level)
+    if is_fresh(target, path):
+        return target
+    triangles = read_triangles(path)
+    if len(triangles) <= budget:
+        return path
+    _write(target, decimate(triangles, budget))
+    return target
+
+
+def build_lods(path: str, triangle_count: int | None = None) -> list[str]:
+    """Write every level of ``path`` that needs a file; returns their paths.
+
+    Levels are built from the finest down, each from the one before it,
+    so only the first pass has to work through the full mesh.
+    """
+    built = []
+    full = source = None
+    for level, budget in sorted(levels().items(), key=lambda item: -item[1]):
+        if triangle_count is not None and triangle_count <= budget:
+            continue
+        target = lod_path(path, level)
+        if is_fresh(target, path):
+            source = None  # the next level can't reuse a mesh we didn't load
+            built.append(target)
+            continue
+        if source is None:
+            source = full = read_triangles(path)
+        if source is full and len(full) <= budget:
+            continue
+        source = decimate(source, budget)
+        _write(target, source)
+        built.append(target)
+    return built
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import platform
+import subprocess
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core import benchmark
+from core.models import Printable
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the order lifecycle (ping, order, status, complete) under "
+        "simulated fleets of increasing size, and optionally bulk order "
+        "intake, each on a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--printers",
+            type=int,
+            nargs="*",
+            default=[10, 100, 500],
+            help="fleet sizes to run, one after another (default: 10 100 500; "
+            "none to skip)",
+        )
+        parser.add_argument(
+            "--order-rate",
+            type=float,
+            help="orders per minute (default: enough to keep 80%% of the fleet busy)",
+        )
+        parser.add_argument("--duration", type=float, default=60.0)
+        parser.add_argument(
+            "--warmup", type=float, default=10.0, help="seconds run before measuring"
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument(
+            "--fixed-interval",
+            action="store_true",
+            help="ping every --interval, ignoring when the API asks printers to ping",
+        )
+        parser.add_argument(
+            "--print-time",
+            type=float,
+            nargs=2,
+            metavar=("MIN", "MAX"),
+            default=[15, 25],
+        )
+        parser.add_argument("--connections", type=int, default=100)
+        parser.add_argument(
+            "--gateway",
+            type=int,
+            default=0,
+            metavar="N",
+            help="ping for N printers at a time through the batch endpoint",
+        )
+        parser.add_argument(
+            "--status-interval",
+            type=float,
+            default=2.0,
+            help="seconds between status polls of each open order",
+        )
+        parser.add_argument(
+            "--bulk",
+            type=int,
+            metavar="N",
+            help="also measure POST /api/orders/bulk with N orders per request",
+        )
+        parser.add_argument(
+            "--bulk-requests",
+            type=int,
+            default=10,
+            help="bulk requests to send (default: %(default)s)",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("-o", "--output", help="write the results here as JSON")
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("needs uvicorn: uv sync --extra asgi")
+        mock = benchmark.mock_module("fleet")
+
+        runs = []
+        for printers in options["printers"]:
+            config = mock.FleetConfig(
+                printers=printers,
+                interval=options["interval"],
+                adaptive=not options["fixed_interval"],
+                print_time=tuple(options["print_time"]),
+                connections=options["connections"],
+                seed=options["seed"],
+                gateway=options["gateway"],
+            )
+            rate = options["order_rate"]
+            if rate is None:
+                per_job = sum(config.print_time) / 2 + config.interval
+                rate = 0.8 * printers * 60 / per_job
+            self.stderr.write(f"{printers} printers, {rate:.0f} orders/min ...")
+            runs.append(self._run(config, rate, options))
+            self._report(runs[-1])
+
+        bulk = None
+        if options["bulk"]:
+            self.stderr.write(f"bulk intake, {options['bulk']} orders/request ...")
+            bulk = self._run_bulk(options)
+            self.stdout.write(
+                f"bulk intake: {bulk['orders_per_second']:.0f} orders/s  "
+                f"p50 {_ms(bulk['p50_ms'])}  p99 {_ms(bulk['p99_ms'])} ms/request  "
+                f"errors {bulk['errors']}  "
+                f"queries {_ms(bulk['queries_per_request'])}/request"
+            )
+
+        if options["output"]:
+            results = {
+                "commit": _commit(),
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "options": {
+                    k: options[k]
+                    for k in (
+                        "duration",
+                        "warmup",
+                        "interval",
+                        "fixed_interval",
+                        "print_time",
+                        "connections",
+                        "gateway",
+                        "status_interval",
+                        "bulk",
+                        "bulk_requests",
+                        "seed",
+                    )
+                },
+                "runs": runs,
+                "bulk": bulk,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def _printables(self) -> list[int]:
+        return [
+            p.id
+            for p in Printable.objects.bulk_create(
+                Printable(name=f"Benchmark {i}") for i in range(20)
+            )
+        ]
+
+    def _run_bulk(self, options) -> dict:
+        with benchmark.scratch_database():
+            return asyncio.run(
+                benchmark.run_bulk(
+                    options["bulk"],
+                    options["bulk_requests"],
+                    self._printables(),
+                    seed=options["seed"],
+                )
+            )
+
+    def _run(self, config, rate, options) -> dict:
+        with benchmark.scratch_database():
+            ids = self._printables()
+            return asyncio.run(
+                benchmark.run(
+                    config,
+                    rate,
+                    ids,
+                    duration=options["duration"],
+                    warmup=options["warmup"],
+                    status_interval=options["status_interval"],
+                )
+            )
+
+    def _report(self, run: dict) -> None:
+        self.stdout.write(
+            f"{run['printers']} printers, {run['orders_created']} orders, "
+            f"{run['jobs_per_minute']:.1f} jobs/min, "
+            f"{run['pings_per_second']:.1f} pings/s"
+        )
+        for name, e in run["endpoints"].items():
+            if not e["requests"]:
+                continue
+            self.stdout.write(
+                f"  {name:<18} {e['per_second']:7.1f}/s  "
+                f"p50 {_ms(e['p50_ms'])}  p95 {_ms(e['p95_ms'])}  "
+                f"p99 {_ms(e['p99_ms'])} ms  errors {e['errors']}  "
+                f"queries {_ms(e['queries_per_request'])}"
+            )
+        wait = run["queue_wait"]
+        self.stdout.write(
+            f"  queue wait    p50 {_ms(wait['p50_s'])}  p95 {_ms(wait['p95_s'])}  "
+            f"p99 {_ms(wait['p99_s'])} s  not started {wait['not_started']}"
+        )
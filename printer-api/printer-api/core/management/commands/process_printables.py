@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.ingest import process_printable
+from core.models import Printable
+
+
+class Command(BaseCommand):
+    help = "Rebuild derived STL data (geometry, previews, compressed variants) for printables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ids", nargs="*", type=int, help="Printable ids (default: all)"
+        )
+        parser.add_argument(
+            "--transcode",
+            action="store_true",
+            help="Also store ASCII STL files as binary",
+        )
+
+    def handle(self, *args, ids, transcode, **options):
+        printables = Printable.objects.exclude(stl="").exclude(stl=None).order_by("id")
+        if ids:
+            printables = printables.filter(id__in=ids)
+        for printable in printables.iterator():
+            try:
+                process_printable(printable, transcode=transcode)
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Printable {printable.id}: {e}")
+                continue
+            self.stdout.write(
+                f"Printable {printable.id}: {printable.triangle_count} triangles"
+            )
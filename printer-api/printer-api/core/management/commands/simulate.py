@@ -0,0 +1,108 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.benchmark import scratch_database
+from core.models import Printable
+from core.simulation import SimulationConfig, simulate
+
+
+def _s(value) -> str:
+    return "-" if value is None else f"{value:.0f}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate the shop on a virtual clock: printers, orders, failures and "
+        "disconnects from a seed, on a scratch database. Same seed, same result."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SimulationConfig()
+        parser.add_argument("--printers", type=int, default=defaults.printers)
+        parser.add_argument(
+            "--days", type=float, default=defaults.days, help="simulated time"
+        )
+        parser.add_argument(
+            "--orders-per-hour", type=float, default=defaults.orders_per_hour
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=defaults.interval,
+            help="seconds over which printers come online, and the backoff base "
+            "after a failed ping; pings then follow the API's PING_INTERVAL_* "
+            "settings (default: %(default)s)",
+        )
+        parser.add_argument(
+            "--print-time",
+            type=float,
+            nargs=2,
+            metavar=("MIN", "MAX"),
+            default=defaults.print_time,
+            help="seconds a job takes, uniformly distributed",
+        )
+        parser.add_argument("--failure-rate", type=float, default=defaults.failure_rate)
+        parser.add_argument(
+            "--disconnect-rate",
+            type=float,
+            default=defaults.disconnect_rate,
+            help="chance per ping that a printer drops off",
+        )
+        parser.add_argument(
+            "--offline-time",
+            type=float,
+            nargs=2,
+            metavar=("MIN", "MAX"),
+            default=defaults.offline_time,
+        )
+        parser.add_argument("--seed", type=int, default=defaults.seed)
+        parser.add_argument(
+            "--gateway",
+            type=int,
+            default=defaults.gateway,
+            metavar="N",
+            help="ping for N printers at a time through the batch endpoint",
+        )
+        parser.add_argument("-o", "--output", help="write the results here as JSON")
+
+    def handle(self, *args, **options):
+        config = SimulationConfig(
+            printers=options["printers"],
+            days=options["days"],
+            orders_per_hour=options["orders_per_hour"],
+            interval=options["interval"],
+            print_time=tuple(options["print_time"]),
+            failure_rate=options["failure_rate"],
+            disconnect_rate=options["disconnect_rate"],
+            offline_time=tuple(options["offline_time"]),
+            seed=options["seed"],
+            gateway=options["gateway"],
+        )
+        started = time.monotonic()
+        with scratch_database():
+            ids = [
+                p.id
+                for p in Printable.objects.bulk_create(
+                    Printable(name=f"Simulated {i}") for i in range(20)
+                )
+            ]
+            result = simulate(config, ids)
+        elapsed = time.monotonic() - started
+
+        orders = result["orders"]
+        wait = result["queue_wait_s"]
+        self.stdout.write(
+            f"{config.days:g} days of {config.printers} printers in {elapsed:.0f}s "
+            f"({result['requests']} requests, {result['errors']} errors)\n"
+            f"  orders: {orders['created']} created, {orders['complete']} complete, "
+            f"{orders['failed']} failed, {orders['open']} open\n"
+            f"  {result['jobs_per_hour']:.1f} jobs/hour, "
+            f"utilization {result['utilization']:.0%}\n"
+            f"  queue wait p50 {_s(wait['p50'])}  p95 {_s(wait['p95'])}  "
+            f"p99 {_s(wait['p99'])} s"
+        )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(result, f, indent=2)
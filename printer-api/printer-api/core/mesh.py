@@ -0,0 +1,133 @@
+"""Compact indexed meshes for the web viewer.
+
+STL repeats every vertex in each triangle that uses it (about six times on
+a closed mesh) as 32-bit floats. The compact form stores each distinct
+vertex once, quantized to 16 bits per axis over the mesh's bounding box,
+and refers to vertices by index. Layout, little-endian, every section
+starting on a 4-byte boundary so it can be viewed as a typed array:
+
+    header     magic b"QMSH", u16 version, u16 flags,
+               u32 vertex_count, u32 triangle_count,
+               f32[3] origin, f32[3] scale
+    positions  u16[vertex_count][3]   position = origin + q * scale
+    indices    u16[triangle_count][3] (u32 when vertex_count > 65536)
+    normals    i8[vertex_count][3]    unit vertex normal * 127, if FLAG_NORMALS
+
+Vertices closer than one quantization step are merged, and triangles that
+collapse as a result are dropped.
+"""
+
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+from .derived import is_fresh, write_atomic
+from .stl import read_triangles
+
+MAGIC = b"QMSH"
+VERSION = 1
+FLAG_NORMALS = 1
+HEADER = struct.Struct("<4sHHII3f3f")
+QUANT_MAX = 0xFFFF
+
+
+class Mesh(NamedTuple):
+    positions: np.ndarray  # (n, 3) float32
+    indices: np.ndarray  # (m, 3) uint16 or uint32
+    normals: np.ndarray | None  # (n, 3) float32
+
+
+def mesh_path(path: str) -> str:
+    return path + ".qmesh"
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _index_dtype(vertex_count: int) -> str:
+    return "<u2" if vertex_count <= 0x10000 else "<u4"
+
+
+def encode(triangles: np.ndarray, normals: bool = True) -> bytes:
+    corners = np.asarray(triangles, dtype=np.float64).reshape(-1, 3)
+    if len(corners):
+        origin = corners.min(axis=0)
+        extent = corners.max(axis=0) - origin
+    else:
+        origin = extent = np.zeros(3)
+    scale = np.where(extent > 0, extent / QUANT_MAX, 1.0)
+    q = np.rint((corners - origin) / scale).astype(np.int64)
+
+    keys = (q[:, 0] << 32) | (q[:, 1] << 16) | q[:, 2]
+    keys, vertex_of = np.unique(keys, return_inverse=True)
+    positions = np.stack([keys >> 32, (keys >> 16) & QUANT_MAX, keys & QUANT_MAX], 1)
+    faces = vertex_of.reshape(-1, 3)
+    a, b, c = faces[:, 0], faces[:, 1], faces[:, 2]
+    kept = (a != b) & (b != c) & (a != c)
+    faces = faces[kept]
+
+    flags = FLAG_NORMALS if normals else 0
+    header = HEADER.pack(MAGIC, VERSION, flags, len(keys), len(faces), *origin, *scale)
+    sections = [
+        header,
+        _pad(positions.astype("<u2").tobytes()),
+        _pad(faces.astype(_index_dtype(len(keys))).tobytes()),
+    ]
+    if normals:
+        sections.append(_pad(_vertex_normals(corners, kept, faces, len(keys))))
+    return b"".join(sections)
+
+
+def _vertex_normals(corners, kept, faces, vertex_count) -> bytes:
+    # Area-weighted average of the normals of the faces around each vertex
+    tri = corners.reshape(-1, 3, 3)[kept]
+    face_normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    sums = np.zeros((vertex_count, 3))
+    for corner in range(3):
+        for axis in range(3):
+            sums[:, axis] += np.bincount(
+                faces[:, corner], weights=face_normals[:, axis], minlength=vertex_count
+            )
+    lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+    unit = np.divide(sums, lengths, out=np.zeros_like(sums), where=lengths > 0)
+    return np.rint(unit * 127).astype(np.int8).tobytes()
+
+
+def decode(data: bytes) -> Mesh:
+    magic, version, flags, vertex_count, triangle_count, *rest = HEADER.unpack_from(
+        data
+    )
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version 1 QMSH mesh")
+    origin, scale = np.array(rest[:3]), np.array(rest[3:])
+    offset = HEADER.size
+
+    def section(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(data, dtype=dtype, count=count * 3, offset=offset)
+        offset += -(-array.nbytes // 4) * 4
+        return array.reshape(-1, 3)
+
+    q = section("<u2", vertex_count)
+    indices = section(_index_dtype(vertex_count), triangle_count)
+    normals = None
+    if flags & FLAG_NORMALS:
+        normals = section("i1", vertex_count).astype(np.float32) / 127
+    positions = (origin + q * scale).astype(np.float32)
+    return Mesh(positions, indices, normals)
+
+
+def ensure_mesh(path: str) -> str:
+    """Return the compact mesh of STL ``path``, (re)building it if stale."""
+    target = mesh_path(path)
+    if not is_fresh(target, path):
+        data = encode(read_triangles(path))
+        write_atomic(target, lambda tmp: _write_bytes(tmp, data))
+    return target
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
@@ -1,22 +1,41 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.http import HttpResponse
 
 
 class SimpleCORS:
+    # Async-capable so async views (order status push) don't hold a thread
+    # per open request under ASGI
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         if request.method == "OPTIONS":
             response = HttpResponse()
         else:
             response = self.get_response(request)
+        return self._allow_origin(request, response)
+
+    async def __acall__(self, request):
+        if request.method == "OPTIONS":
+            response = HttpResponse()
+        else:
+            response = await self.get_response(request)
+        return self._allow_origin(request, response)
 
+    def _allow_origin(self, request, response):
         origin = request.headers.get("Origin")
         allowed = getattr(settings, "CORS_ALLOWED_ORIGINS", [])
         if origin and origin in allowed:
             response["Access-Control-Allow-Origin"] = origin
             response["Vary"] = "Origin"
             response["Access-Control-Allow-Methods"] = "GET,POST,OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type"
+            response["Access-Control-Allow-Headers"] = "Content-Type, Last-Event-ID"
         return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_remove_printable_sku"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["status", "created_at"], name="order_status_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["created_at"], name="order_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["assigned_printer_id"], name="order_assigned_printer_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="printer",
+            index=models.Index(fields=["status"], name="printer_status_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="printer",
+            index=models.Index(fields=["last_ping_at"], name="printer_last_ping_idx"),
+        ),
+    ]
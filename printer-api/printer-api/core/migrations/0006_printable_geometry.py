@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_order_printer_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="printable",
+            name="size_x",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="printable",
+            name="size_y",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="printable",
+            name="size_z",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="printable",
+            name="surface_area",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="printable",
+            name="triangle_count",
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="printable",
+            name="volume",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="printable",
+            index=models.Index(
+                fields=["triangle_count"], name="printable_triangles_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="printable",
+            index=models.Index(fields=["volume"], name="printable_volume_idx"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:49
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_printable_geometry"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="printable",
+            name="stl",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=core.storage.ContentAddressedStorage(),
+                upload_to="stl/",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+import posixpath
+
+from django.db import migrations, models
+
+from core.storage import blob_digest
+
+
+def remember_filenames(apps, schema_editor):
+    # Names from before content addressing are still the uploaded ones
+    Printable = apps.get_model("core", "Printable")
+    for p in Printable.objects.exclude(stl="").exclude(stl=None).only("stl"):
+        if blob_digest(p.stl.name) is None:
+            p.stl_filename = posixpath.basename(p.stl.name)
+            p.save(update_fields=["stl_filename"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_progresssample"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="printable",
+            name="stl_filename",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(remember_filenames, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_printable_stl_filename"),
+    ]
+
+    # Upload.created_at is now a ClockDateTimeField, which is stored (and
+    # deconstructs) as a plain DateTimeField: the column doesn't change
+    operations = [
+        migrations.AlterField(
+            model_name="upload",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
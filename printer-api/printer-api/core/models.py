@@ -1,14 +1,100 @@
+import os
+import uuid
+
 from django.db import models
+from django.utils.text import slugify
+
+from .clock import clock
+from .storage import blob_digest, stl_storage
+
+
+class ClockDateTimeField(models.DateTimeField):
+    """``auto_now``/``auto_now_add`` taken from ``core.clock``."""
+
+    def pre_save(self, model_instance, add):
+        if self.auto_now or (self.auto_now_add and add):
+            value = clock.now()
+            setattr(model_instance, self.attname, value)
+            return value
+        return super().pre_save(model_instance, add)
+
+    def deconstruct(self):
+        # Same column as a DateTimeField, so migrations needn't know about it
+        name, _, args, kwargs = super().deconstruct()
+        return name, "django.db.models.DateTimeField", args, kwargs
+
+
+class StlField(models.FileField):
+    """Notes the uploaded file's name in ``stl_filename`` when storing it.
+
+    The stored name is a content hash, so downloads need the original.
+    """
+
+    def generate_filename(self, instance, filename):
+        if blob_digest(filename) is None:
+            instance.stl_filename = os.path.basename(filename)
+        return super().generate_filename(instance, filename)
+
+    def deconstruct(self):
+        name, _, args, kwargs = super().deconstruct()
+        return name, "django.db.models.FileField", args, kwargs
 
 
 class Printable(models.Model):
     name = models.CharField(max_length=128)
-    stl = models.FileField(upload_to="stl/", null=True, blank=True)
+    # Content-addressed: identical uploads share one file (see core.storage)
+    stl = StlField(upload_to="stl/", storage=stl_storage, null=True, blank=True)
+    # The name the file was uploaded as, for downloads
+    stl_filename = models.CharField(
+        max_length=255, default="", blank=True, editable=False
+    )
     color = models.CharField(max_length=32, default="", blank=True)
 
+    # Uploaded printables are "processing" until ingest has run (core.uploads)
+    STATUS_CHOICES = [
+        ("processing", "Processing"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="ready")
+    processing_error = models.TextField(default="", blank=True, editable=False)
+
+    # Geometry extracted from the STL on ingest (mm, mm², mm³)
+    triangle_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    size_x = models.FloatField(null=True, blank=True, editable=False)
+    size_y = models.FloatField(null=True, blank=True, editable=False)
+    size_z = models.FloatField(null=True, blank=True, editable=False)
+    surface_area = models.FloatField(null=True, blank=True, editable=False)
+    volume = models.FloatField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["triangle_count"], name="printable_triangles_idx"),
+            models.Index(fields=["volume"], name="printable_volume_idx"),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover - admin display
         return f"{self.name}"
 
+    def download_name(self) -> str:
+        """File name to download the STL as."""
+        return self.stl_filename or f"{slugify(self.name) or self.pk}.stl"
+
+
+class Upload(models.Model):
+    """A resumable STL upload in progress; its bytes are in a ``.part`` file."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    printable = models.OneToOneField(
+        Printable, on_delete=models.CASCADE, related_name="upload"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    created_at = ClockDateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:  # pragma: no cover - admin display
+        return f"Upload {self.pk} - {self.filename}"
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -23,8 +109,21 @@ class Order(models.Model):
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="unknown")
     items = models.JSONField(default=list, blank=True)
     assigned_printer_id = models.IntegerField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = ClockDateTimeField(auto_now_add=True)
+    updated_at = ClockDateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Dispatch queue head and admin status filter. Not a partial index:
+            # SQLite can't match one against Django's bound `status = %s`.
+            models.Index(
+                fields=["status", "created_at"], name="order_status_created_idx"
+            ),
+            models.Index(fields=["created_at"], name="order_created_idx"),
+            models.Index(
+                fields=["assigned_printer_id"], name="order_assigned_printer_idx"
+            ),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - admin display
         return f"Order {self.pk} - {self.status}"
@@ -42,5 +141,34 @@ class Printer(models.Model):
         related_name="current_printer",
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status"], name="printer_status_idx"),
+            models.Index(fields=["last_ping_at"], name="printer_last_ping_idx"),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover - admin display
         return f"Printer {self.pk} - {self.name}"
+
+
+class ProgressSample(models.Model):
+    """Print progress of an order over time, appended in batches (core.progress)."""
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name="progress_samples",
+        db_index=False,  # covered by the (order, recorded_at) index
+    )
+    recorded_at = models.DateTimeField()
+    progress = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["order", "recorded_at"], name="progress_order_time_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - admin display
+        return f"Order {self.order_id} - {self.progress}%"
@@ -0,0 +1,72 @@
+"""Order intake helpers shared by the order endpoints."""
+
+from collections.abc import Iterable
+
+
+class InvalidItem(ValueError):
+    pass
+
+
+def existing_printable_ids(
+    pids: Iterable[int], known_ids: frozenset[int] | None = None
+) -> set[int]:
+    """Return the subset of ``pids`` that exist and are orderable, in one query.
+
+    ``known_ids`` is a set of ids already known to exist (e.g. the catalog
+    cache); only ids outside it are looked up in the database.
+    """
+    from .models import Printable
+
+    pids = set(pids)
+    found = pids & known_ids if known_ids else set()
+    missing = pids - found
+    if missing:
+        found |= set(
+            Printable.objects.filter(id__in=missing, status="ready").values_list(
+                "id", flat=True
+            )
+        )
+    return found
+
+
+def parse_items(items: list) -> tuple[list[tuple[int, int]], InvalidItem | None]:
+    """Parse line items up to the first malformed one.
+
+    Returns the ``(printable_id, qty)`` pairs parsed so far and the error
+    that stopped parsing, if any.
+    """
+    parsed = []
+    for it in items:
+        try:
+            pid = int(it.get("printable_id"))
+            qty = int(it.get("qty", 1))
+        except Exception:
+            return parsed, InvalidItem("Invalid item")
+        if qty <= 0:
+            return parsed, InvalidItem("qty must be > 0")
+        parsed.append((pid, qty))
+    return parsed, None
+
+
+def clean_items(
+    parsed: list[tuple[int, int]], error: InvalidItem | None, existing: set[int]
+) -> list[dict]:
+    """Build the stored ``items`` list, raising the first item's error.
+
+    Errors are reported in item order, exactly as checking each item in turn
+    against the database would.
+    """
+    cleaned = []
+    for pid, qty in parsed:
+        if pid not in existing:
+            raise InvalidItem(f"printable_id {pid} not found")
+        cleaned.append({"printable_id": pid, "qty": qty})
+    if error:
+        raise error
+    return cleaned
+
+
+def validate_items(items: list, known_ids: frozenset[int] | None = None) -> list[dict]:
+    parsed, error = parse_items(items)
+    existing = existing_printable_ids((pid for pid, _ in parsed), known_ids)
+    return clean_items(parsed, error, existing)
@@ -0,0 +1,37 @@
+"""How long a printer should wait before its next ping.
+
+Every ping is answered with ``next_ping_in`` seconds, picked from what the
+printer is doing and what the API has on:
+
+- ``PING_INTERVAL_SOON`` for an idle printer while orders are waiting, so it
+  picks one up quickly;
+- ``PING_INTERVAL_PRINTING`` while printing, to keep progress current;
+- ``PING_INTERVAL_IDLE`` for an idle printer and an empty queue.
+
+Past ``PING_RATE_TARGET`` pings per second for the whole fleet, intervals are
+stretched to fit (up to ``PING_INTERVAL_MAX``), and each is spread by
+``PING_JITTER`` either way so that printers started together drift apart.
+"""
+
+import random
+from datetime import datetime
+
+from django.conf import settings
+
+from .dispatch import dispatcher
+from .fleet import fleet
+
+
+def next_ping_in(printer_id: int, status: str, at: datetime) -> float:
+    if status == "idle" and len(dispatcher):
+        seconds = getattr(settings, "PING_INTERVAL_SOON", 2.0)
+    elif status == "printing":
+        seconds = getattr(settings, "PING_INTERVAL_PRINTING", 5.0)
+    else:
+        seconds = getattr(settings, "PING_INTERVAL_IDLE", 15.0)
+    seconds = max(seconds, len(fleet) / getattr(settings, "PING_RATE_TARGET", 500.0))
+    seconds = min(seconds, getattr(settings, "PING_INTERVAL_MAX", 60.0))
+    # Seeded by printer and time rather than drawn, so simulations replay
+    rng = random.Random(f"{printer_id}:{at.timestamp()}")
+    jitter = getattr(settings, "PING_JITTER", 0.2)
+    return round(seconds * rng.uniform(1 - jitter, 1 + jitter), 1)
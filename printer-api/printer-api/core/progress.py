@@ -0,0 +1,161 @@
+"""Per-job print progress, buffered in memory and stored downsampled.
+
+Pings from a printing printer carry its progress (0-100). Each job's samples
+go into a fixed-size ring buffer (``PROGRESS_BUFFER_SIZE``), so its latest
+value is at hand without a query. Every ``PROGRESS_FLUSH_INTERVAL`` seconds
+the samples that came in since the previous flush are thinned, keeping at
+most one per ``PROGRESS_SAMPLE_INTERVAL`` seconds and none that repeat the
+last stored value, and appended to ``ProgressSample`` in one batch. A job's
+buffer is dropped once its final sample is stored, or after
+``PROGRESS_STALE_AFTER`` seconds without a sample.
+
+Like the heartbeat buffer, flushing piggybacks on the ping path. Finishing a
+job flushes right away, since the printer may not ping again for a while.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from .clock import clock
+
+Sample = tuple[datetime, int]
+
+
+def parse_progress(value) -> int | None:
+    """The progress a ping reports, or ``None`` if it isn't a percentage."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value) if 0 <= value <= 100 else None
+
+
+def decimate(samples: list[Sample], points: int) -> list[Sample]:
+    """At most ``points`` evenly spread samples, keeping the first and last."""
+    if len(samples) <= points:
+        return samples
+    if points <= 1:
+        return samples[-1:] if points else []
+    last = len(samples) - 1
+    return [samples[round(i * last / (points - 1))] for i in range(points)]
+
+
+@dataclass
+class _Job:
+    samples: deque
+    seen_until: datetime | None = None  # samples up to here have been flushed
+    stored: Sample | None = None  # the last sample written
+    finished: bool = False
+
+    def new_samples(self) -> list[Sample]:
+        return [
+            s for s in self.samples if self.seen_until is None or s[0] > self.seen_until
+        ]
+
+
+class ProgressStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: dict[int, _Job] = {}
+        self._last_flush = clock.monotonic()
+
+    @staticmethod
+    def flush_interval() -> float:
+        return float(getattr(settings, "PROGRESS_FLUSH_INTERVAL", 30.0))
+
+    @staticmethod
+    def sample_interval() -> timedelta:
+        return timedelta(seconds=getattr(settings, "PROGRESS_SAMPLE_INTERVAL", 60.0))
+
+    @staticmethod
+    def buffer_size() -> int:
+        return int(getattr(settings, "PROGRESS_BUFFER_SIZE", 720))
+
+    def _job(self, order_id: int) -> _Job:
+        job = self._jobs.get(order_id)
+        if job is None:
+            job = self._jobs[order_id] = _Job(deque(maxlen=self.buffer_size()))
+        return job
+
+    def record(self, order_id: int, at: datetime, value: int) -> bool:
+        """Buffer a sample; returns whether a flush is due."""
+        with self._lock:
+            samples = self._job(order_id).samples
+            if not samples or at >= samples[-1][0]:
+                samples.append((at, value))
+            return clock.monotonic() - self._last_flush >= self.flush_interval()
+
+    def finish(self, order_id: int, at: datetime, value: int = 100) -> int:
+        """Record the final sample of a job and flush; returns rows written."""
+        with self._lock:
+            job = self._job(order_id)
+            job.samples.append((at, value))
+            job.finished = True
+        return self.flush()
+
+    def latest(self, order_id: int) -> Sample | None:
+        with self._lock:
+            job = self._jobs.get(order_id)
+            return job.samples[-1] if job and job.samples else None
+
+    def unflushed(self, order_id: int) -> list[Sample]:
+        """Samples of ``order_id`` that no flush has looked at yet."""
+        with self._lock:
+            job = self._jobs.get(order_id)
+            return job.new_samples() if job else []
+
+    def _thin(self, job: _Job, samples: list[Sample]) -> list[Sample]:
+        interval = self.sample_interval()
+        kept = []
+        for i, (at, value) in enumerate(samples):
+            final = job.finished and i == len(samples) - 1
+            stored = job.stored
+            if stored is not None and value == stored[1] and not final:
+                continue
+            if stored is None or at - stored[0] >= interval or final:
+                job.stored = (at, value)
+                kept.append(job.stored)
+        return kept
+
+    def flush(self) -> int:
+        """Store the thinned new samples of every job; returns rows written."""
+        from .models import ProgressSample
+
+        stale = clock.now() - timedelta(
+            seconds=getattr(settings, "PROGRESS_STALE_AFTER", 3600.0)
+        )
+        rows = []
+        with self._lock:
+            self._last_flush = clock.monotonic()
+            for order_id, job in list(self._jobs.items()):
+                samples = job.new_samples()
+                for at, value in self._thin(job, samples):
+                    rows.append(
+                        ProgressSample(
+                            order_id=order_id, recorded_at=at, progress=value
+                        )
+                    )
+                if job.finished or not job.samples or job.samples[-1][0] < stale:
+                    del self._jobs[order_id]
+                elif samples:
+                    # Only the latest value is still needed in memory
+                    job.seen_until = samples[-1][0]
+                    while len(job.samples) > 1:
+                        job.samples.popleft()
+        if rows:
+            ProgressSample.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+    def discard(self, order_id: int) -> None:
+        with self._lock:
+            self._jobs.pop(order_id, None)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._jobs = {}
+            self._last_flush = clock.monotonic()
+
+
+job_progress = ProgressStore()
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog import catalog
+from .dispatch import dispatcher
+from .events import OrderEvent, order_events
+from .fleet import fleet
+from .ingest import process_printable, refresh_thumbnail
+from .models import Order, Printable, Printer
+from .progress import job_progress
+from .storage import blob_digest, release
+
+
+@receiver(post_save, sender=Printer)
+@receiver(post_delete, sender=Printer)
+def invalidate_printer_state(sender, instance, **kwargs):
+    # Saves made outside the ping path (admin, shell) bypass the registry
+    fleet.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Printable)
+def update_catalog(sender, instance, **kwargs):
+    catalog.changed(instance.pk, instance.status == "ready")
+
+
+@receiver(post_delete, sender=Printable)
+def remove_from_catalog(sender, instance, **kwargs):
+    catalog.changed(instance.pk, False)
+
+
+@receiver(post_save, sender=Printable)
+def build_printable_artifacts(sender, instance, created, **kwargs):
+    # Admin saves write every field; only redo what actually changed
+    stored_color = instance.__dict__.pop("_stored_color", instance.color)
+    stl_changed = instance.stl.name != instance.__dict__.get(
+        "_stored_stl", instance.stl.name
+    )
+    if (
+        created
+        or stl_changed
+        or instance.triangle_count is None
+        or blob_digest(instance.stl.name) is None
+    ):
+        process_printable(instance)
+    elif instance.color != stored_color:
+        refresh_thumbnail(instance)
+
+
+@receiver(pre_save, sender=Printable)
+def remember_stored_stl(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or {"stl", "color"} & set(update_fields)):
+        stored = (
+            Printable.objects.filter(pk=instance.pk).values_list("stl", "color").first()
+        )
+        if stored:
+            instance._stored_stl, instance._stored_color = stored
+
+
+@receiver(post_save, sender=Printable)
+def release_replaced_stl(sender, instance, **kwargs):
+    previous = instance.__dict__.pop("_stored_stl", None)
+    if previous and previous != instance.stl.name:
+        transaction.on_commit(lambda: release(previous, instance.stl.storage))
+
+
+@receiver(post_delete, sender=Printable)
+def release_deleted_stl(sender, instance, **kwargs):
+    if instance.stl:
+        name = instance.stl.name
+        transaction.on_commit(lambda: release(name, instance.stl.storage))
+
+
+@receiver(post_save, sender=Order)
+def sync_order_queue(sender, instance, **kwargs):
+    if instance.status == "queued":
+        dispatcher.push(instance.pk, instance.created_at)
+    else:
+        dispatcher.discard(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, **kwargs):
+    event = OrderEvent.from_order(instance)
+    transaction.on_commit(lambda: order_events.publish(event))
+
+
+@receiver(post_delete, sender=Order)
+def drop_queued_order(sender, instance, **kwargs):
+    dispatcher.discard(instance.pk)
+    job_progress.discard(instance.pk)
+    fleet.invalidate_order(instance.pk)
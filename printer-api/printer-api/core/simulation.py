@@ -0,0 +1,185 @@
+"""Time-compressed, reproducible runs of the print shop on a virtual clock.
+
+``simulate`` runs printer mocks (``printer-mock/printer.py``) and a stream of
+orders against the API in this process. Requests go through Django's test
+client one at a time, and the API and the mocks read one ``VirtualClock``
+that jumps from each event to the next, so a simulated week takes as long as
+serving its requests does. Print times, failures, disconnects and order
+arrivals come from generators seeded by ``SimulationConfig.seed``: on a fresh
+database the same config makes the same requests in the same order and ends
+with the same numbers. With ``SimulationConfig.gateway`` set, the printers
+ping in batches through the mock's ``Gateway``.
+
+Printers ping when the API's answer says to (``next_ping_in``, from the
+``PING_INTERVAL_*`` settings), so those settings, not
+``SimulationConfig.interval``, set how many pings a run makes.
+"""
+
+import heapq
+import json
+import random
+import re
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Count
+from django.test import Client
+
+from .benchmark import mock_module, percentiles, reset_state
+from .clock import VirtualClock, clock
+from .models import Order
+
+_COMPLETE_PATH = re.compile(r"^/api/jobs/(\d+)/complete$")
+
+
+@dataclass
+class SimulationConfig:
+    printers: int = 20
+    days: float = 1.0
+    orders_per_hour: float = 12.0  # Poisson arrivals
+    # Window the first pings are spread over; also the backoff base after a
+    # failed ping and the pace if the API doesn't give a next_ping_in
+    interval: float = 30.0
+    print_time: tuple[float, float] = (1800.0, 7200.0)  # seconds, uniform
+    failure_rate: float = 0.02  # per job
+    disconnect_rate: float = 0.001  # per ping
+    offline_time: tuple[float, float] = (60.0, 1800.0)  # seconds, uniform
+    seed: int = 0
+    gateway: int = 0  # printers per batch ping, 0 for one ping per printer
+    start: datetime = datetime(2025, 1, 6, tzinfo=timezone.utc)
+
+
+class _Shop:
+    """Talks to the API for the printers and the customers, and keeps score."""
+
+    def __init__(self, virtual: VirtualClock):
+        self.clock = virtual
+        # Server errors are answered with a 500, as they would be over HTTP
+        self.client = Client(raise_request_exception=False)
+        self.requests = 0
+        self.errors = 0
+        self.created: dict[int, float] = {}
+        self.started: dict[int, float] = {}
+        self.finished: dict[int, float] = {}
+
+    def post(self, path: str, payload: dict) -> tuple[int, str]:
+        response = self.client.post(
+            path, json.dumps(payload), content_type="application/json"
+        )
+        self.requests += 1
+        self.errors += response.status_code >= 400
+        now = self.clock.time()
+        body = response.content.decode("utf-8")
+        if response.status_code == 200:
+            data = json.loads(body)
+            for answer in data.get("results", [data]):
+                if instruction := answer.get("instruction"):
+                    self.started[int(instruction["job_id"])] = now
+            if match := _COMPLETE_PATH.match(path):
+                self.finished[int(match[1])] = now
+        return response.status_code, body
+
+    def order(self, printable_id: int) -> None:
+        status, body = self.post(
+            "/api/orders", {"items": [{"printable_id": printable_id, "qty": 1}]}
+        )
+        if status == 201:
+            self.created[json.loads(body)["order_id"]] = self.clock.time()
+
+
+def simulate(config: SimulationConfig, printable_ids: list[int]) -> dict:
+    """Run the shop for ``config.days``; returns what happened."""
+    printer = mock_module("printer")
+    names = mock_module("fleet").printer_names(config.printers, config.seed)
+    rng = random.Random(config.seed)
+    virtual = VirtualClock(config.start)
+    shop = _Shop(virtual)
+    behavior = {
+        "interval": config.interval,
+        "print_time": config.print_time,
+        "failure_rate": config.failure_rate,
+        "disconnect_rate": config.disconnect_rate,
+        "offline_time": config.offline_time,
+    }
+    printers = [
+        printer.PrinterMock(
+            api_base="",
+            printer_name=name,
+            state_file="",
+            clock=virtual,
+            behavior=printer.Behavior(**behavior, seed=rng.random()),
+            transport=shop.post,
+            quiet=True,
+        )
+        for name in names
+    ]
+    if config.gateway:
+        printers = [
+            printer.Gateway(printers[i : i + config.gateway])
+            for i in range(0, len(printers), config.gateway)
+        ]
+    orders = random.Random(rng.random())
+    end = config.start + timedelta(days=config.days)
+
+    def after(at: datetime, seconds: float) -> datetime:
+        return at + timedelta(seconds=seconds)
+
+    # Printers come online within their first interval
+    pings = [
+        (after(config.start, rng.uniform(0, config.interval)), i)
+        for i in range(len(printers))
+    ]
+    heapq.heapify(pings)
+    next_order = after(config.start, orders.expovariate(config.orders_per_hour / 3600))
+
+    with clock.use(virtual):
+        # Flush timers and the like start over on virtual time
+        reset_state()
+        try:
+            while pings[0][0] < end:
+                if next_order <= pings[0][0]:
+                    virtual.advance_to(next_order)
+                    shop.order(orders.choice(printable_ids))
+                    next_order = after(
+                        next_order, orders.expovariate(config.orders_per_hour / 3600)
+                    )
+                    continue
+                at, i = pings[0]
+                virtual.advance_to(at)
+                heapq.heapreplace(pings, (after(at, printers[i].step()), i))
+        finally:
+            reset_state()
+
+    hours = config.days * 24
+    finish = end.timestamp()
+    busy = sum(
+        shop.finished.get(job, finish) - started
+        for job, started in shop.started.items()
+    )
+    statuses = dict(
+        Order.objects.values_list("status").annotate(n=Count("id")).order_by()
+    )
+    waits = [
+        shop.started[o] - at for o, at in shop.created.items() if o in shop.started
+    ]
+    lead = [
+        shop.finished[o] - at for o, at in shop.created.items() if o in shop.finished
+    ]
+    options = asdict(config)
+    options["start"] = config.start.isoformat()
+    complete, failed = statuses.get("complete", 0), statuses.get("failed", 0)
+    return {
+        "config": options,
+        "requests": shop.requests,
+        "errors": shop.errors,
+        "orders": {
+            "created": len(shop.created),
+            "complete": complete,
+            "failed": failed,
+            "open": len(shop.created) - complete - failed,
+        },
+        "jobs_per_hour": complete / hours,
+        "utilization": busy / (config.printers * hours * 3600),
+        "queue_wait_s": percentiles(waits),
+        "lead_time_s": percentiles(lead),
+    }
@@ -0,0 +1,258 @@
+"""STL parsing and measurement with NumPy.
+
+Meshes are handled as ``(n, 3, 3)`` float32 arrays of triangle vertices.
+Binary STL is memory-mapped, so only the triangles being processed are
+paged in; measurements run in vectorized passes over fixed-size blocks so
+memory stays bounded for multi-million-triangle meshes. ASCII meshes are
+transcoded to binary in a streaming pass when they are stored, and
+``decimate`` builds the coarse preview meshes served by ``?lod=``.
+"""
+
+import mmap
+import os
+import re
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+import numpy as np
+
+HEADER_SIZE = 80
+# Must not start with "solid", or naive readers take the file for ASCII
+BINARY_HEADER = b"binary STL".ljust(HEADER_SIZE, b" ")
+# One binary facet: normal, three vertices, attribute byte count (50 bytes)
+FACET = np.dtype(
+    [("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")]
+)
+BLOCK_TRIANGLES = 1 << 20
+ASCII_CHUNK_SIZE = 8 << 20
+
+_VERTEX_RE = re.compile(rb"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
+
+
+def binary_triangle_count(path: str) -> int | None:
+    """Triangle count if ``path`` is a well-formed binary STL, else ``None``.
+
+    Size is checked rather than the ``solid`` prefix, which some binary
+    exporters also write into their header.
+    """
+    size = os.path.getsize(path)
+    if size < HEADER_SIZE + 4:
+        return None
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        (count,) = struct.unpack("<I", f.read(4))
+    return count if size == HEADER_SIZE + 4 + count * FACET.itemsize else None
+
+
+def validate(path: str) -> None:
+    """Raise ``ValueError`` unless ``path`` looks like an ASCII or binary STL."""
+    if binary_triangle_count(path) is not None:
+        return
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+    if not head.lstrip().startswith(b"solid"):
+        raise ValueError("not an STL file")
+
+
+def read_triangles(path: str) -> np.ndarray:
+    """All triangles of an ASCII or binary STL as an ``(n, 3, 3)`` array.
+
+    Binary files come back as a read-only memory map.
+    """
+    count = binary_triangle_count(path)
+    if count is not None:
+        if count == 0:
+            return np.empty((0, 3, 3), dtype=np.float32)
+        facets = np.memmap(
+            path, dtype=FACET, mode="r", offset=HEADER_SIZE + 4, shape=(count,)
+        )
+        return facets["vertices"]
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return np.empty((0, 3, 3), dtype=np.float32)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            vertices = _parse_vertices(mm)
+    return vertices[: len(vertices) // 3 * 3].reshape(-1, 3, 3)
+
+
+def _parse_vertices(data) -> np.ndarray:
+    coords = _VERTEX_RE.findall(data)
+    if not coords:
+        return np.empty((0, 3), dtype=np.float32)
+    return np.array(coords, dtype=np.bytes_).astype(np.float32)
+
+
+def _facets(triangles: np.ndarray) -> np.ndarray:
+    """Binary facet records, with normals recomputed from the winding."""
+    normals = np.cross(
+        triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]
+    )
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    facets = np.zeros(len(triangles), dtype=FACET)
+    facets["normal"] = np.divide(
+        normals, lengths, out=np.zeros_like(normals), where=lengths > 0
+    )
+    facets["vertices"] = triangles
+    return facets
+
+
+def transcode_ascii(src: str, dst: str, chunk_size: int = ASCII_CHUNK_SIZE) -> int:
+    """Write ASCII STL ``src`` to ``dst`` as binary STL; returns the facet count.
+
+    The input is read in ``chunk_size`` pieces cut at line boundaries and
+    each piece is converted and written before the next is read, so memory
+    use doesn't depend on the size of the mesh.
+    """
+    count = 0
+    pending = np.empty((0, 3), dtype=np.float32)
+    tail = b""
+    with open(src, "rb") as fin, open(dst, "wb") as fout:
+        fout.write(BINARY_HEADER)
+        fout.write(struct.pack("<I", 0))  # patched once the count is known
+        while True:
+            chunk = fin.read(chunk_size)
+            data = tail + chunk
+            if chunk:
+                cut = data.rfind(b"\n") + 1
+                data, tail = data[:cut], data[cut:]
+            # A facet may straddle two chunks; carry its first vertices over
+            pending = np.concatenate([pending, _parse_vertices(data)])
+            whole = len(pending) // 3 * 3
+            if whole:
+                fout.write(_facets(pending[:whole].reshape(-1, 3, 3)).tobytes())
+                count += whole // 3
+                pending = pending[whole:]
+            if not chunk:
+                break
+        fout.seek(HEADER_SIZE)
+        fout.write(struct.pack("<I", count))
+    return count
+
+
+def write_binary(path: str, triangles: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        f.write(BINARY_HEADER)
+        f.write(struct.pack("<I", len(triangles)))
+        for start in range(0, len(triangles), BLOCK_TRIANGLES):
+            f.write(_facets(triangles[start : start + BLOCK_TRIANGLES]).tobytes())
+
+
+def _blocks(triangles: np.ndarray) -> Iterator[np.ndarray]:
+    for start in range(0, len(triangles), BLOCK_TRIANGLES):
+        yield np.asarray(triangles[start : start + BLOCK_TRIANGLES], dtype=np.float64)
+
+
+@dataclass(frozen=True)
+class Geometry:
+    triangle_count: int
+    bbox_min: tuple[float, float, float] | None
+    bbox_max: tuple[float, float, float] | None
+    surface_area: float
+    volume: float
+
+    @property
+    def size(self) -> tuple[float, float, float] | None:
+        if self.bbox_min is None:
+            return None
+        return tuple(hi - lo for lo, hi in zip(self.bbox_min, self.bbox_max))
+
+
+def measure(triangles: np.ndarray) -> Geometry:
+    """Bounding box, surface area and (signed-tetrahedron) volume."""
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    area = 0.0
+    volume = 0.0
+    for tri in _blocks(triangles):
+        v0, v1, v2 = tri[:, 0], tri[:, 1], tri[:, 2]
+        lo = np.minimum(lo, tri.min(axis=(0, 1)))
+        hi = np.maximum(hi, tri.max(axis=(0, 1)))
+        area += 0.5 * np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1).sum()
+        volume += np.einsum("ij,ij->i", v0, np.cross(v1, v2)).sum() / 6.0
+    empty = len(triangles) == 0
+    return Geometry(
+        triangle_count=len(triangles),
+        bbox_min=None if empty else tuple(float(x) for x in lo),
+        bbox_max=None if empty else tuple(float(x) for x in hi),
+        surface_area=float(area),
+        volume=float(abs(volume)),
+    )
+
+
+def analyze(path: str) -> Geometry:
+    return measure(read_triangles(path))
+
+
+def _cluster(vertices, lo, extent, resolution):
+    """Collapse mesh ``vertices`` (three per triangle) onto a cubic grid.
+
+    Each occupied cell becomes one vertex at the mean of the vertices in it;
+    triangles whose corners fall into fewer than three cells disappear, as
+    do duplicates. Returns the surviving triangles as an ``(n, 3, 3)`` array.
+    """
+    cells = ((vertices - lo) * (resolution / extent)).astype(np.int64)
+    np.clip(cells, 0, resolution - 1, out=cells)
+    keys = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, cell_of = np.unique(keys, return_inverse=True)
+    counts = np.bincount(cell_of)
+    centers = (
+        np.stack(
+            [np.bincount(cell_of, weights=vertices[:, axis]) for axis in range(3)],
+            axis=1,
+        )
+        / counts[:, None]
+    )
+
+    tri = cell_of.reshape(-1, 3)
+    a, b, c = tri[:, 0], tri[:, 1], tri[:, 2]
+    tri = tri[(a != b) & (b != c) & (a != c)]
+    # Rotate the lowest index to the front, keeping the winding, so the
+    # same face collapsed from different triangles compares equal
+    first = np.argmin(tri, axis=1)
+    tri = np.take_along_axis(tri, (first[:, None] + np.arange(3)) % 3, axis=1)
+    n = len(counts)
+    if n < 2**21:
+        # Three indices fit one int64 key, much faster to sort than rows
+        keys = (tri[:, 0] * n + tri[:, 1]) * n + tri[:, 2]
+        _, keep = np.unique(keys, return_index=True)
+        tri = tri[keep]
+    else:
+        tri = np.unique(tri, axis=0)
+    return centers[tri].astype(np.float32)
+
+
+def decimate(triangles: np.ndarray, target: int, max_rounds: int = 12) -> np.ndarray:
+    """Reduce a mesh to at most ``target`` triangles by vertex clustering.
+
+    The grid resolution is searched for the finest one that stays within
+    budget; the triangle count grows roughly with its square, which is used
+    to guess the next resolution before falling back to bisection.
+    """
+    if len(triangles) <= target:
+        return np.asarray(triangles, dtype=np.float32)
+    vertices = np.asarray(triangles, dtype=np.float64).reshape(-1, 3)
+    lo = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - lo).max()) or 1.0
+
+    best = np.empty((0, 3, 3), dtype=np.float32)
+    good, bad = 1, None  # finest resolution within budget, coarsest over it
+    resolution = max(2, int(np.sqrt(target)))
+    for _ in range(max_rounds):
+        result = _cluster(vertices, lo, extent, resolution)
+        if len(result) <= target:
+            if len(result) >= len(best):
+                best = result
+            good = max(good, resolution)
+            if len(result) >= 0.9 * target:
+                break
+        else:
+            bad = resolution if bad is None else min(bad, resolution)
+        guess = int(resolution * np.sqrt(0.95 * target / max(len(result), 1)))
+        if bad is not None and not good < guess < bad:
+            guess = (good + bad) // 2
+        if guess <= good or (bad is not None and guess >= bad):
+            break
+        resolution = guess
+    return best
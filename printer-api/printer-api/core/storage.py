@@ -0,0 +1,168 @@
+"""Content-addressed storage for uploaded STL files.
+
+An upload is stored under the SHA-256 of its bytes
+(``stl/ad/adcef9….stl``) rather than under its file name, so identical
+uploads share one blob and one set of derived files (compressed variants,
+LODs, compact meshes). A blob never changes once written, so URLs naming it
+can be cached forever. It is deleted together with its derived files once
+no printable refers to it any more (``release``). Upload workers store blobs
+from other processes before any printable refers to them, so they keep a
+hard link that ``restore`` puts back if the blob was released meanwhile.
+
+Names from before content addressing are still served; ingest moves them
+into the store on the next save.
+"""
+
+import fcntl
+import glob
+import hashlib
+import os
+import posixpath
+import re
+import threading
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from .derived import write_atomic
+
+_BLOB_RE = re.compile(r"(?:^|/)([0-9a-f]{2})/(\1[0-9a-f]{62})(\.\w+)?$")
+
+# Serializes "is it stored?" / "is it still used?" checks within a process;
+# _locked extends that to other processes using the same store
+_lock = threading.Lock()
+
+
+def blob_digest(name: str | None) -> str | None:
+    """The hex digest a stored name is addressed by, or ``None``."""
+    match = _BLOB_RE.search(name or "")
+    return match.group(2) if match else None
+
+
+def content_digest(name: str, path: str) -> str:
+    """Digest identifying the content of stored file ``name`` at ``path``."""
+    from .downloads import file_etag
+
+    return blob_digest(name) or file_etag(path).strip('"')
+
+
+def blob_name(directory: str, digest: str, ext: str = ".stl") -> str:
+    return posixpath.join(directory, digest[:2], digest + ext)
+
+
+def original_path(path: str) -> str:
+    """Where the untouched upload is kept when ``STL_KEEP_ORIGINAL`` is set."""
+    return os.path.join(os.path.dirname(path), "originals", os.path.basename(path))
+
+
+@contextmanager
+def _locked(storage):
+    with _lock:
+        os.makedirs(storage.location, exist_ok=True)
+        with open(os.path.join(storage.location, ".lock"), "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+
+def _copy(content, path: str) -> None:
+    with open(path, "wb") as f:
+        for chunk in content.chunks():
+            f.write(chunk)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names each file by the hash of its content.
+
+    Saving content that is already stored writes nothing and returns the
+    existing name.
+    """
+
+    def _blob_name(self, name: str, digest: str) -> str:
+        directory, basename = posixpath.split(name)
+        if blob_digest(name):
+            # Re-storing a blob (e.g. transcoded): keep the top directory
+            directory = posixpath.dirname(directory)
+        return blob_name(directory, digest, os.path.splitext(basename)[1].lower())
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self._blob_name(name, digest.hexdigest())
+        with _locked(self):
+            if not self.exists(name):
+                path = self.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_atomic(path, lambda tmp: _copy(content, tmp))
+        return name
+
+    def save_file(self, path: str, name: str, keep: str | None = None) -> str:
+        """Move local file ``path`` into the store; returns its stored name.
+
+        Unlike ``save`` the bytes aren't copied, so ``path`` must be on the
+        same file system as the store. ``keep`` is a path to hard-link the
+        stored bytes to, for ``restore``.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        name = self._blob_name(name, digest.hexdigest())
+        if keep:
+            os.link(path, keep)
+        with _locked(self):
+            target = self.path(name)
+            if os.path.exists(target):
+                os.unlink(path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.chmod(path, self.file_permissions_mode or 0o644)
+                os.replace(path, target)
+        return name
+
+
+stl_storage = ContentAddressedStorage()
+
+
+def release(name: str, storage=stl_storage) -> bool:
+    """Delete blob ``name`` and its derived files if no printable uses it.
+
+    Files stored under their upload name are never deleted. Returns whether
+    the blob was removed.
+    """
+    from .models import Printable
+
+    if blob_digest(name) is None:
+        return False
+    with _locked(storage):
+        if Printable.objects.filter(stl=name).exists():
+            return False
+        path = storage.path(name)
+        original = original_path(path)
+        for leftover in [*glob.glob(glob.escape(path) + ".*"), original, path]:
+            try:
+                os.unlink(leftover)
+            except FileNotFoundError:
+                pass
+    return True
+
+
+def restore(name: str, kept: str, storage=stl_storage) -> bool:
+    """Put blob ``name`` back from ``kept`` if a ``release`` removed it.
+
+    ``kept`` is the hard link made by ``save_file``; call this once a
+    printable refers to ``name``. Returns whether the blob was missing (its
+    derived files are then gone too).
+    """
+    with _locked(storage):
+        path = storage.path(name)
+        if os.path.exists(path):
+            os.unlink(kept)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(kept, path)
+        return True
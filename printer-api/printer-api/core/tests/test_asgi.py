@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from asgiref.testing import ApplicationCommunicator
+from django.test import AsyncRequestFactory
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from api.asgi import application
+from core import downloads, views
+from core.fleet import fleet
+from core.heartbeat import heartbeats
+from core.models import Printable
+
+
+class AsgiRoutingTests(SimpleTestCase):
+    async def _request(self, method, path, body=b""):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"content-type", b"application/json"),
+                (b"origin", b"http://localhost:3000"),
+            ],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80),
+        }
+        app = ApplicationCommunicator(application, scope)
+        await app.send_input({"type": "http.request", "body": body})
+        start = await app.receive_output(5)
+        await app.receive_output(5)  # body
+        return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}
+
+    async def test_api_skips_sync_middleware(self):
+        status, headers = await self._request("POST", "/api/printers/ping", b"{bad")
+        self.assertEqual(status, 400)
+        self.assertEqual(
+            headers["Access-Control-Allow-Origin"], "http://localhost:3000"
+        )
+        self.assertNotIn("X-Frame-Options", headers)
+
+        # Everything else still gets the full stack
+        status, headers = await self._request("GET", "/not-an-api-path")
+        self.assertEqual(status, 404)
+        self.assertEqual(headers["X-Frame-Options"], "DENY")
+
+
+class AsgiLifespanTests(TransactionTestCase):
+    async def test_lifespan_warms_the_fleet_and_runs_the_heartbeat_flusher(self):
+        fleet.reset()
+        app = ApplicationCommunicator(application, {"type": "lifespan"})
+        await app.send_input({"type": "lifespan.startup"})
+        self.assertEqual(
+            (await app.receive_output(5))["type"], "lifespan.startup.complete"
+        )
+        self.assertTrue(fleet._warm)
+        self.assertIsNotNone(heartbeats._flusher)
+        await app.send_input({"type": "lifespan.shutdown"})
+        self.assertEqual(
+            (await app.receive_output(5))["type"], "lifespan.shutdown.complete"
+        )
+        self.assertIsNone(heartbeats._flusher)
+
+
+class AsgiStreamingTests(TransactionTestCase):
+    @override_settings(PRINTABLES_STREAM_THRESHOLD=2, PRINTABLES_STREAM_CHUNK=2)
+    async def test_large_printable_pages_stream_chunk_by_chunk(self):
+        ids = [(await Printable.objects.acreate(name=f"P{i}")).id for i in range(6)]
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": "/api/printables",
+            "raw_path": b"/api/printables",
+            "query_string": f"limit=5&fields=id&cursor={ids[0] - 1}".encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80),
+        }
+        # Later chunks are only read once the first rows reached the client;
+        # a server that drains the iterator before sending would stall here
+        first_sent = threading.Event()
+        read_chunk = views._printables_chunk
+
+        def gated_chunk(*args):
+            if not args[-1]:
+                first_sent.wait(5)
+            return read_chunk(*args)
+
+        with mock.patch("core.views._printables_chunk", gated_chunk):
+            app = ApplicationCommunicator(application, scope)
+            await app.send_input({"type": "http.request", "body": b""})
+            self.assertEqual((await app.receive_output(5))["status"], 200)
+
+            chunks = []
+            while True:
+                message = await app.receive_output(1)
+                chunks.append(message.get("body", b""))
+                if b'"id"' in chunks[-1]:
+                    first_sent.set()
+                if not message.get("more_body"):
+                    break
+        self.assertTrue(first_sent.is_set())
+        body = json.loads(b"".join(chunks))
+        self.assertEqual(body["printables"], [{"id": i} for i in ids[:5]])
+        self.assertEqual(body["next_cursor"], ids[4])
+
+
+class AsgiDownloadTests(SimpleTestCase):
+    async def test_files_are_read_chunk_by_chunk(self):
+        content = bytes(range(256)) * 64
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "part.stl")
+            with open(path, "wb") as f:
+                f.write(content)
+
+            factory = AsyncRequestFactory()
+            with mock.patch.object(downloads, "_CHUNK_SIZE", 4096):
+                for headers, status, expected in (
+                    ({}, 200, content),
+                    ({"Range": "bytes=100-9999"}, 206, content[100:10000]),
+                ):
+                    request = factory.get("/part.stl", headers=headers)
+                    response = downloads.serve_file(
+                        request, path, "part.stl", "part.stl"
+                    )
+                    self.assertEqual(response.status_code, status)
+                    # Served as is by the ASGI handler, not drained into a list
+                    self.assertTrue(response.is_async)
+                    chunks = [c async for c in response.streaming_content]
+                    self.assertGreater(len(chunks), 1)
+                    self.assertEqual(b"".join(chunks), expected)
+                    self.assertEqual(
+                        response.headers["Content-Length"], str(len(expected))
+                    )
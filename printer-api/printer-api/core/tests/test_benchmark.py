@@ -0,0 +1,117 @@
+from unittest import skipUnless
+import asyncio
+import importlib.util
+import random
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from core import benchmark
+from core.models import Printable
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentiles(self):
+        result = benchmark.percentiles([i / 1000 for i in range(1, 101)], 1000)
+        self.assertEqual(result["p50"], 51)
+        self.assertEqual(result["p95"], 96)
+        self.assertEqual(result["p99"], 100)
+        self.assertAlmostEqual(result["mean"], 50.5)
+        self.assertIsNone(benchmark.percentiles([])["p99"])
+
+    def test_endpoint_name(self):
+        self.assertEqual(benchmark.endpoint_name("/api/printers/ping"), "printer_ping")
+        self.assertEqual(
+            benchmark.endpoint_name("/api/orders/7?since=1"), "order_status"
+        )
+        self.assertIsNone(benchmark.endpoint_name("/nope"))
+
+    async def test_virtual_printer_keeps_job_until_completion_is_reported(self):
+        mock = benchmark.mock_module("fleet")
+        answers = [(0, {}), (503, {}), (200, {})]
+
+        class Pool:
+            async def request(self, method, path, payload):
+                return answers.pop(0)
+
+        printer = mock.VirtualPrinter(
+            "P",
+            1,
+            Pool(),
+            mock.Stats(),
+            mock.FleetConfig(interval=0.02, backoff_max=0.04),
+            random.Random(1),
+        )
+        now = asyncio.get_running_loop().time()
+        printer.job_id, printer.job_started, printer.job_ends = 7, now - 1, now
+
+        await printer.complete()
+        self.assertEqual(printer.job_id, 7)
+        self.assertEqual(printer.ping()["status"], "printing")
+        # Not again until the backoff is over
+        await printer.complete()
+        self.assertEqual(len(answers), 2)
+
+        for left in (1, 0):
+            loop = asyncio.get_running_loop()
+            await asyncio.sleep(printer.complete_retry_at - loop.time() + 0.001)
+            await printer.complete()
+            self.assertEqual(len(answers), left)
+        self.assertIsNone(printer.job_id)
+        self.assertEqual(printer.stats.total["jobs_completed"], 1)
+
+
+@skipUnless(importlib.util.find_spec("uvicorn"), "needs the asgi extra")
+class BenchmarkRunTests(TransactionTestCase):
+    async def _run(self, **options):
+        mock = benchmark.mock_module("fleet")
+        printable = await Printable.objects.acreate(name="Cube")
+        config = mock.FleetConfig(
+            printers=3,
+            interval=0.1,
+            jitter=0,
+            adaptive=False,
+            print_time=(0.2, 0.3),
+            seed=1,
+            **options,
+        )
+        return await benchmark.run(
+            config,
+            order_rate=300,
+            printable_ids=[printable.id],
+            duration=1.5,
+            warmup=0.3,
+            status_interval=0.1,
+        )
+
+    async def test_run(self):
+        run = await self._run()
+        self.assertEqual(run["printers"], 3)
+        for name in benchmark.ENDPOINTS:
+            if name == "printer_ping_batch":
+                continue
+            endpoint = run["endpoints"][name]
+            self.assertGreater(endpoint["requests"], 0, name)
+            self.assertEqual(endpoint["errors"], 0, name)
+            self.assertGreaterEqual(endpoint["queries_per_request"], 0, name)
+        self.assertEqual(run["endpoints"]["create_order"]["queries_per_request"], 1)
+        self.assertGreater(run["queue_wait"]["orders"], 0)
+        self.assertGreater(run["jobs_completed"], 0)
+
+    async def test_run_through_gateways(self):
+        run = await self._run(gateway=2)
+        endpoints = run["endpoints"]
+        self.assertEqual(endpoints["printer_ping"]["requests"], 0)
+        # Two gateways ping for three printers
+        batches = endpoints["printer_ping_batch"]["requests"]
+        self.assertGreater(batches, 0)
+        self.assertEqual(endpoints["printer_ping_batch"]["errors"], 0)
+        self.assertGreater(run["pings_per_second"] * run["seconds"], batches)
+        self.assertGreater(run["jobs_completed"], 0)
+
+    async def test_run_bulk(self):
+        printable = await Printable.objects.acreate(name="Cube")
+        run = await benchmark.run_bulk(50, 2, [printable.id])
+        self.assertEqual(run["orders_created"], 100)
+        self.assertEqual(run["errors"], 0)
+        self.assertGreater(run["orders_per_second"], 0)
+        self.assertLessEqual(run["queries_per_request"], 5)
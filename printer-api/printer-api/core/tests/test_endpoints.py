@@ -1,8 +1,36 @@
-from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.base import ContentFile
-from core.models import Printable, Order, Printer
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from core import stl
+from core.models import Printable, Order, Printer, ProgressSample, Upload
+from core.progress import job_progress
+from core.catalog import catalog
+from core.dispatch import dispatcher
+from core.events import order_events, order_version
+from core.fleet import fleet
+from core.heartbeat import heartbeats
+from core import mesh, thumbnails, uploads
+from core.lod import lod_path
+from core.pacing import next_ping_in
+from core.storage import blob_digest, blob_name, release
+from core.tests.test_stl import binary_stl, uv_sphere
+from asgiref.sync import sync_to_async
+from concurrent.futures import Future
+from datetime import timedelta
 from tempfile import TemporaryDirectory
+from unittest import mock
+import asyncio
+import glob
+import gzip
+import hashlib
 import json
+import math
+import os
+import struct
+import time
 
 
 class ApiEndpointsTests(TestCase):
@@ -24,6 +52,12 @@ class ApiEndpointsTests(TestCase):
         Printable.objects.all().delete()
         Order.objects.all().delete()
         Printer.objects.all().delete()
+        heartbeats.reset()
+        fleet.reset()
+        dispatcher.reset()
+        order_events.reset()
+        job_progress.reset()
+        catalog.invalidate()
 
     def _make_printable(
         self, name="Cube",with_stl=False, color=""
@@ -74,6 +108,111 @@ class ApiEndpointsTests(TestCase):
         resp = self.client.get("/api/printables/999")
         self.assertEqual(resp.status_code, 404)
 
+    def test_printables_cached_with_etag(self):
+        p = self._make_printable(name="Red Cube", color="red")
+
+        for path in ("/api/printables", f"/api/printables/{p.id}"):
+            resp = self.client.get(path)
+            self.assertEqual(resp.status_code, 200)
+            etag = resp.headers["ETag"]
+
+            # Served from the cache, and revalidated without a body
+            with self.assertNumQueries(0):
+                resp = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.headers["ETag"], etag)
+
+        # Saving a printable invalidates every cached response
+        p.name = "Crimson Cube"
+        p.save()
+        resp = self.client.get(f"/api/printables/{p.id}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["name"], "Crimson Cube")
+        self.assertNotEqual(resp.headers["ETag"], etag)
+
+    def test_printables_keyset_pagination_and_fields(self):
+        ids = [self._make_printable(name=f"P{i}", color="red").id for i in range(5)]
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = self.client.get("/api/printables", params).json()
+            seen += [p["id"] for p in page["printables"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids)
+
+        resp = self.client.get("/api/printables", {"fields": "id,name", "limit": 1})
+        self.assertEqual(resp.json()["printables"], [{"id": ids[0], "name": "P0"}])
+        self.assertEqual(resp.json()["next_cursor"], ids[0])
+
+        for params in ({"fields": "id,secret"}, {"limit": 0}, {"cursor": "x"}):
+            resp = self.client.get("/api/printables", params)
+            self.assertEqual(resp.status_code, 400)
+
+    @override_settings(PRINTABLES_STREAM_THRESHOLD=2)
+    def test_printables_large_pages_are_streamed(self):
+        ids = [self._make_printable(name=f"P{i}").id for i in range(4)]
+        resp = self.client.get("/api/printables", {"limit": 3, "fields": "id"})
+        self.assertTrue(resp.streaming)
+        body = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual(body["printables"], [{"id": i} for i in ids[:3]])
+        self.assertEqual(body["next_cursor"], ids[2])
+
+        resp = self.client.get("/api/printables", {"limit": 5, "cursor": ids[1]})
+        body = json.loads(b"".join(resp.streaming_content))
+        self.assertEqual([p["id"] for p in body["printables"]], ids[2:])
+        self.assertIsNone(body["next_cursor"])
+
+    def test_printable_geometry_extracted_on_save(self):
+        p = Printable.objects.create(name="Cube", color="red")
+        cube = os.path.join(settings.BASE_DIR, "media", "stl", "red-cube.stl")
+        with open(cube, "rb") as f:
+            p.stl.save("cube.stl", ContentFile(f.read()))
+
+        detail = self.client.get(f"/api/printables/{p.id}").json()
+        self.assertEqual(detail["triangle_count"], 12)
+        self.assertEqual(detail["dimensions"], {"x": 10.0, "y": 10.0, "z": 10.0})
+        self.assertAlmostEqual(detail["volume"], 1000.0)
+
+        # Served from the indexed columns, not by parsing the STL per request
+        catalog.invalidate()
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/printables", {"fields": "id,dimensions"})
+        self.assertEqual(resp.json()["printables"][0]["dimensions"]["z"], 10.0)
+
+    def test_printable_save_reprocesses_only_what_changed(self):
+        p = self._make_printable(name="A", with_stl=True, color="red")
+        with mock.patch("core.signals.process_printable") as process, mock.patch(
+            "core.signals.refresh_thumbnail"
+        ) as refresh:
+            # A full save (as the admin does) that doesn't touch the STL
+            p.name = "B"
+            p.save()
+            process.assert_not_called()
+            refresh.assert_not_called()
+
+            p.color = "blue"
+            p.save()
+            process.assert_not_called()
+            refresh.assert_called_once_with(p)
+
+            p.stl.save("other.stl", ContentFile(b"solid other\nendsolid\n"))
+            process.assert_called_once_with(p)
+
+    def test_printable_stl_downloads_under_its_uploaded_name(self):
+        p = Printable.objects.create(name="My Part")
+        p.stl.save("my part.stl", ContentFile(b"solid test\nendsolid\n"))
+        self.assertIsNotNone(blob_digest(p.stl.name))
+        resp = self.client.get(f"/api/printables/{p.id}/stl")
+        self.assertIn('filename="my part.stl"', resp.headers["Content-Disposition"])
+
+        # Without one, the name is made from the printable's
+        Printable.objects.filter(pk=p.pk).update(stl_filename="")
+        resp = self.client.get(f"/api/printables/{p.id}/stl")
+        self.assertIn('filename="my-part.stl"', resp.headers["Content-Disposition"])
+
     def test_printable_stl_download_and_404(self):
         p_with = self._make_printable(name="A", with_stl=True)
         p_without = self._make_printable(name="B", with_stl=False)
@@ -91,6 +230,431 @@ class ApiEndpointsTests(TestCase):
         resp = self.client.get("/api/printables/999/stl")
         self.assertEqual(resp.status_code, 404)
 
+    def test_printable_stl_ranges_and_conditional_get(self):
+        p = self._make_printable(name="A", with_stl=True)
+        url = f"/api/printables/{p.id}/stl"
+        with open(p.stl.path, "rb") as f:
+            content = f.read()
+
+        resp = self.client.get(url)
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        self.assertEqual(resp.headers["Accept-Ranges"], "bytes")
+        etag = resp.headers["ETag"]
+        # A blob's ETag is the digest it's stored under, not a rehash
+        self.assertEqual(etag, f'"{blob_digest(p.stl.name)}"')
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=6-9")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.headers["Content-Range"], f"bytes 6-9/{len(content)}")
+        self.assertEqual(b"".join(resp.streaming_content), content[6:10])
+        self.assertIn("attachment", resp.headers["Content-Disposition"])
+
+        # Resume with a suffix range, guarded by If-Range
+        resp = self.client.get(url, HTTP_RANGE="bytes=-4", HTTP_IF_RANGE=etag)
+        self.assertEqual(b"".join(resp.streaming_content), content[-4:])
+        resp = self.client.get(url, HTTP_RANGE="bytes=-4", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=100-")
+        self.assertEqual(resp.status_code, 416)
+
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        with override_settings(SENDFILE_BACKEND="x-accel-redirect"):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.headers["X-Accel-Redirect"], f"/protected-media/{p.stl.name}"
+        )
+        self.assertEqual(resp.content, b"")
+
+    @override_settings(STL_TRANSCODE_ASCII=False)
+    def test_printable_stl_precompressed_variants(self):
+        p = Printable.objects.create(name="Big")
+        content = b"solid big\n" + b"  facet normal 0 0 1\n" * 200 + b"endsolid\n"
+        p.stl.save("big.stl", ContentFile(content))
+        url = f"/api/printables/{p.id}/stl"
+
+        # Built on save, next to the original
+        self.assertTrue(os.path.exists(p.stl.path + ".gz"))
+
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="br, gzip;q=0.8")
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        body = b"".join(resp.streaming_content)
+        self.assertLess(len(body), len(content))
+        self.assertEqual(gzip.decompress(body), content)
+        gzip_etag = resp.headers["ETag"]
+
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        self.assertNotEqual(resp.headers["ETag"], gzip_etag)
+
+    @override_settings(STL_LOD_LEVELS={"low": 300, "mid": 3000})
+    def test_printable_stl_levels_of_detail(self):
+        p = Printable.objects.create(name="Sphere")
+        p.stl.save("sphere.stl", ContentFile(binary_stl(uv_sphere(40))))  # 6400
+        url = f"/api/printables/{p.id}/stl"
+
+        # Built on save, next to the original
+        for level in ("low", "mid"):
+            self.assertTrue(os.path.exists(lod_path(p.stl.path, level)))
+
+        sizes = {}
+        for level, budget in (("low", 300), ("mid", 3000), ("full", 6400)):
+            resp = self.client.get(url, {"lod": level})
+            self.assertEqual(resp.status_code, 200)
+            body = b"".join(resp.streaming_content)
+            (count,) = struct.unpack("<I", body[80:84])
+            self.assertLessEqual(count, budget)
+            sizes[level] = len(body)
+        self.assertLess(sizes["low"], sizes["mid"])
+        self.assertEqual(sizes["full"], os.path.getsize(p.stl.path))
+
+        resp = self.client.get(url, {"lod": "tiny"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error"]["code"], "BAD_REQUEST")
+
+        # A mesh within budget is served as is, without a file of its own
+        cube = self._make_printable(with_stl=True)
+        resp = self.client.get(f"/api/printables/{cube.id}/stl", {"lod": "low"})
+        with open(cube.stl.path, "rb") as f:
+            self.assertEqual(b"".join(resp.streaming_content), f.read())
+        self.assertFalse(os.path.exists(lod_path(cube.stl.path, "low")))
+
+    def test_printable_compact_mesh(self):
+        p = Printable.objects.create(name="Sphere")
+        p.stl.save("sphere.stl", ContentFile(binary_stl(uv_sphere(20))))
+        self.assertTrue(os.path.exists(mesh.mesh_path(p.stl.path)))
+
+        detail = self.client.get(f"/api/printables/{p.id}").json()
+        self.assertTrue(detail["mesh_url"].endswith(f"/api/printables/{p.id}/mesh"))
+
+        # The plain URL redirects to the current content-versioned one
+        resp = self.client.get(detail["mesh_url"])
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        versioned = resp.headers["Location"]
+        resp = self.client.get(versioned)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+        body = b"".join(resp.streaming_content)
+        self.assertEqual(body, mesh.encode(uv_sphere(20)))
+        self.assertLess(len(body), os.path.getsize(p.stl.path) / 3)
+
+        # A stale version goes to the new one once the STL changes
+        p.stl.save("sphere.stl", ContentFile(binary_stl(uv_sphere(10))))
+        resp = self.client.get(versioned)
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotEqual(resp.headers["Location"], versioned)
+
+        resp = self.client.get(f"/api/printables/{p.id}/mesh", {"lod": "tiny"})
+        self.assertEqual(resp.status_code, 400)
+        no_stl = self._make_printable()
+        resp = self.client.get(f"/api/printables/{no_stl.id}/mesh")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_printable_thumbnail(self):
+        p = Printable.objects.create(name="Sphere", color="red")
+        p.stl.save("sphere.stl", ContentFile(binary_stl(uv_sphere(20))))
+        self.assertEqual(len(os.listdir(thumbnails.cache_dir())), 1)
+
+        url = self.client.get(f"/api/printables/{p.id}").json()["thumbnail_url"]
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["Content-Type"], "image/png")
+        self.assertTrue(resp.headers["Content-Disposition"].startswith("inline"))
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertTrue(b"".join(resp.streaming_content).startswith(b"\x89PNG"))
+
+        # Without the current version it must be revalidated
+        resp = self.client.get(f"/api/printables/{p.id}/thumbnail", {"size": 128})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+
+        # Recoloring changes the URL
+        p.color = "blue"
+        p.save()
+        recolored = self.client.get(f"/api/printables/{p.id}").json()["thumbnail_url"]
+        self.assertNotEqual(recolored, url)
+        resp = self.client.get(url)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+
+        resp = self.client.get(f"/api/printables/{p.id}/thumbnail", {"size": 100})
+        self.assertEqual(resp.status_code, 400)
+        no_stl = self._make_printable()
+        self.assertIsNone(
+            self.client.get(f"/api/printables/{no_stl.id}").json()["thumbnail_url"]
+        )
+        resp = self.client.get(f"/api/printables/{no_stl.id}/thumbnail")
+        self.assertEqual(resp.status_code, 404)
+
+    def test_identical_uploads_share_one_blob(self):
+        content = binary_stl(uv_sphere(10))
+        digest = hashlib.sha256(content).hexdigest()
+        red = Printable.objects.create(name="Red", color="red")
+        red.stl.save("red.stl", ContentFile(content))
+        self.assertEqual(red.stl.name, f"stl/{digest[:2]}/{digest}.stl")
+
+        # The second upload reuses the blob and what was derived from it
+        blue = Printable.objects.create(name="Blue", color="blue")
+        with mock.patch("core.ingest.analyze") as analyze:
+            blue.stl.save("blue.stl", ContentFile(content))
+        analyze.assert_not_called()
+        self.assertEqual(blue.stl.name, red.stl.name)
+        self.assertEqual(blue.triangle_count, red.triangle_count)
+
+        detail = self.client.get(f"/api/printables/{blue.id}").json()
+        self.assertTrue(detail["stl_url"].endswith(f"/api/stl/{digest}"))
+        resp = self.client.get(detail["stl_url"])
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        self.assertIn("max-age=31536000", resp.headers["Cache-Control"])
+        for unknown in ("0" * 64, "not-a-hash"):
+            self.assertEqual(self.client.get(f"/api/stl/{unknown}").status_code, 404)
+
+        # Refcounted: the blob goes with the last printable using it
+        path = red.stl.path
+        with self.captureOnCommitCallbacks(execute=True):
+            red.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            blue.stl.save("other.stl", ContentFile(binary_stl(uv_sphere(5))))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + ".gz"))
+        self.assertEqual(self.client.get(f"/api/stl/{digest}").status_code, 404)
+
+        # An ASCII upload only leaves its binary form behind
+        cube = os.path.join(settings.BASE_DIR, "media", "stl", "red-cube.stl")
+        with open(cube, "rb") as f:
+            ascii_stl = f.read()
+        with self.captureOnCommitCallbacks(execute=True):
+            blue.stl.save("cube.stl", ContentFile(ascii_stl))
+        ascii_digest = hashlib.sha256(ascii_stl).hexdigest()
+        ascii_blob = os.path.join(
+            self._media_tmp.name, "stl", ascii_digest[:2], ascii_digest + ".stl"
+        )
+        self.assertFalse(os.path.exists(ascii_blob))
+        self.assertIsNotNone(blob_digest(blue.stl.name))
+
+    def test_ascii_stl_transcoded_to_binary_on_save(self):
+        cube = os.path.join(settings.BASE_DIR, "media", "stl", "red-cube.stl")
+        with open(cube, "rb") as f:
+            ascii_stl = f.read()
+
+        p = Printable.objects.create(name="Cube")
+        p.stl.save("cube.stl", ContentFile(ascii_stl))
+        self.assertEqual(stl.binary_triangle_count(p.stl.path), 12)
+        self.assertEqual(os.path.getsize(p.stl.path), 84 + 12 * 50)
+        self.assertEqual(stl.analyze(p.stl.path), stl.analyze(cube))
+
+        resp = self.client.get(f"/api/printables/{p.id}/stl")
+        self.assertEqual(len(b"".join(resp.streaming_content)), 84 + 12 * 50)
+        # Original not kept unless asked for
+        resp = self.client.get(f"/api/printables/{p.id}/stl", {"original": 1})
+        self.assertEqual(resp.status_code, 404)
+
+        with override_settings(STL_KEEP_ORIGINAL=True):
+            p.stl.save("kept.stl", ContentFile(ascii_stl))
+        resp = self.client.get(f"/api/printables/{p.id}/stl", {"original": 1})
+        self.assertEqual(b"".join(resp.streaming_content), ascii_stl)
+
+    # Uploads
+    def _start_upload(self, size, filename="part.stl"):
+        resp = self._post_json(
+            "/api/uploads", {"name": "Part", "filename": filename, "size": size}
+        )
+        self.assertEqual(resp.status_code, 201)
+        return resp.json()
+
+    def _put_chunk(self, upload_id, data, start, size):
+        return self.client.put(
+            f"/api/uploads/{upload_id}",
+            data=data,
+            content_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {start}-{start + len(data) - 1}/{size}"},
+        )
+
+    @override_settings(UPLOAD_PROCESS_WORKERS=0)
+    def test_resumable_upload(self):
+        content = binary_stl(uv_sphere(10))
+        size = len(content)
+        upload = self._start_upload(size)
+        upload_id = upload["upload_id"]
+        self.assertEqual(upload["offset"], 0)
+
+        # The printable exists right away, but can't be ordered yet
+        detail = self.client.get(f"/api/printables/{upload['printable_id']}").json()
+        self.assertEqual(detail["status"], "processing")
+        self.assertIsNone(detail["stl_url"])
+        resp = self._post_json(
+            "/api/orders", {"items": [{"printable_id": upload["printable_id"]}]}
+        )
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self._put_chunk(upload_id, content[:1000], 0, size)
+        self.assertEqual(resp.json()["offset"], 1000)
+        # A client that lost track of the offset is told where to resume
+        resp = self._put_chunk(upload_id, content[500:1500], 500, size)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()["offset"], 1000)
+        self.assertEqual(
+            self.client.get(f"/api/uploads/{upload_id}").json()["offset"], 1000
+        )
+        resp = self._put_chunk(upload_id, content[1000:], 1000, size)
+        self.assertEqual(resp.status_code, 202)
+
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "ready")
+        self.assertEqual(p.triangle_count, len(uv_sphere(10)))
+        self.assertEqual(blob_digest(p.stl.name), hashlib.sha256(content).hexdigest())
+        # Downloaded under the name it was uploaded as, not the blob's
+        resp = self.client.get(f"/api/printables/{p.id}/stl")
+        self.assertIn('filename="part.stl"', resp.headers["Content-Disposition"])
+        self.assertTrue(os.path.exists(mesh.mesh_path(p.stl.path)))
+        self.assertEqual(os.listdir(uploads.upload_dir()), [])
+        self.assertEqual(self.client.get(f"/api/uploads/{upload_id}").status_code, 404)
+
+    @override_settings(UPLOAD_PROCESS_WORKERS=0)
+    def test_upload_validation(self):
+        for payload in (
+            {"filename": "a.stl", "size": 10},
+            {"name": "A", "filename": "a.obj", "size": 10},
+            {"name": "A", "filename": "../a.stl", "size": 10},
+            {"name": "A", "filename": "a.stl", "size": 0},
+            {"name": "A", "filename": "a.stl", "size": 2 << 30},
+        ):
+            resp = self._post_json("/api/uploads", payload)
+            self.assertEqual(resp.status_code, 400, payload)
+
+        upload = self._start_upload(8)
+        resp = self.client.put(
+            f"/api/uploads/{upload['upload_id']}",
+            data=b"12345678",
+            content_type="application/octet-stream",
+        )
+        self.assertEqual(resp.status_code, 400)  # no Content-Range
+
+        # Not an STL: the printable is marked failed, with the reason
+        resp = self._put_chunk(upload["upload_id"], b"12345678", 0, 8)
+        self.assertEqual(resp.status_code, 202)
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "failed")
+        self.assertEqual(p.processing_error, "not an STL file")
+        self.assertFalse(p.stl)
+
+    @override_settings(UPLOAD_PROCESS_WORKERS=0)
+    def test_failed_upload_releases_its_blob(self):
+        content = binary_stl(uv_sphere(4))
+        digest = hashlib.sha256(content).hexdigest()
+        blob = os.path.join(self._media_tmp.name, blob_name("stl", digest))
+        crash = mock.patch.object(
+            uploads, "_process", side_effect=RuntimeError("renderer crashed")
+        )
+
+        # Inline, without a pool
+        upload = self._start_upload(len(content))
+        with crash:
+            resp = self._put_chunk(upload["upload_id"], content, 0, len(content))
+        self.assertEqual(resp.status_code, 202)
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "failed")
+        self.assertEqual(p.processing_error, "renderer crashed")
+        self.assertFalse(os.path.exists(blob))
+
+        # Through the pool's done callback
+        upload = self._start_upload(len(content))
+        with mock.patch.object(uploads, "submit"):
+            self._put_chunk(upload["upload_id"], content, 0, len(content))
+        job = uploads._job(Upload.objects.get(pk=upload["upload_id"]))
+        future = Future()
+        with crash:
+            try:
+                uploads.ingest_file(*job)
+            except uploads.IngestError as e:
+                future.set_exception(e)
+        self.assertTrue(os.path.exists(blob))
+        uploads._done(upload["upload_id"], future)
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "failed")
+        self.assertFalse(os.path.exists(blob))
+        self.assertFalse(Upload.objects.filter(pk=upload["upload_id"]).exists())
+
+    @override_settings(UPLOAD_PROCESS_WORKERS=0)
+    def test_upload_blob_released_before_finish_is_restored(self):
+        content = binary_stl(uv_sphere(4))
+        upload = self._start_upload(len(content))
+        with mock.patch.object(uploads, "submit"):
+            self._put_chunk(upload["upload_id"], content, 0, len(content))
+        job = uploads._job(Upload.objects.get(pk=upload["upload_id"]))
+        fields = uploads.ingest_file(*job)
+        blob = os.path.join(self._media_tmp.name, fields["stl"])
+        derived = glob.glob(glob.escape(blob) + ".*")
+        self.assertTrue(derived)
+
+        # Another printable's release sees no printable using the blob yet
+        self.assertTrue(release(fields["stl"]))
+        self.assertFalse(os.path.exists(blob))
+
+        uploads.finish(upload["upload_id"], fields)
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "ready")
+        with open(blob, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertCountEqual(glob.glob(glob.escape(blob) + ".*"), derived)
+        self.assertFalse(os.listdir(uploads.upload_dir()))
+
+    @override_settings(UPLOAD_PROCESS_WORKERS=0)
+    def test_lost_upload_job_is_resubmitted(self):
+        content = binary_stl(uv_sphere(4))
+        size = len(content)
+        upload = self._start_upload(size)
+        # The job is lost, e.g. the server restarted before it ran
+        with mock.patch.object(uploads, "submit"):
+            self._put_chunk(upload["upload_id"], content, 0, size)
+        p = Printable.objects.get(pk=upload["printable_id"])
+        self.assertEqual(p.status, "processing")
+
+        # Resuming from the end submits it again
+        resp = self.client.put(
+            f"/api/uploads/{upload['upload_id']}",
+            data=b"",
+            content_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {size}-{size}/{size}"},
+        )
+        self.assertEqual(resp.status_code, 202)
+        p.refresh_from_db()
+        self.assertEqual(p.status, "ready")
+        self.assertEqual(p.triangle_count, len(uv_sphere(4)))
+
+    def test_upload_ingest_runs_in_worker_process(self):
+        content = binary_stl(uv_sphere(4))
+        part = os.path.join(self._media_tmp.name, "upload.part")
+        with open(part, "wb") as f:
+            f.write(content)
+        with override_settings(UPLOAD_PROCESS_WORKERS=1):
+            executor = uploads.pool()
+        try:
+            fields = executor.submit(
+                uploads.ingest_file,
+                part,
+                "p.stl",
+                "red",
+                self._media_tmp.name,
+                True,
+                False,
+            ).result(timeout=60)
+        finally:
+            uploads.shutdown()
+        self.assertEqual(fields["triangle_count"], len(uv_sphere(4)))
+        self.assertFalse(os.path.exists(part))
+        self.assertTrue(
+            os.path.exists(os.path.join(self._media_tmp.name, fields["stl"]))
+        )
+
     # Orders
     def test_create_order_validation_and_success(self):
         p1 = self._make_printable(name="A")
@@ -120,6 +684,25 @@ class ApiEndpointsTests(TestCase):
         )
         self.assertEqual(resp.status_code, 400)
 
+        # First bad item wins, in item order
+        resp = self._post_json(
+            "/api/orders",
+            {
+                "items": [
+                    {"printable_id": p1.id, "qty": 1},
+                    {"printable_id": 999, "qty": 1},
+                    {"printable_id": p2.id, "qty": 0},
+                ]
+            },
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error"]["message"], "printable_id 999 not found")
+        resp = self._post_json(
+            "/api/orders",
+            {"items": [{"printable_id": p1.id, "qty": 1}, {"printable_id": "x"}]},
+        )
+        self.assertEqual(resp.json()["error"]["message"], "Invalid item")
+
         # Success
         resp = self._post_json(
             "/api/orders",
@@ -148,6 +731,93 @@ class ApiEndpointsTests(TestCase):
         self.assertEqual(resp.status_code, 404)
 
     # Printer flow
+    def _complete(self, order_id, printer_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self._post_json(
+                f"/api/jobs/{order_id}/complete", {"printer_id": printer_id}
+            )
+
+    async def test_order_status_long_poll(self):
+        order = await Order.objects.acreate(status="queued", items=[])
+        url = f"/api/orders/{order.id}"
+        state = (await self.async_client.get(url)).json()
+        self.assertEqual(state["status"], "queued")
+
+        # Nothing changes: the unchanged state comes back after the timeout
+        resp = await self.async_client.get(
+            url, {"since": state["version"], "timeout": "0.05"}
+        )
+        self.assertEqual(resp.json(), state)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        # A stale version is answered right away
+        resp = await self.async_client.get(url, {"since": 1})
+        self.assertEqual(resp.json(), state)
+
+        # The waiting poll is answered when a printer picks the order up
+        poll = asyncio.ensure_future(
+            self.async_client.get(url, {"since": state["version"]})
+        )
+        await asyncio.sleep(0.05)
+        ping = await sync_to_async(self._post_json)(
+            "/api/printers/ping", {"name": "P1", "status": "idle"}
+        )
+        resp = await asyncio.wait_for(poll, 5)
+        printing = resp.json()
+        self.assertEqual(printing["status"], "printing")
+        self.assertEqual(printing["assigned_printer_id"], ping.json()["printer_id"])
+        self.assertGreater(printing["version"], state["version"])
+        self.assertEqual(order_events.watchers(), 0)
+
+        resp = await self.async_client.get(url, {"since": "x"})
+        self.assertEqual(resp.status_code, 400)
+        resp = await self.async_client.get("/api/orders/999999", {"since": 1})
+        self.assertEqual(resp.status_code, 404)
+
+    async def test_order_status_event_stream(self):
+        order = await Order.objects.acreate(status="queued", items=[])
+        url = f"/api/orders/{order.id}/events"
+        resp = await self.async_client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["Content-Type"], "text/event-stream")
+        stream = aiter(resp.streaming_content)
+
+        async def next_event():
+            chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+            event_id, data = chunk.rstrip("\n").split("\n")
+            event = json.loads(data.removeprefix("data: "))
+            self.assertEqual(event_id, f"id: {event['version']}")
+            return event
+
+        self.assertEqual((await next_event())["status"], "queued")
+        ping = await sync_to_async(self._post_json)(
+            "/api/printers/ping", {"name": "P1", "status": "idle"}
+        )
+        self.assertEqual((await next_event())["status"], "printing")
+        await sync_to_async(self._complete)(order.id, ping.json()["printer_id"])
+        complete = await next_event()
+        self.assertEqual(complete["status"], "complete")
+        # The stream ends after a final status...
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(stream), 5)
+        # ...and a client resuming from it is told not to reconnect
+        resp = await self.async_client.get(
+            url, headers={"Last-Event-ID": str(complete["version"])}
+        )
+        self.assertEqual(resp.status_code, 204)
+
+    @override_settings(ORDER_EVENTS_KEEPALIVE=0.01)
+    async def test_order_status_event_stream_keepalive(self):
+        order = await Order.objects.acreate(status="queued", items=[])
+        resp = await self.async_client.get(
+            f"/api/orders/{order.id}/events",
+            headers={"Last-Event-ID": str(order_version(order.updated_at))},
+        )
+        stream = aiter(resp.streaming_content)
+        # Resumed at the current state: nothing to send but keep-alives
+        self.assertEqual(await asyncio.wait_for(anext(stream), 5), b": keepalive\n\n")
+        await stream.aclose()
+        self.assertEqual(order_events.watchers(), 0)
+
     def test_printer_ping_assigns_job_and_job_complete(self):
         # Prepare queued order
         p = self._make_printable(name="C")
@@ -196,6 +866,20 @@ class ApiEndpointsTests(TestCase):
         )
         self.assertEqual(resp.status_code, 400)
 
+        # A print can also end in failure
+        resp = self._post_json(
+            f"/api/jobs/{o2.id}/complete", {"printer_id": printer_id, "status": "done"}
+        )
+        self.assertEqual(resp.status_code, 400)
+        resp = self._post_json(
+            f"/api/jobs/{o2.id}/complete",
+            {"printer_id": printer_id, "status": "failed"},
+        )
+        self.assertEqual(resp.status_code, 200)
+        o2.refresh_from_db()
+        self.assertEqual(o2.status, "failed")
+        self.assertIsNone(Printer.objects.get(pk=printer_id).current_order_id)
+
     def test_printer_ping_invalid_json_and_methods(self):
         # Wrong method handling
         resp = self.client.get("/api/printers/ping")
@@ -206,3 +890,558 @@ class ApiEndpointsTests(TestCase):
             "/api/printers/ping", data="{bad}", content_type="application/json"
         )
         self.assertEqual(resp.status_code, 400)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_printer_ping_coalesces_heartbeats(self):
+        resp = self._post_json("/api/printers/ping", {"name": "P1", "status": "idle"})
+        printer_id = resp.json()["printer_id"]
+        first_ping = Printer.objects.get(pk=printer_id).last_ping_at
+        self.assertIsNotNone(first_ping)
+
+        # Repeated pings only touch the in-memory buffer
+        for _ in range(3):
+            resp = self._post_json(
+                "/api/printers/ping",
+                {"printer_id": printer_id, "name": "P1", "status": "idle"},
+            )
+            self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Printer.objects.get(pk=printer_id).last_ping_at, first_ping)
+        buffered = heartbeats.pending(printer_id)
+        self.assertGreater(buffered, first_ping)
+
+        stats = heartbeats.flush()
+        self.assertEqual(stats.pings, 3)
+        self.assertEqual(stats.rows_written, 1)
+        self.assertEqual(stats.writes_avoided, 2)
+        self.assertEqual(Printer.objects.get(pk=printer_id).last_ping_at, buffered)
+
+    def test_failed_heartbeat_flush_keeps_the_heartbeats(self):
+        resp = self._post_json("/api/printers/ping", {"name": "P1", "status": "idle"})
+        printer_id = resp.json()["printer_id"]
+        first_ping = Printer.objects.get(pk=printer_id).last_ping_at
+
+        locked = DatabaseError("database is locked")
+        with override_settings(HEARTBEAT_FLUSH_INTERVAL=0), mock.patch(
+            "django.db.models.query.QuerySet.bulk_update", side_effect=locked
+        ):
+            resp = self._post_json(
+                "/api/printers/ping",
+                {"printer_id": printer_id, "name": "P1", "status": "idle"},
+            )
+        # The ping is still answered, and the heartbeat waits for the next flush
+        self.assertEqual(resp.status_code, 200)
+        buffered = heartbeats.pending(printer_id)
+        self.assertGreater(buffered, first_ping)
+
+        self.assertEqual(heartbeats.flush().rows_written, 1)
+        self.assertEqual(Printer.objects.get(pk=printer_id).last_ping_at, buffered)
+
+    def test_deleted_order_frees_its_printer(self):
+        p = self._make_printable(name="C")
+        first, second = (
+            Order.objects.create(status="queued", items=[{"printable_id": p.id}])
+            for _ in range(2)
+        )
+        fleet.warm()  # as done on startup
+        resp = self._post_json("/api/printers/ping", {"name": "P1", "status": "idle"})
+        printer_id = resp.json()["printer_id"]
+        self.assertEqual(resp.json()["instruction"]["order_id"], first.id)
+
+        # SET_NULL clears the printer's order without saving the printer
+        first.delete()
+        self.assertIsNone(Printer.objects.get(pk=printer_id).current_order_id)
+        resp = self._post_json(
+            "/api/printers/ping",
+            {"printer_id": printer_id, "name": "P1", "status": "idle"},
+        )
+        self.assertEqual(resp.json()["instruction"]["order_id"], second.id)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_printer_ping_served_from_fleet_registry(self):
+        p = self._make_printable(name="C")
+        o = Order.objects.create(
+            status="queued", items=[{"printable_id": p.id, "qty": 1}]
+        )
+        fleet.warm()  # as done on startup
+        resp = self._post_json("/api/printers/ping", {"name": "P1", "status": "idle"})
+        printer_id = resp.json()["printer_id"]
+        self.assertEqual(resp.json()["instruction"]["order_id"], o.id)
+
+        # Steady-state printing heartbeat needs no queries at all
+        with self.assertNumQueries(0):
+            resp = self._post_json(
+                "/api/printers/ping",
+                {"printer_id": printer_id, "name": "P1", "status": "printing"},
+            )
+        self.assertEqual(resp.status_code, 200)
+
+        # State changes are written through to the database
+        printer = Printer.objects.get(pk=printer_id)
+        self.assertEqual(printer.status, "printing")
+        self.assertEqual(printer.current_order_id, o.id)
+
+        # Admin-style saves invalidate the cached entry
+        printer.name = "Renamed"
+        printer.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(fleet.get(printer_id).name, "Renamed")
+        self._post_json(f"/api/jobs/{o.id}/complete", {"printer_id": printer_id})
+        state = fleet.get(printer_id)
+        self.assertEqual(state.status, "idle")
+        self.assertIsNone(state.current_order_id)
+        printer.refresh_from_db()
+        self.assertEqual((printer.status, printer.current_order_id), ("idle", None))
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    async def test_concurrent_heartbeats_stay_on_the_event_loop(self):
+        await sync_to_async(fleet.warm)()
+        ids = []
+        for n in range(20):
+            resp = await self.async_client.post(
+                "/api/printers/ping",
+                {"name": f"P{n}", "status": "printing"},
+                content_type="application/json",
+            )
+            ids.append(resp.json()["printer_id"])
+
+        # Unchanged printers are answered without a thread or a query
+        with mock.patch("core.views.sync_to_async", side_effect=AssertionError):
+            responses = await asyncio.gather(
+                *(
+                    self.async_client.post(
+                        "/api/printers/ping",
+                        {"printer_id": pid, "name": f"P{n}", "status": "printing"},
+                        content_type="application/json",
+                    )
+                    for _ in range(5)
+                    for n, pid in enumerate(ids)
+                )
+            )
+        self.assertEqual([r.status_code for r in responses], [200] * 100)
+        self.assertTrue(all(heartbeats.pending(pid) for pid in ids))
+        self.assertEqual((await sync_to_async(heartbeats.flush)()).rows_written, 20)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600, PROGRESS_FLUSH_INTERVAL=3600)
+    def test_printer_progress_buffered_per_job(self):
+        o = Order.objects.create(status="queued", items=[])
+        fleet.warm()
+        body = self._post_json(
+            "/api/printers/ping", {"name": "P1", "status": "idle", "progress": 0}
+        ).json()
+        printer_id = body["printer_id"]
+        url = f"/api/orders/{o.id}/progress"
+        self.assertEqual(self.client.get(url).json()["progress"], None)
+
+        # Progress of a running job stays in memory, and so does its latest value
+        ping = {"printer_id": printer_id, "name": "P1", "status": "printing"}
+        self._post_json("/api/printers/ping", {**ping, "progress": 10})
+        with self.assertNumQueries(0):
+            for value in (25, 40, "bad", 140):
+                self._post_json("/api/printers/ping", {**ping, "progress": value})
+            latest = self.client.get(url, {"points": 0}).json()
+        self.assertEqual(latest["progress"], 40)
+        self.assertEqual(latest["history"], [])
+        self.assertFalse(ProgressSample.objects.exists())
+        history = self.client.get(url).json()["history"]
+        self.assertEqual([h["progress"] for h in history], [10, 25, 40])
+
+        # One flush stores it thinned; completing stores the final sample
+        self.assertEqual(job_progress.flush(), 1)
+        self._post_json(f"/api/jobs/{o.id}/complete", {"printer_id": printer_id})
+        self.assertEqual(ProgressSample.objects.filter(order=o).count(), 2)
+        self.assertIsNone(job_progress.latest(o.id))
+        body = self.client.get(url).json()
+        self.assertEqual(body["progress"], 100)
+        self.assertEqual([h["progress"] for h in body["history"]], [10, 100])
+
+        self.assertEqual(self.client.get(url, {"points": -1}).status_code, 400)
+        self.assertEqual(
+            self.client.get("/api/orders/999999/progress").status_code, 404
+        )
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600, PROGRESS_FLUSH_INTERVAL=3600)
+    def test_completed_job_progress_is_stored_without_more_pings(self):
+        done, failed = (Order.objects.create(status="queued", items=[]) for _ in "ab")
+        fleet.warm()
+        ids = []
+        for name, order in (("P1", done), ("P2", failed)):
+            body = self._post_json(
+                "/api/printers/ping", {"name": name, "status": "idle"}
+            ).json()
+            ids.append(body["printer_id"])
+            self._post_json(
+                "/api/printers/ping",
+                {
+                    "printer_id": body["printer_id"],
+                    "name": name,
+                    "status": "printing",
+                    "progress": 30,
+                },
+            )
+        self.assertFalse(ProgressSample.objects.exists())
+
+        # The fleet then goes idle: nothing but the completions comes in
+        self._post_json(f"/api/jobs/{done.id}/complete", {"printer_id": ids[0]})
+        self._post_json(
+            f"/api/jobs/{failed.id}/complete",
+            {"printer_id": ids[1], "status": "failed"},
+        )
+        for order, final in ((done, 100), (failed, 30)):
+            stored = ProgressSample.objects.filter(order=order).order_by("recorded_at")
+            self.assertEqual([s.progress for s in stored], [30, final])
+            self.assertIsNone(job_progress.latest(order.id))
+
+    @override_settings(PROGRESS_SAMPLE_INTERVAL=60)
+    def test_progress_flush_downsamples(self):
+        o = Order.objects.create(status="printing", items=[])
+        start = timezone.now() - timedelta(minutes=20)
+        # A 10 minute print reporting every 5 s, stalled halfway
+        for i in range(120):
+            value = min(i, 60) * 100 // 120
+            job_progress.record(o.id, start + timedelta(seconds=5 * i), value)
+            if i % 30 == 29:
+                job_progress.flush()
+        job_progress.finish(o.id, start + timedelta(minutes=10))
+        job_progress.flush()
+
+        rows = list(
+            ProgressSample.objects.filter(order=o)
+            .order_by("recorded_at")
+            .values_list("recorded_at", "progress")
+        )
+        # At most one row a minute, none while stalled, and the final one
+        self.assertLessEqual(len(rows), 7)
+        self.assertEqual(rows[0], (start, 0))
+        self.assertEqual(rows[-1][1], 100)
+        self.assertEqual(rows[-2][1], 50)
+        gaps = [b[0] - a[0] for a, b in zip(rows[:-2], rows[1:-1])]
+        self.assertTrue(all(gap >= timedelta(minutes=1) for gap in gaps))
+
+        body = self.client.get(f"/api/orders/{o.id}/progress", {"points": 3}).json()
+        self.assertEqual(len(body["history"]), 3)
+        self.assertEqual(body["history"][0]["progress"], 0)
+        self.assertEqual(body["history"][-1]["progress"], 100)
+
+    def test_dispatcher_hands_out_jobs_fifo(self):
+        p = self._make_printable(name="C")
+        first, skipped, last = (
+            Order.objects.create(
+                status="queued", items=[{"printable_id": p.id, "qty": n}]
+            )
+            for n in (1, 2, 3)
+        )
+        # Changed behind the dispatcher's back: its claim must not succeed
+        Order.objects.filter(pk=skipped.pk).update(status="failed")
+
+        assigned = []
+        for name in ("P1", "P2", "P3"):
+            body = self._post_json(
+                "/api/printers/ping", {"name": name, "status": "idle"}
+            ).json()
+            assigned.append(body.get("instruction", {}).get("order_id"))
+        self.assertEqual(assigned, [first.id, last.id, None])
+        self.assertEqual(Order.objects.get(pk=skipped.pk).status, "failed")
+
+    def test_claim_rolled_back_with_the_printer_update(self):
+        p = self._make_printable(name="C")
+        o = Order.objects.create(
+            status="queued", items=[{"printable_id": p.id, "qty": 1}]
+        )
+        printer_id = self._post_json(
+            "/api/printers/ping", {"name": "P1", "status": "printing"}
+        ).json()["printer_id"]
+        ping = {"printer_id": printer_id, "name": "P1", "status": "idle"}
+
+        for path, payload, method in (
+            ("/api/printers/ping", ping, "update"),
+            ("/api/printers/ping/batch", {"pings": [ping]}, "update_many"),
+        ):
+            with mock.patch.object(fleet, method, side_effect=DatabaseError("down")):
+                with self.assertRaises(DatabaseError):
+                    self._post_json(path, payload)
+            # Neither half of the claim stuck, and the order is handed out again
+            o.refresh_from_db()
+            self.assertEqual((o.status, o.assigned_printer_id), ("queued", None))
+            self.assertIsNone(Printer.objects.get(pk=printer_id).current_order_id)
+            self.assertEqual(len(dispatcher), 1)
+
+        body = self._post_json("/api/printers/ping", ping).json()
+        self.assertEqual(body["instruction"]["order_id"], o.id)
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_idle_ping_with_empty_queue_does_not_write(self):
+        fleet.warm()
+        body = self._post_json(
+            "/api/printers/ping", {"name": "P1", "status": "idle"}
+        ).json()
+        with self.assertNumQueries(0):
+            resp = self._post_json(
+                "/api/printers/ping",
+                {"printer_id": body["printer_id"], "name": "P1", "status": "idle"},
+            )
+        self.assertNotIn("instruction", resp.json())
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_printer_ping_batch(self):
+        p = self._make_printable(name="C")
+        first, skipped, last = (
+            Order.objects.create(
+                status="queued", items=[{"printable_id": p.id, "qty": n}]
+            )
+            for n in (1, 2, 3)
+        )
+        Order.objects.filter(pk=skipped.pk).update(status="failed")
+        fleet.warm()
+        busy = self._post_json(
+            "/api/printers/ping", {"name": "Busy", "status": "idle"}
+        ).json()["printer_id"]
+        idle = Printer.objects.create(name="Idle", status="idle").id
+
+        resp = self._post_json(
+            "/api/printers/ping/batch",
+            {
+                "pings": [
+                    {"printer_id": busy, "name": "Busy", "status": "printing"},
+                    {"name": "New", "status": "idle"},
+                    "not a ping",
+                    {"printer_id": idle, "name": "Idle", "status": "idle"},
+                    {"printer_id": idle, "name": "Idle", "status": "idle"},
+                ]
+            },
+        )
+        self.assertEqual(resp.status_code, 200)
+        results = resp.json()["results"]
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0]["printer_id"], busy)
+        self.assertNotIn("instruction", results[0])
+        new = results[1]["printer_id"]
+        self.assertEqual(results[1]["instruction"]["order_id"], last.id)
+        self.assertEqual(results[2]["error"]["code"], "BAD_REQUEST")
+        # The queue ran dry: the idle printer gets nothing, once
+        self.assertEqual([r["printer_id"] for r in results[3:]], [idle] * 2)
+        self.assertFalse(any("instruction" in r for r in results[3:]))
+        self.assertTrue(all(r["next_ping_in"] > 0 for r in results if "error" not in r))
+
+        self.assertEqual(Order.objects.get(pk=first.pk).assigned_printer_id, busy)
+        self.assertEqual(Order.objects.get(pk=first.pk).status, "printing")
+        self.assertEqual(Order.objects.get(pk=last.pk).assigned_printer_id, new)
+        printer = Printer.objects.get(pk=new)
+        self.assertEqual(
+            (printer.name, printer.status, printer.current_order_id),
+            ("New", "printing", last.id),
+        )
+        self.assertEqual(fleet.get(busy).status, "printing")
+        self.assertEqual(heartbeats.pending(idle), heartbeats.pending(busy))
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_printer_ping_batch_is_set_based(self):
+        p = self._make_printable(name="C")
+        fleet.warm()
+
+        def batch(n):
+            Order.objects.bulk_create(
+                Order(status="queued", items=[{"printable_id": p.id, "qty": 1}])
+                for _ in range(n)
+            )
+            dispatcher.reset()
+            pings = [{"name": f"P{i}", "status": "idle"} for i in range(n)]
+            return lambda: self._post_json("/api/printers/ping/batch", {"pings": pings})
+
+        # Registering printers and handing them jobs costs the same for 2 as
+        # for 50: reading the queue, an INSERT, reading and claiming the
+        # orders and an UPDATE (plus a savepoint)
+        for n in (2, 50):
+            send = batch(n)
+            with self.assertNumQueries(7):
+                results = send().json()["results"]
+        self.assertEqual(sum("instruction" in r for r in results), 50)
+
+        # Known printers that only checked in need no queries at all
+        pings = [
+            {"printer_id": r["printer_id"], "name": f"P{i}", "status": "printing"}
+            for i, r in enumerate(results)
+        ]
+        with self.assertNumQueries(0):
+            resp = self._post_json("/api/printers/ping/batch", {"pings": pings})
+        self.assertEqual(len(resp.json()["results"]), 50)
+
+    @override_settings(
+        PING_INTERVAL_SOON=2,
+        PING_INTERVAL_PRINTING=5,
+        PING_INTERVAL_IDLE=15,
+        PING_INTERVAL_MAX=20,
+        PING_RATE_TARGET=500,
+        PING_JITTER=0,
+    )
+    def test_printer_ping_paces_next_ping(self):
+        p = self._make_printable(name="C")
+        fleet.warm()
+
+        def ping(name, status, printer_id=None):
+            return self._post_json(
+                "/api/printers/ping",
+                {"printer_id": printer_id, "name": name, "status": status},
+            ).json()
+
+        # Nothing to do: come back later
+        idle = ping("P1", "idle")
+        self.assertEqual(idle["next_ping_in"], 15)
+        for _ in range(2):
+            self._post_json(
+                "/api/orders", {"items": [{"printable_id": p.id, "qty": 1}]}
+            )
+        # Handed a job: report progress at the printing pace
+        body = ping("P2", "idle")
+        self.assertIn("instruction", body)
+        self.assertEqual(body["next_ping_in"], 5)
+        self.assertEqual(ping("P2", "printing", body["printer_id"])["next_ping_in"], 5)
+        # Idle while an order is waiting: come back soon
+        self.assertEqual(len(dispatcher), 1)
+        self.assertEqual(next_ping_in(idle["printer_id"], "idle", timezone.now()), 2)
+
+        # A big fleet is slowed down to the target rate, up to a point
+        with override_settings(PING_RATE_TARGET=0.5):
+            self.assertEqual(
+                ping("P2", "printing", body["printer_id"])["next_ping_in"], 5
+            )
+            fleet.create_many([(f"X{i}", "idle") for i in range(18)], timezone.now())
+            body = ping("P2", "printing", body["printer_id"])
+            self.assertEqual(body["next_ping_in"], 20)
+
+        # Jitter is spread per printer and per moment, the same for both
+        now = timezone.now()
+        with override_settings(PING_JITTER=0.2):
+            delays = {next_ping_in(i, "printing", now) for i in range(50)}
+            self.assertGreater(len(delays), 10)
+            self.assertTrue(all(4 <= d <= 6 for d in delays))
+            self.assertEqual(
+                next_ping_in(7, "printing", now), next_ping_in(7, "printing", now)
+            )
+
+    def test_printer_ping_batch_validation(self):
+        resp = self.client.get("/api/printers/ping/batch")
+        self.assertEqual(resp.status_code, 405)
+        resp = self.client.post(
+            "/api/printers/ping/batch", data="{bad}", content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 400)
+        for payload in ({}, {"pings": []}, {"pings": {"name": "P1"}}):
+            resp = self._post_json("/api/printers/ping/batch", payload)
+            self.assertEqual(resp.status_code, 400)
+        with override_settings(PING_BATCH_MAX=2):
+            resp = self._post_json(
+                "/api/printers/ping/batch", {"pings": [{"name": "P"}] * 3}
+            )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Printer.objects.count(), 0)
+
+    def test_create_order_validates_items_in_one_lookup(self):
+        printables = [self._make_printable(name=f"P{i}") for i in range(50)]
+        items = [{"printable_id": p.id, "qty": 1} for p in printables] * 4
+
+        # Cold catalog cache: one id lookup plus the insert
+        with self.assertNumQueries(2):
+            resp = self._post_json("/api/orders", {"items": items})
+        self.assertEqual(resp.status_code, 201)
+
+        # Warm cache: only the insert
+        with self.assertNumQueries(1):
+            resp = self._post_json("/api/orders", {"items": items})
+        self.assertEqual(resp.status_code, 201)
+
+        # Saved and deleted printables update the cached ids, not reload them
+        p = self._make_printable(name="New")
+        with self.assertNumQueries(1):
+            resp = self._post_json("/api/orders", {"items": [{"printable_id": p.id}]})
+        self.assertEqual(resp.status_code, 201)
+        p.status = "failed"
+        p.save()
+        printables[0].delete()
+        for pid in (p.id, printables[0].id):
+            resp = self._post_json("/api/orders", {"items": [{"printable_id": pid}]})
+            self.assertEqual(resp.status_code, 400)
+        self.assertIsNotNone(catalog._ids)
+
+    def test_create_orders_bulk(self):
+        p1 = self._make_printable(name="A")
+        p2 = self._make_printable(name="B")
+
+        resp = self._post_json("/api/orders/bulk", {"orders": []})
+        self.assertEqual(resp.status_code, 400)
+
+        orders = [
+            {"items": [{"printable_id": p1.id, "qty": 1}]},
+            {"items": []},
+            {"items": [{"printable_id": p2.id, "qty": 2}, {"printable_id": 999}]},
+            {"items": [{"printable_id": p2.id, "qty": 3}]},
+        ]
+        # Catalog ids, one lookup for the unknown id, one INSERT in a savepoint
+        with self.assertNumQueries(5):
+            resp = self._post_json("/api/orders/bulk", {"orders": orders})
+        self.assertEqual(resp.status_code, 201)
+        results = resp.json()["orders"]
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[1]["error"]["message"], "items[] required")
+        self.assertEqual(results[2]["error"]["message"], "printable_id 999 not found")
+        first, last = results[0]["order_id"], results[3]["order_id"]
+        self.assertEqual(
+            Order.objects.get(pk=last).items, [{"printable_id": p2.id, "qty": 3}]
+        )
+
+        # Created orders are dispatched in FIFO order like single orders
+        body = self._post_json(
+            "/api/printers/ping", {"name": "P1", "status": "idle"}
+        ).json()
+        self.assertEqual(body["instruction"]["order_id"], first)
+
+        resp = self._post_json("/api/orders/bulk", {"orders": [{"items": []}]})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_create_orders_bulk_query_count_per_insert_batch(self):
+        p = self._make_printable(name="A")
+        self._post_json("/api/orders/bulk", {"orders": [{"items": []}]})  # catalog
+        fields = [f for f in Order._meta.concrete_fields if not f.primary_key]
+
+        def queries(n):
+            orders = [{"items": [{"printable_id": p.id, "qty": 1}]}] * n
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self._post_json("/api/orders/bulk", {"orders": orders})
+            self.assertEqual(resp.status_code, 201)
+            inserts = sum(q["sql"].startswith("INSERT") for q in ctx.captured_queries)
+            per_insert = connection.ops.bulk_batch_size(fields, [None] * n)
+            self.assertEqual(inserts, math.ceil(n / per_insert))
+            return len(ctx.captured_queries) - inserts
+
+        # Only the INSERTs grow with the batch, one per database batch
+        self.assertEqual(queries(10), queries(5000))
+
+class HeartbeatFlushTests(TransactionTestCase):
+    def setUp(self) -> None:
+        heartbeats.reset()
+        self.printer = Printer.objects.create(name="P1")
+
+    def tearDown(self) -> None:
+        heartbeats.stop()
+
+    def _last_ping_at(self):
+        return Printer.objects.get(pk=self.printer.pk).last_ping_at
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=0.05)
+    def test_flushed_without_further_pings(self):
+        at = timezone.now()
+        heartbeats.buffer(self.printer.pk, at)
+        heartbeats.start()
+        deadline = time.monotonic() + 5
+        while self._last_ping_at() != at and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._last_ping_at(), at)
+        self.assertIsNone(heartbeats.pending(self.printer.pk))
+
+    @override_settings(HEARTBEAT_FLUSH_INTERVAL=3600)
+    def test_flushed_on_stop(self):
+        heartbeats.start()
+        at = timezone.now()
+        heartbeats.buffer(self.printer.pk, at)
+        self.assertIsNone(self._last_ping_at())
+        heartbeats.stop()
+        self.assertEqual(self._last_ping_at(), at)
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Order, Printer, ProgressSample
+
+# Planner statistics for a database holding months of history: a million
+# orders spread over six statuses, a fleet of 5k printers and their
+# progress samples.
+# Rows: (table, index, sqlite_stat1 "stat" column)
+FLEET_STATS = [
+    ("core_order", None, "1000000"),
+    ("core_order", "order_status_created_idx", "1000000 166667 2"),
+    ("core_order", "order_created_idx", "1000000 2"),
+    ("core_order", "order_assigned_printer_idx", "1000000 200"),
+    ("core_printer", None, "5000"),
+    ("core_printer", "printer_status_idx", "5000 1000"),
+    ("core_printer", "printer_last_ping_idx", "5000 1"),
+    ("core_progresssample", None, "20000000"),
+    ("core_progresssample", "progress_order_time_idx", "20000000 20 1"),
+]
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries must keep using their indexes at production size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")  # creates sqlite_stat1
+            cursor.execute("DELETE FROM sqlite_stat1")
+            cursor.executemany(
+                "INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (%s, %s, %s)",
+                FLEET_STATS,
+            )
+            cursor.execute("ANALYZE sqlite_schema")  # reload the statistics
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf"SEARCH \w+ USING (COVERING )?INDEX {index_name}\b")
+        return plan
+
+    def test_dispatch_queue_head(self):
+        qs = (
+            Order.objects.filter(status="queued")
+            .order_by("created_at")
+            .values_list("created_at", "id")
+        )
+        plan = self.assertUsesIndex(qs, "order_status_created_idx")
+        self.assertIn("COVERING", plan)
+        self.assertNotIn("TEMP B-TREE", plan)  # FIFO order comes from the index
+
+    def test_admin_status_filter(self):
+        qs = Order.objects.filter(status="complete").order_by("-created_at")
+        plan = self.assertUsesIndex(qs, "order_status_created_idx")
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_admin_date_hierarchy(self):
+        now = timezone.now()
+        qs = Order.objects.filter(
+            created_at__gte=now - timedelta(days=1), created_at__lt=now
+        )
+        self.assertUsesIndex(qs, "order_created_idx")
+
+    def test_orders_for_printer(self):
+        self.assertUsesIndex(
+            Order.objects.filter(assigned_printer_id=7), "order_assigned_printer_idx"
+        )
+
+    def test_printer_status_and_stale_scan(self):
+        self.assertUsesIndex(
+            Printer.objects.filter(status="idle"), "printer_status_idx"
+        )
+        cutoff = timezone.now() - timedelta(minutes=1)
+        self.assertUsesIndex(
+            Printer.objects.filter(last_ping_at__lt=cutoff), "printer_last_ping_idx"
+        )
+
+    def test_progress_history(self):
+        qs = (
+            ProgressSample.objects.filter(order_id=7)
+            .order_by("recorded_at")
+            .values_list("recorded_at", "progress")
+        )
+        plan = self.assertUsesIndex(qs, "progress_order_time_idx")
+        self.assertNotIn("TEMP B-TREE", plan)
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from core.benchmark import mock_module
+from core.clock import VirtualClock, clock
+from core.models import Order, Printable, Upload
+from core.simulation import SimulationConfig, simulate
+
+
+# Printers ping as the API says; slow them down to keep the runs short
+@override_settings(
+    PING_INTERVAL_SOON=60, PING_INTERVAL_PRINTING=60, PING_INTERVAL_IDLE=60
+)
+class SimulationTests(TestCase):
+    def test_virtual_clock_drives_timestamps(self):
+        start = datetime(2025, 1, 6, tzinfo=timezone.utc)
+        virtual = VirtualClock(start)
+        with clock.use(virtual):
+            order = Order.objects.create(status="queued", items=[])
+            self.assertEqual(order.created_at, start)
+            upload = Upload.objects.create(
+                printable=Printable.objects.create(name="Cube"), size=1
+            )
+            self.assertEqual(upload.created_at, start)
+            monotonic = clock.monotonic()
+            virtual.sleep(90)
+            order.save()
+            self.assertEqual(order.updated_at, start + timedelta(seconds=90))
+            self.assertAlmostEqual(clock.monotonic() - monotonic, 90)
+        self.assertGreater(Order.objects.create(items=[]).created_at, start)
+
+    def test_simulation_is_reproducible(self):
+        ids = [Printable.objects.create(name="Cube").id]
+        config = SimulationConfig(
+            printers=3,
+            days=2 / 24,
+            orders_per_hour=20,
+            interval=60,
+            print_time=(300, 900),
+            failure_rate=0.2,
+            disconnect_rate=0.05,
+            offline_time=(60, 300),
+            seed=7,
+        )
+        results = []
+        for _ in range(2):
+            with transaction.atomic():
+                results.append(simulate(config, ids))
+                transaction.set_rollback(True)
+
+        self.assertEqual(results[0], results[1])
+        result = results[0]
+        self.assertEqual(result["errors"], 0)
+        self.assertGreater(result["orders"]["complete"], 0)
+        self.assertGreater(result["requests"], 3 * 2 * 60 * 0.8)
+
+        config.seed = 8
+        with transaction.atomic():
+            self.assertNotEqual(simulate(config, ids), result)
+            transaction.set_rollback(True)
+
+    def test_simulation_through_gateways(self):
+        ids = [Printable.objects.create(name="Cube").id]
+        config = SimulationConfig(
+            printers=6,
+            days=2 / 24,
+            orders_per_hour=30,
+            interval=60,
+            print_time=(300, 900),
+            gateway=3,
+        )
+        result = simulate(config, ids)
+        self.assertEqual(result["errors"], 0)
+        self.assertGreater(result["orders"]["complete"], 0)
+        # Two batches a minute rather than six pings, plus orders and completions
+        self.assertLess(
+            result["requests"], 2 * 2 * 60 + 3 * result["orders"]["created"]
+        )
+
+    def test_printer_mock_paces_and_backs_off(self):
+        printer = mock_module("printer")
+        answers = []
+
+        def transport(path, payload):
+            return answers.pop(0)
+
+        mock = printer.PrinterMock(
+            api_base="",
+            state_file="",
+            clock=VirtualClock(datetime(2025, 1, 6, tzinfo=timezone.utc)),
+            behavior=printer.Behavior(interval=5, backoff_max=60, seed=1),
+            transport=transport,
+            quiet=True,
+        )
+        answers.append((200, '{"printer_id": 1, "next_ping_in": 14.2}'))
+        self.assertEqual(mock.step(), 14.2)
+
+        answers.extend([(503, "")] * 6)
+        delays = [mock.step() for _ in range(6)]
+        for failures, delay in enumerate(delays, 1):
+            cap = min(60, 5 * 2 ** (failures - 1))
+            self.assertTrue(cap / 2 <= delay <= cap, (failures, delay))
+        self.assertGreater(delays[3], delays[0])
+
+        # Back to the API's pace once a ping gets through
+        answers.append((200, '{"printer_id": 1}'))
+        self.assertEqual(mock.step(), 5)
+        answers.append((503, ""))
+        self.assertLessEqual(mock.step(), 5)
@@ -0,0 +1,150 @@
+import os
+import struct
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from core import mesh, stl
+
+CUBE = os.path.join(settings.BASE_DIR, "media", "stl", "red-cube.stl")
+
+
+def write_binary_stl(path, triangles, header=b"binary"):
+    triangles = np.asarray(triangles, dtype="<f4").reshape(-1, 3, 3)
+    facets = np.zeros(len(triangles), dtype=stl.FACET)
+    facets["vertices"] = triangles
+    with open(path, "wb") as f:
+        f.write(header.ljust(stl.HEADER_SIZE, b" "))
+        f.write(struct.pack("<I", len(triangles)))
+        f.write(facets.tobytes())
+
+
+def uv_sphere(rings, radius=10.0):
+    """Closed sphere of ``4 * rings**2`` triangles, wound outwards."""
+    theta, phi = np.meshgrid(
+        np.linspace(0, np.pi, rings + 1),
+        np.linspace(0, 2 * np.pi, 2 * rings + 1),
+        indexing="ij",
+    )
+    points = radius * np.stack(
+        [np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], -1
+    )
+    a, b = points[:-1, :-1], points[1:, :-1]
+    c, d = points[1:, 1:], points[:-1, 1:]
+    quads = [
+        np.stack(corners, -2).reshape(-1, 3, 3) for corners in ((a, b, c), (a, c, d))
+    ]
+    return np.concatenate(quads).astype(np.float32)
+
+
+def binary_stl(triangles) -> bytes:
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mesh.stl")
+        stl.write_binary(path, triangles)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+class StlTests(SimpleTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_ascii_cube_geometry(self):
+        geometry = stl.analyze(CUBE)
+        self.assertEqual(geometry.triangle_count, 12)
+        self.assertEqual(geometry.bbox_min, (0.0, 0.0, 0.0))
+        self.assertEqual(geometry.size, (10.0, 10.0, 10.0))
+        self.assertAlmostEqual(geometry.surface_area, 600.0)
+        self.assertAlmostEqual(geometry.volume, 1000.0)
+
+    def test_binary_matches_ascii(self):
+        path = os.path.join(self.tmp, "cube.stl")
+        # A "solid" header must not make a binary file look like ASCII
+        write_binary_stl(path, stl.read_triangles(CUBE), header=b"solid cube")
+        self.assertEqual(stl.binary_triangle_count(path), 12)
+        self.assertIsNone(stl.binary_triangle_count(CUBE))
+        self.assertEqual(stl.analyze(path), stl.analyze(CUBE))
+
+    def test_blocked_passes_match_single_pass(self):
+        rng = np.random.default_rng(1)
+        triangles = rng.normal(size=(1000, 3, 3)).astype(np.float32)
+        whole = stl.measure(triangles)
+        block, stl.BLOCK_TRIANGLES = stl.BLOCK_TRIANGLES, 64
+        try:
+            blocked = stl.measure(triangles)
+        finally:
+            stl.BLOCK_TRIANGLES = block
+        self.assertEqual(whole.bbox_min, blocked.bbox_min)
+        self.assertAlmostEqual(whole.surface_area, blocked.surface_area, places=6)
+        self.assertAlmostEqual(whole.volume, blocked.volume, places=6)
+
+    def test_empty_mesh(self):
+        path = os.path.join(self.tmp, "empty.stl")
+        with open(path, "wb") as f:
+            f.write(b"solid empty\nendsolid empty\n")
+        geometry = stl.analyze(path)
+        self.assertEqual(geometry.triangle_count, 0)
+        self.assertIsNone(geometry.size)
+
+    def test_transcode_ascii_in_small_chunks(self):
+        path = os.path.join(self.tmp, "cube.stl")
+        # Chunks much smaller than a facet exercise the carry-over logic
+        self.assertEqual(stl.transcode_ascii(CUBE, path, chunk_size=7), 12)
+        with open(path, "rb") as f:
+            self.assertNotEqual(f.read(5), b"solid")
+        np.testing.assert_array_equal(
+            stl.read_triangles(path), stl.read_triangles(CUBE)
+        )
+        facets = np.fromfile(path, dtype=stl.FACET, offset=84)
+        np.testing.assert_allclose(np.linalg.norm(facets["normal"], axis=1), 1.0)
+
+    def test_decimate_keeps_shape_within_budget(self):
+        sphere = uv_sphere(50)
+        full = stl.measure(sphere)
+        for target in (500, 2000):
+            coarse = stl.decimate(sphere, target)
+            self.assertLessEqual(len(coarse), target)
+            self.assertGreater(len(coarse), target // 2)
+            geometry = stl.measure(coarse)
+            np.testing.assert_allclose(geometry.size, full.size, rtol=0.1)
+            self.assertAlmostEqual(geometry.volume / full.volume, 1.0, delta=0.1)
+        # Already within budget: nothing to do
+        self.assertEqual(len(stl.decimate(sphere, len(sphere))), len(sphere))
+
+    def test_write_binary_round_trip(self):
+        path = os.path.join(self.tmp, "sphere.stl")
+        sphere = uv_sphere(8)
+        stl.write_binary(path, sphere)
+        self.assertEqual(stl.binary_triangle_count(path), len(sphere))
+        np.testing.assert_array_equal(stl.read_triangles(path), sphere)
+
+    def test_compact_mesh_round_trip(self):
+        sphere = uv_sphere(30)
+        data = mesh.encode(sphere)
+        compact = mesh.decode(data)
+        # Shared vertices are stored once: ~1 per 2 triangles on a closed mesh
+        self.assertLess(len(compact.positions), len(sphere) * 0.6)
+        self.assertEqual(compact.indices.dtype, np.uint16)
+        self.assertLess(len(data), (84 + 50 * len(sphere)) / 3)
+
+        restored = compact.positions[compact.indices]
+        full = stl.measure(sphere)
+        np.testing.assert_allclose(
+            stl.measure(restored).bbox_max, full.bbox_max, atol=1e-3
+        )
+        self.assertAlmostEqual(stl.measure(restored).volume / full.volume, 1, places=4)
+        # Normals of a sphere point away from its center
+        radial = compact.positions / np.linalg.norm(
+            compact.positions, axis=1, keepdims=True
+        )
+        np.testing.assert_array_less(0.95, np.sum(radial * compact.normals, axis=1))
+
+        self.assertIsNone(mesh.decode(mesh.encode(sphere, normals=False)).normals)
+        empty = mesh.decode(mesh.encode(np.empty((0, 3, 3))))
+        self.assertEqual(empty.positions.shape, (0, 3))
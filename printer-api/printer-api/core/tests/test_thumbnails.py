@@ -0,0 +1,80 @@
+import os
+import struct
+import time
+import zlib
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from core import stl, thumbnails
+from core.tests.test_stl import CUBE, uv_sphere
+
+
+def decode_png(data):
+    # Enough of PNG for what encode_png writes: one IDAT, no filtering
+    width, height = struct.unpack(">II", data[16:24])
+    idat = data.index(b"IDAT")
+    (length,) = struct.unpack(">I", data[idat - 4 : idat])
+    raw = np.frombuffer(zlib.decompress(data[idat + 4 : idat + 4 + length]), np.uint8)
+    return raw.reshape(height, width * 4 + 1)[:, 1:].reshape(height, width, 4)
+
+
+class ThumbnailTests(SimpleTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_parse_color(self):
+        self.assertEqual(thumbnails.parse_color("Red"), thumbnails.NAMED_COLORS["red"])
+        self.assertEqual(thumbnails.parse_color("#0f8"), (0, 255, 136))
+        self.assertEqual(thumbnails.parse_color("00ff88"), (0, 255, 136))
+        self.assertEqual(thumbnails.parse_color(""), thumbnails.DEFAULT_COLOR)
+        self.assertEqual(thumbnails.parse_color("mauve-ish"), thumbnails.DEFAULT_COLOR)
+
+    def test_render_cube(self):
+        image = thumbnails.render(stl.read_triangles(CUBE), (200, 0, 0), size=64)
+        self.assertEqual(image.shape, (64, 64, 4))
+        # Centered and opaque, with a transparent margin
+        self.assertEqual(image[32, 32, 3], 255)
+        self.assertEqual(image[0, 0, 3], 0)
+        self.assertEqual(image[63, 63, 3], 0)
+        # Three visible faces, shaded differently, all in the cube's color
+        opaque = image[image[..., 3] == 255][:, :3]
+        self.assertTrue((opaque[:, 1:] == 0).all())
+        self.assertGreaterEqual(len(np.unique(opaque[:, 0])), 3)
+
+    def test_draw_order_does_not_matter(self):
+        triangles = stl.read_triangles(CUBE)
+        forward = thumbnails.render(triangles, (255, 255, 255), size=32)
+        backward = thumbnails.render(triangles[::-1].copy(), (255, 255, 255), size=32)
+        np.testing.assert_array_equal(forward, backward)
+
+    def test_png_round_trip(self):
+        image = thumbnails.render(uv_sphere(8), (10, 200, 30), size=32)
+        data = thumbnails.encode_png(image)
+        self.assertTrue(data.startswith(b"\x89PNG\r\n\x1a\n"))
+        np.testing.assert_array_equal(decode_png(data), image)
+
+    @override_settings(THUMBNAIL_CACHE_MAX_BYTES=3200)
+    def test_cache_evicts_least_recently_used(self):
+        path = os.path.join(self.tmp, "sphere.stl")
+        stl.write_binary(path, uv_sphere(6))
+        cache = os.path.join(self.tmp, "thumbnails")
+
+        def thumb(color):
+            return thumbnails.ensure_thumbnail(path, "d", color, 64, directory=cache)
+
+        red = thumb("red")
+        blue = thumb("blue")
+        self.assertLessEqual(os.path.getsize(red) + os.path.getsize(blue), 3200)
+        old = time.time() - 60
+        os.utime(red, (old, old))
+        os.utime(blue, (old - 60, old - 60))
+        thumb("red")  # a hit makes it the most recently used
+        thumb("green")
+        self.assertTrue(os.path.exists(red))
+        self.assertFalse(os.path.exists(blue))
@@ -0,0 +1,291 @@
+"""PNG thumbnails of printables, rendered on the CPU.
+
+``render`` is a small software rasterizer: the mesh is turned to a fixed
+three-quarter view, projected orthographically, flat-shaded in the
+printable's color and resolved with a z-buffer, all in vectorized NumPy
+passes. Images are rendered at twice their size and scaled down, which
+smooths the edges.
+
+Thumbnails are written once at ingest and kept in a directory bounded by
+``THUMBNAIL_CACHE_MAX_BYTES``. Reading one bumps its mtime, and the least
+recently used files are evicted first. Anything evicted is rendered again
+on the next request.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from .derived import write_atomic
+from .lod import FULL, ensure_lod, levels
+from .stl import read_triangles
+
+RENDERER_VERSION = 1
+DEFAULT_SIZE = 256
+DEFAULT_COLOR = (170, 170, 170)
+SUPERSAMPLE = 2
+# Pixel candidates tested per pass, bounding the memory a pass needs
+PIXELS_PER_PASS = 1 << 22
+
+# CSS basic color keywords, plus the ones printables tend to use
+NAMED_COLORS = {
+    "black": (0, 0, 0),
+    "white": (255, 255, 255),
+    "gray": (128, 128, 128),
+    "grey": (128, 128, 128),
+    "silver": (192, 192, 192),
+    "red": (220, 40, 40),
+    "maroon": (128, 0, 0),
+    "orange": (255, 140, 0),
+    "yellow": (240, 210, 0),
+    "olive": (128, 128, 0),
+    "green": (40, 160, 60),
+    "lime": (0, 255, 0),
+    "teal": (0, 128, 128),
+    "cyan": (0, 200, 220),
+    "blue": (40, 90, 220),
+    "navy": (0, 0, 128),
+    "purple": (128, 0, 128),
+    "magenta": (255, 0, 255),
+    "pink": (255, 150, 180),
+    "brown": (140, 80, 30),
+}
+_HEX_RE = re.compile(r"^#?([0-9a-f]{3}|[0-9a-f]{6})$")
+
+# Camera: a three-quarter view from the front right, slightly above
+_AZIMUTH = np.radians(-35.0)
+_ELEVATION = np.radians(25.0)
+_LIGHT = np.array([-0.4, 0.5, 0.77])
+
+_lock = threading.Lock()
+
+
+def parse_color(value: str) -> tuple[int, int, int]:
+    """RGB for a color name or ``#rgb`` / ``#rrggbb``; gray if unknown."""
+    value = (value or "").strip().lower()
+    if value in NAMED_COLORS:
+        return NAMED_COLORS[value]
+    match = _HEX_RE.match(value)
+    if not match:
+        return DEFAULT_COLOR
+    digits = match.group(1)
+    if len(digits) == 3:
+        digits = "".join(c * 2 for c in digits)
+    return tuple(int(digits[i : i + 2], 16) for i in (0, 2, 4))
+
+
+def _view_matrix() -> np.ndarray:
+    ca, sa = np.cos(_AZIMUTH), np.sin(_AZIMUTH)
+    ce, se = np.cos(_ELEVATION), np.sin(_ELEVATION)
+    spin = np.array([[ca, -sa, 0], [sa, ca, 0], [0, 0, 1]])  # about Z (up)
+    tilt = np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]])  # Z up -> screen Y up
+    pitch = np.array([[1, 0, 0], [0, ce, -se], [0, se, ce]])
+    return pitch @ tilt @ spin
+
+
+def render(triangles: np.ndarray, color=DEFAULT_COLOR, size: int = DEFAULT_SIZE):
+    """Render ``triangles`` into a ``(size, size, 4)`` RGBA uint8 image."""
+    image = np.zeros((size, size, 4), dtype=np.uint8)
+    if len(triangles) == 0:
+        return image
+    res = size * SUPERSAMPLE
+    tri = np.asarray(triangles, dtype=np.float64) @ _view_matrix().T
+
+    # Fit the projected mesh into the image, with a small margin
+    lo = tri.reshape(-1, 3).min(axis=0)
+    hi = tri.reshape(-1, 3).max(axis=0)
+    extent = float(max(hi[0] - lo[0], hi[1] - lo[1])) or 1.0
+    scale = res * 0.9 / extent
+    center = (lo + hi) / 2
+    x = (tri[..., 0] - center[0]) * scale + res / 2
+    y = res / 2 - (tri[..., 1] - center[1]) * scale  # image rows go down
+    z = tri[..., 2]  # larger is nearer the camera
+
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    light = _LIGHT / np.linalg.norm(_LIGHT)
+    # abs(): shade both sides alike, so badly wound meshes still look right
+    lambert = np.abs(normals @ light) / np.where(lengths > 0, lengths, 1)
+    shade = 0.3 + 0.7 * lambert
+
+    depth = np.full(res * res, -np.inf)
+    face = np.full(res * res, -1, dtype=np.int64)
+    x0 = np.clip(np.floor(x.min(axis=1)), 0, res - 1).astype(np.int64)
+    x1 = np.clip(np.ceil(x.max(axis=1)), 0, res - 1).astype(np.int64)
+    y0 = np.clip(np.floor(y.min(axis=1)), 0, res - 1).astype(np.int64)
+    y1 = np.clip(np.ceil(y.max(axis=1)), 0, res - 1).astype(np.int64)
+    widths = x1 - x0 + 1
+    counts = widths * (y1 - y0 + 1)
+
+    # Pass over triangles in groups whose bounding boxes add up to a bounded
+    # number of pixel candidates
+    cumulative = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = cumulative[start - 1] if start else 0
+        stop = max(
+            int(np.searchsorted(cumulative, base + PIXELS_PER_PASS, side="right")),
+            start + 1,
+        )
+        _rasterize(
+            slice(start, stop), x, y, z, x0, y0, widths, counts, res, depth, face
+        )
+        start = stop
+
+    covered = face >= 0
+    rgb = np.zeros((res * res, 3))
+    rgb[covered] = shade[face[covered], None] * np.asarray(color, dtype=np.float64)
+    rgba = np.concatenate([rgb, covered[:, None] * 255.0], axis=1)
+    # Box-filter the supersampled image down, weighting color by coverage
+    blocks = rgba.reshape(size, SUPERSAMPLE, size, SUPERSAMPLE, 4).mean(axis=(1, 3))
+    alpha = blocks[..., 3:]
+    blocks[..., :3] = np.divide(
+        blocks[..., :3] * 255.0,
+        alpha,
+        out=np.zeros_like(blocks[..., :3]),
+        where=alpha > 0,
+    )
+    return np.clip(np.rint(blocks), 0, 255).astype(np.uint8)
+
+
+def _rasterize(group, x, y, z, x0, y0, widths, counts, res, depth, face):
+    ids = np.arange(group.start, group.stop)
+    n = counts[group]
+    owner = np.repeat(ids, n)
+    offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    px = x0[owner] + offsets % widths[owner]
+    py = y0[owner] + offsets // widths[owner]
+    cx, cy = px + 0.5, py + 0.5  # sample at pixel centers
+
+    ax, ay = x[owner, 0], y[owner, 0]
+    bx, by = x[owner, 1], y[owner, 1]
+    qx, qy = x[owner, 2], y[owner, 2]
+    area = (bx - ax) * (qy - ay) - (by - ay) * (qx - ax)
+    w0 = (bx - cx) * (qy - cy) - (by - cy) * (qx - cx)
+    w1 = (qx - cx) * (ay - cy) - (qy - cy) * (ax - cx)
+    w2 = area - w0 - w1
+    # Either winding is accepted; degenerate triangles cover nothing
+    sign = np.sign(area)
+    inside = (area != 0) & (w0 * sign >= 0) & (w1 * sign >= 0) & (w2 * sign >= 0)
+    if not inside.any():
+        return
+    owner, px, py = owner[inside], px[inside], py[inside]
+    area = area[inside]
+    pz = (
+        w0[inside] * z[owner, 0] + w1[inside] * z[owner, 1] + w2[inside] * z[owner, 2]
+    ) / area
+
+    pixel = py * res + px
+    np.maximum.at(depth, pixel, pz)
+    # Ties go to whichever nearest triangle comes last; any of them is right
+    nearest = pz >= depth[pixel]
+    face[pixel[nearest]] = owner[nearest]
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """Minimal PNG writer for an RGBA uint8 image."""
+    height, width = image.shape[:2]
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    # Filter type 0 (None) in front of every scanline
+    raw = np.concatenate(
+        [np.zeros((height, 1), dtype=np.uint8), image.reshape(height, -1)], axis=1
+    )
+    return b"".join(
+        [
+            b"\x89PNG\r\n\x1a\n",
+            chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), 9)),
+            chunk(b"IEND", b""),
+        ]
+    )
+
+
+def cache_dir(media_root: str | None = None) -> str:
+    return getattr(settings, "THUMBNAIL_CACHE_DIR", None) or os.path.join(
+        media_root or settings.MEDIA_ROOT, "thumbnails"
+    )
+
+
+def sizes() -> tuple[int, ...]:
+    return tuple(getattr(settings, "THUMBNAIL_SIZES", (128, DEFAULT_SIZE, 512)))
+
+
+def version(mesh_digest: str, color: str) -> str:
+    """Changes whenever the mesh, the color or the renderer does."""
+    key = f"{RENDERER_VERSION}:{mesh_digest}:{parse_color(color)}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def _preview_triangles(path: str, triangle_count: int | None) -> np.ndarray:
+    # Thumbnails are small; render from the densest LOD within budget
+    budget = getattr(settings, "THUMBNAIL_MAX_TRIANGLES", 50_000)
+    fitting = {level: b for level, b in levels().items() if b <= budget}
+    level = max(fitting, key=fitting.get) if fitting else FULL
+    return read_triangles(ensure_lod(path, level, triangle_count))
+
+
+def ensure_thumbnail(
+    path: str,
+    mesh_digest: str,
+    color: str,
+    size: int = DEFAULT_SIZE,
+    triangle_count: int | None = None,
+    directory: str | None = None,
+) -> str:
+    """Return the cached thumbnail of STL ``path``, rendering it on a miss."""
+    directory = directory or cache_dir()
+    target = os.path.join(directory, f"{version(mesh_digest, color)}-{size}.png")
+    try:
+        os.utime(target)  # mark as recently used
+        return target
+    except FileNotFoundError:
+        pass
+    image = render(_preview_triangles(path, triangle_count), parse_color(color), size)
+    data = encode_png(image)
+    os.makedirs(directory, exist_ok=True)
+    write_atomic(target, lambda tmp: _write_bytes(tmp, data))
+    evict(directory, keep=target)
+    return target
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def evict(directory: str, keep: str | None = None) -> int:
+    """Delete least recently used thumbnails beyond the size budget.
+
+    Returns the number of bytes freed.
+    """
+    budget = getattr(settings, "THUMBNAIL_CACHE_MAX_BYTES", 256 << 20)
+    with _lock:
+        entries = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(".png"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= budget:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+    return freed
@@ -0,0 +1,338 @@
+"""Resumable STL uploads, processed off the request path.
+
+``start`` creates the printable (status "processing") together with an
+``Upload``. The client then sends the file in chunks, each streamed to a
+``.part`` file as it arrives; after a dropped connection it asks for the
+current offset and carries on from there. Once the last byte is in, the
+file is handed to a bounded process pool (``UPLOAD_PROCESS_WORKERS``) that
+validates, hashes, transcodes and measures it, builds its derived files
+and renders its thumbnail, so request latency doesn't depend on the size
+of the mesh.
+
+Workers only touch files; the database update and catalog invalidation
+happen back in the web process, when the job is done. A complete upload
+whose job was lost (the server restarted) is submitted again when the
+client resumes it from the end. Until the printable refers to the stored
+blob, another printable's release may delete it, so the worker keeps a
+hard link to it that ``finish`` restores the blob from.
+"""
+
+import fcntl
+import logging
+import os
+import posixpath
+import shutil
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .catalog import catalog
+from .stl import analyze, binary_triangle_count, transcode_ascii, validate
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+
+
+class OffsetMismatch(Exception):
+    """A chunk didn't start where the stored part of the upload ends."""
+
+    def __init__(self, offset: int):
+        super().__init__(f"upload is at offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(Exception):
+    """Another request or job is working on the same upload."""
+
+
+class IngestError(Exception):
+    """Processing failed after the file was stored as blob ``name``."""
+
+    def __init__(self, message: str, name: str = ""):
+        super().__init__(message)
+        self.name = name
+
+
+def upload_dir() -> str:
+    # Under MEDIA_ROOT, so a finished part can be renamed into the store
+    return getattr(settings, "UPLOAD_TEMP_DIR", None) or os.path.join(
+        settings.MEDIA_ROOT, "uploads"
+    )
+
+
+def part_path(upload) -> str:
+    return os.path.join(upload_dir(), f"{upload.pk}.part")
+
+
+def kept_path(upload_id) -> str:
+    # Hard link to the stored blob, see storage.restore
+    return os.path.join(upload_dir(), f"{upload_id}.part.keep")
+
+
+def offset(upload) -> int:
+    try:
+        return os.path.getsize(part_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def start(name: str, color: str, filename: str, size: int):
+    from .models import Printable, Upload
+
+    with transaction.atomic():
+        printable = Printable.objects.create(
+            name=name, color=color, status="processing", stl_filename=filename
+        )
+        upload = Upload.objects.create(
+            printable=printable, filename=filename, size=size
+        )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(upload), "wb").close()
+    return upload
+
+
+def write_chunk(upload, start: int, stream, length: int) -> int:
+    """Append up to ``length`` bytes read from ``stream`` at ``start``.
+
+    Returns the new offset. Whatever arrived before the stream ended is
+    kept, so a retry only has to send the rest.
+    """
+    with open(part_path(upload), "r+b") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+        end = f.seek(0, os.SEEK_END)
+        if start != end:
+            raise OffsetMismatch(end)
+        remaining = min(length, upload.size - start)
+        while remaining > 0:
+            chunk = stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            remaining -= len(chunk)
+        return f.tell()
+
+
+@contextmanager
+def _claim(part: str):
+    # One job per part, across processes; a missing part was already taken
+    try:
+        f = open(part, "rb")
+    except FileNotFoundError:
+        raise UploadBusy()
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy()
+        yield
+
+
+def ingest_file(
+    part: str,
+    filename: str,
+    color: str,
+    media_root: str,
+    transcode: bool,
+    keep_original: bool,
+) -> dict:
+    """The file half of ingest, for a worker process.
+
+    Moves the validated ``part`` into the content store under
+    ``media_root`` and returns the printable fields to set. Settings are
+    passed in rather than read, since a worker doesn't see overrides made
+    in the web process. Raises ``UploadBusy`` if another job has the part,
+    and ``IngestError`` if processing fails once the file is stored.
+    """
+    with _claim(part):
+        validate(part)
+        name = _store(part, filename, media_root, transcode, keep_original)
+    try:
+        return _process(name, color, media_root)
+    except Exception as e:
+        raise IngestError(str(e), name) from e
+
+
+def _store(
+    part: str, filename: str, media_root: str, transcode: bool, keep_original: bool
+) -> str:
+    from .storage import ContentAddressedStorage, original_path
+
+    storage = ContentAddressedStorage(location=media_root)
+    kept = part + ".keep"
+    ascii_part = None
+    if transcode and binary_triangle_count(part) is None:
+        ascii_part, part = part, part + ".bin"
+        transcode_ascii(ascii_part, part)
+    name = storage.save_file(part, posixpath.join("stl", filename), keep=kept)
+    path = storage.path(name)
+    if ascii_part:
+        if keep_original:
+            os.makedirs(os.path.dirname(original_path(path)), exist_ok=True)
+            shutil.move(ascii_part, original_path(path))
+        else:
+            os.unlink(ascii_part)
+    return name
+
+
+def _process(name: str, color: str, media_root: str) -> dict:
+    from .ingest import build_derived, geometry_fields
+    from .storage import ContentAddressedStorage, blob_digest
+    from .thumbnails import cache_dir, ensure_thumbnail
+
+    path = ContentAddressedStorage(location=media_root).path(name)
+    fields = geometry_fields(analyze(path))
+    build_derived(path, fields["triangle_count"])
+    ensure_thumbnail(
+        path,
+        blob_digest(name),
+        color,
+        triangle_count=fields["triangle_count"],
+        directory=cache_dir(media_root),
+    )
+    return {"stl": name, **fields}
+
+
+def finish(
+    upload_id, fields: dict | None = None, error: str = "", stored: str = ""
+) -> None:
+    """Record the outcome of processing an upload.
+
+    ``stored`` is a blob a failed job left behind; it is released.
+    """
+    from .ingest import build_derived
+    from .models import Printable, Upload
+    from .storage import release, restore, stl_storage
+
+    with _pool_lock:
+        _pending.discard(upload_id)
+    kept = kept_path(upload_id)
+    upload = Upload.objects.filter(pk=upload_id).first()
+    if upload is None:
+        # Finished by another job; keep the blob only if that one used it
+        if fields is not None:
+            release(fields["stl"])
+        if os.path.exists(kept):
+            os.unlink(kept)
+        return
+    if fields is not None:
+        changes = {**fields, "status": "ready", "processing_error": ""}
+    else:
+        changes = {"status": "failed", "processing_error": error}
+    Printable.objects.filter(pk=upload.printable_id).update(**changes)
+    if fields is not None and os.path.exists(kept):
+        # Released by another printable while this one didn't refer to it yet
+        if restore(fields["stl"], kept):
+            logger.info("Restored blob %s for upload %s", fields["stl"], upload_id)
+            build_derived(stl_storage.path(fields["stl"]), fields["triangle_count"])
+    for leftover in (part_path(upload), part_path(upload) + ".bin", kept):
+        if os.path.exists(leftover):
+            os.unlink(leftover)
+    upload.delete()
+    if stored:
+        release(stored)
+    catalog.changed(upload.printable_id, fields is not None)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Uploads this process has submitted and not finished yet
+_pending: set = set()
+
+
+def _init_worker():
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.settings")
+    django.setup()
+
+
+def pool() -> ProcessPoolExecutor | None:
+    """The shared worker pool, or ``None`` when uploads run inline."""
+    global _pool
+    workers = int(getattr(settings, "UPLOAD_PROCESS_WORKERS", 2))
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process may be running other threads
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+            )
+    return _pool
+
+
+def _job(upload) -> tuple:
+    return (
+        part_path(upload),
+        upload.filename,
+        upload.printable.color,
+        str(settings.MEDIA_ROOT),
+        getattr(settings, "STL_TRANSCODE_ASCII", True),
+        getattr(settings, "STL_KEEP_ORIGINAL", False),
+    )
+
+
+def _failed(upload_id, e: Exception) -> None:
+    if isinstance(e, UploadBusy):
+        # Another job (maybe in another process) records the outcome
+        logger.info("Upload %s is already being processed", upload_id)
+        with _pool_lock:
+            _pending.discard(upload_id)
+        return
+    logger.warning("Upload %s failed: %s", upload_id, e)
+    stored = e.name if isinstance(e, IngestError) else ""
+    finish(upload_id, error=str(e), stored=stored)
+
+
+def _done(upload_id, future) -> None:
+    # Runs on the pool's management thread, which has its own connection
+    try:
+        try:
+            fields = future.result()
+        except Exception as e:
+            _failed(upload_id, e)
+        else:
+            finish(upload_id, fields)
+    finally:
+        connections.close_all()
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def submit(upload) -> Future | None:
+    """Process a complete upload, in the pool or (without one) right away.
+
+    Does nothing if this process is already working on it.
+    """
+    with _pool_lock:
+        if upload.pk in _pending:
+            return None
+        _pending.add(upload.pk)
+    executor = pool()
+    if executor is None:
+        try:
+            fields = ingest_file(*_job(upload))
+        except Exception as e:
+            _failed(upload.pk, e)
+        else:
+            finish(upload.pk, fields)
+        return None
+    future = executor.submit(ingest_file, *_job(upload))
+    future.add_done_callback(lambda f: _done(upload.pk, f))
+    return future
@@ -5,8 +5,28 @@ urlpatterns = [
     path("printables", views.printables, name="printables"),
     path("printables/<int:printable_id>", views.printable_detail, name="printable_detail"),
     path("printables/<int:printable_id>/stl", views.printable_stl, name="printable_stl"),
+    path("printables/<int:printable_id>/mesh", views.printable_mesh, name="printable_mesh"),
+    path(
+        "printables/<int:printable_id>/mesh/<str:version>",
+        views.printable_mesh,
+        name="printable_mesh_version",
+    ),
+    path(
+        "printables/<int:printable_id>/thumbnail",
+        views.printable_thumbnail,
+        name="printable_thumbnail",
+    ),
+    path("uploads", views.create_upload, name="create_upload"),
+    path("uploads/<uuid:upload_id>", views.upload_detail, name="upload_detail"),
+    path("stl/<str:digest>", views.stl_blob, name="stl_blob"),
     path("orders", views.create_order, name="create_order"),
+    path("orders/bulk", views.create_orders_bulk, name="create_orders_bulk"),
     path("orders/<int:order_id>", views.order_status, name="order_status"),
+    path("orders/<int:order_id>/events", views.order_stream, name="order_stream"),
+    path(
+        "orders/<int:order_id>/progress", views.order_progress, name="order_progress"
+    ),
     path("printers/ping", views.printer_ping, name="printer_ping"),
+    path("printers/ping/batch", views.printer_ping_batch, name="printer_ping_batch"),
     path("jobs/<int:job_id>/complete", views.job_complete, name="job_complete"),
 ]
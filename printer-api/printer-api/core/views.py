@@ -1,8 +1,52 @@
+import asyncio
 import json
-from django.http import JsonResponse, HttpResponseNotAllowed, FileResponse, Http404
+import os
+import re
+from asgiref.sync import sync_to_async
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
-from .models import Printable, Order
-from django.utils import timezone
+from .models import Printable, Order, ProgressSample, Upload
+from .catalog import catalog
+from .clock import clock
+from .compression import negotiate
+from .dispatch import dispatcher
+from .downloads import file_etag, serve_file
+from .events import (
+    ORDER_FIELDS,
+    TERMINAL_STATUSES,
+    OrderEvent,
+    order_events,
+    order_version,
+)
+from .fleet import fleet
+from .heartbeat import heartbeats
+from .lod import FULL, ensure_lod, levels
+from .mesh import ensure_mesh
+from .orders import (
+    InvalidItem,
+    clean_items,
+    existing_printable_ids,
+    parse_items,
+    validate_items,
+)
+from .pacing import next_ping_in
+from .progress import decimate, job_progress, parse_progress
+from .storage import blob_digest, content_digest, original_path
+from .thumbnails import DEFAULT_SIZE, ensure_thumbnail, sizes, version
+from . import uploads
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
 
 
@@ -12,59 +56,469 @@ def not_implemented(message: str):
     )
 
 
-def printables(request):
-    if request.method != "GET":
-        return HttpResponseNotAllowed(["GET"])
-    data = [
-        {
-            "id": p.id,
-            "name": p.name,
-            "color": p.color,
-            "stl_url": (
-                request.build_absolute_uri(f"/api/printables/{p.id}/stl")
+# Public printable fields -> model columns needed to render them
+PRINTABLE_FIELDS = {
+    "id": ["id"],
+    "name": ["name"],
+    "color": ["color"],
+    "stl_url": ["stl"],
+    "mesh_url": ["stl"],
+    "thumbnail_url": ["stl", "color"],
+    "status": ["status"],
+    "triangle_count": ["triangle_count"],
+    "dimensions": ["size_x", "size_y", "size_z"],
+    "surface_area": ["surface_area"],
+    "volume": ["volume"],
+}
+
+
+def _stl_url(p) -> str:
+    # Stored blobs have an immutable URL of their own
+    digest = blob_digest(p.stl.name)
+    if digest:
+        return f"/api/stl/{digest}"
+    return f"/api/printables/{p.id}/stl"
+
+
+def _thumbnail_url(p) -> str:
+    url = f"/api/printables/{p.id}/thumbnail"
+    # Versioned (so cacheable for good) when that needs no file access
+    digest = blob_digest(p.stl.name)
+    if digest:
+        url += f"?v={version(digest, p.color)}"
+    return url
+
+
+def _printable_data(request, p, fields=PRINTABLE_FIELDS):
+    data = {}
+    for field in fields:
+        if field == "stl_url":
+            data[field] = request.build_absolute_uri(_stl_url(p)) if p.stl else None
+        elif field == "mesh_url":
+            data[field] = (
+                request.build_absolute_uri(f"/api/printables/{p.id}/mesh")
                 if p.stl
                 else None
-            ),
-        }
-        for p in Printable.objects.all().order_by("id")
-    ]
-    return JsonResponse({"printables": data})
+            )
+        elif field == "thumbnail_url":
+            data[field] = (
+                request.build_absolute_uri(_thumbnail_url(p)) if p.stl else None
+            )
+        elif field == "dimensions":
+            data[field] = (
+                {"x": p.size_x, "y": p.size_y, "z": p.size_z}
+                if p.size_x is not None
+                else None
+            )
+        else:
+            data[field] = getattr(p, field)
+    return data
 
 
-def printable_detail(request, printable_id: int):
+def _cached_json(request, cached):
+    # Catalog responses are served as pre-serialized bytes with a strong ETag
+    if cached.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(cached.body, content_type="application/json")
+    response["ETag"] = cached.etag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def _printables_chunk(request, queryset, fields, after, size, first):
+    # One keyset chunk, plus a peek at the next row to know if there are more
+    rows = list(queryset.filter(id__gt=after)[: size + 1])
+    body = b",".join(
+        json.dumps(_printable_data(request, p, fields), cls=DjangoJSONEncoder).encode()
+        for p in rows[:size]
+    )
+    if body and not first:
+        body = b"," + body
+    return body, rows[size - 1].id if len(rows) > size else None
+
+
+def _stream_printables(request, queryset, fields, limit):
+    # A keyset chunk at a time, so memory doesn't grow with the page size
+    chunk = getattr(settings, "PRINTABLES_STREAM_CHUNK", 500)
+    yield b'{"printables": ['
+    after, sent = 0, 0
+    while True:
+        size = min(chunk, limit - sent)
+        body, more = _printables_chunk(request, queryset, fields, after, size, not sent)
+        yield body
+        sent += size
+        if more is None or sent >= limit:
+            break
+        after = more
+    yield b'], "next_cursor": ' + json.dumps(more).encode() + b"}"
+
+
+async def _astream_printables(request, queryset, fields, limit):
+    # Same as _stream_printables, for ASGI servers: a sync iterator would be
+    # drained into a list before the first byte went out
+    chunk = getattr(settings, "PRINTABLES_STREAM_CHUNK", 500)
+    yield b'{"printables": ['
+    after, sent = 0, 0
+    while True:
+        size = min(chunk, limit - sent)
+        body, more = await sync_to_async(_printables_chunk)(
+            request, queryset, fields, after, size, not sent
+        )
+        yield body
+        sent += size
+        if more is None or sent >= limit:
+            break
+        after = more
+    yield b'], "next_cursor": ' + json.dumps(more).encode() + b"}"
+
+
+def printables(request):
     if request.method != "GET":
         return HttpResponseNotAllowed(["GET"])
+
+    page_size = getattr(settings, "PRINTABLES_PAGE_SIZE", 100)
     try:
-        p = Printable.objects.get(pk=printable_id)
+        limit = int(request.GET.get("limit", page_size))
+        cursor = int(request.GET.get("cursor", 0))
+    except ValueError:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "Invalid limit or cursor"}},
+            status=400,
+        )
+    max_limit = getattr(settings, "PRINTABLES_MAX_PAGE_SIZE", 10000)
+    if not 0 < limit <= max_limit:
         return JsonResponse(
             {
-                "id": p.id,
-                "name": p.name,
-                "color": p.color,
-                "stl_url": (
-                    request.build_absolute_uri(f"/api/printables/{p.id}/stl")
-                    if p.stl
-                    else None
-                ),
-            }
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": f"limit must be between 1 and {max_limit}",
+                }
+            },
+            status=400,
         )
-    except Printable.DoesNotExist:
-        return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    fields = list(PRINTABLE_FIELDS)
+    if request.GET.get("fields"):
+        fields = request.GET["fields"].split(",")
+        unknown = [f for f in fields if f not in PRINTABLE_FIELDS]
+        if unknown:
+            return JsonResponse(
+                {
+                    "error": {
+                        "code": "BAD_REQUEST",
+                        "message": f"unknown fields: {', '.join(unknown)}",
+                    }
+                },
+                status=400,
+            )
 
+    # Keyset pagination on id; only the columns the fields need are loaded
+    columns = {"id"}.union(*(PRINTABLE_FIELDS[f] for f in fields))
+    queryset = Printable.objects.filter(id__gt=cursor).order_by("id").only(*columns)
 
-def printable_stl(request, printable_id: int):
+    # Big pages are streamed; regular ones come from the response cache
+    if limit > getattr(settings, "PRINTABLES_STREAM_THRESHOLD", 500):
+        stream = (
+            _astream_printables
+            if isinstance(request, ASGIRequest)
+            else _stream_printables
+        )
+        return StreamingHttpResponse(
+            stream(request, queryset, fields, limit),
+            content_type="application/json",
+        )
+
+    def build():
+        rows = list(queryset[: limit + 1])
+        return {
+            "printables": [_printable_data(request, p, fields) for p in rows[:limit]],
+            "next_cursor": rows[limit - 1].id if len(rows) > limit else None,
+        }
+
+    # stl_url is absolute, so the cached body depends on the host
+    key = ("printables", request.build_absolute_uri("/"), cursor, limit, *fields)
+    return _cached_json(request, catalog.response(key, build))
+
+
+def printable_detail(request, printable_id: int):
     if request.method != "GET":
         return HttpResponseNotAllowed(["GET"])
+
+    def build():
+        p = Printable.objects.filter(pk=printable_id).first()
+        return _printable_data(request, p) if p else None
+
+    key = ("printable", printable_id, request.build_absolute_uri("/"))
+    cached = catalog.response(key, build)
+    if cached is None:
+        return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    return _cached_json(request, cached)
+
+
+def _lod_error():
+    choices = ", ".join([*levels(), FULL])
+    return JsonResponse(
+        {
+            "error": {
+                "code": "BAD_REQUEST",
+                "message": f"lod must be one of: {choices}",
+            }
+        },
+        status=400,
+    )
+
+
+def _stored_printable(printable_id: int) -> Printable:
     try:
         p = Printable.objects.get(pk=printable_id)
     except Printable.DoesNotExist:
         raise Http404()
     if not p.stl:
         raise Http404()
-    # Let Django serve the file; content_type guessed by FileResponse
-    return FileResponse(
-        p.stl.open("rb"), as_attachment=True, filename=p.stl.name.split("/", 1)[-1]
+    return p
+
+
+def _serve_stl(request, p, path):
+    lod = request.GET.get("lod", FULL)
+    if lod != FULL and lod not in levels():
+        return _lod_error()
+    try:
+        path = ensure_lod(path, lod, p.triangle_count)
+        path, encoding = negotiate(path, request.headers.get("Accept-Encoding", ""))
+        response = serve_file(
+            request,
+            path,
+            os.path.relpath(path, settings.MEDIA_ROOT),
+            filename=p.download_name(),
+            content_encoding=encoding,
+        )
+    except FileNotFoundError:
+        raise Http404()
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def printable_stl(request, printable_id: int):
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    p = _stored_printable(printable_id)
+    path = p.stl.path
+    if request.GET.get("original"):
+        # The upload as received, if it was kept when transcoding
+        path = original_path(path)
+    return _serve_stl(request, p, path)
+
+
+def stl_blob(request, digest: str):
+    """A stored STL by content hash; the URL never changes meaning."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    if blob_digest(f"{digest[:2]}/{digest}") != digest:
+        raise Http404()
+    p = (
+        Printable.objects.filter(stl__startswith=f"stl/{digest[:2]}/{digest}.")
+        .only("name", "stl", "stl_filename", "triangle_count")
+        .first()
     )
+    if p is None:
+        raise Http404()
+    response = _serve_stl(request, p, p.stl.path)
+    if response.status_code in (200, 206, 304):
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    return response
+
+
+def printable_mesh(request, printable_id: int, version: str | None = None):
+    """Compact mesh (see core.mesh) at an immutable, content-versioned URL.
+
+    The unversioned URL, or one whose version is out of date, redirects to
+    the current version.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    p = _stored_printable(printable_id)
+    lod = request.GET.get("lod", FULL)
+    if lod != FULL and lod not in levels():
+        return _lod_error()
+    try:
+        path = ensure_mesh(ensure_lod(p.stl.path, lod, p.triangle_count))
+    except FileNotFoundError:
+        raise Http404()
+
+    current = file_etag(path).strip('"')
+    if version != current:
+        url = f"/api/printables/{p.id}/mesh/{current}"
+        if request.GET:
+            url += "?" + request.GET.urlencode()
+        response = HttpResponseRedirect(url)
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    path, encoding = negotiate(path, request.headers.get("Accept-Encoding", ""))
+    response = serve_file(
+        request,
+        path,
+        os.path.relpath(path, settings.MEDIA_ROOT),
+        filename=os.path.splitext(p.download_name())[0] + ".qmesh",
+        content_encoding=encoding,
+    )
+    patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def printable_thumbnail(request, printable_id: int):
+    """PNG preview of the printable in its color (``?size=``, in pixels)."""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    try:
+        size = int(request.GET.get("size", DEFAULT_SIZE))
+    except ValueError:
+        size = None
+    if size not in sizes():
+        choices = ", ".join(str(s) for s in sizes())
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": f"size must be one of: {choices}",
+                }
+            },
+            status=400,
+        )
+    p = _stored_printable(printable_id)
+    try:
+        digest = content_digest(p.stl.name, p.stl.path)
+        path = ensure_thumbnail(
+            p.stl.path, digest, p.color, size, triangle_count=p.triangle_count
+        )
+        response = serve_file(
+            request,
+            path,
+            os.path.relpath(path, settings.MEDIA_ROOT),
+            filename=f"printable-{p.id}.png",
+            as_attachment=False,
+        )
+    except FileNotFoundError:
+        raise Http404()
+    if request.GET.get("v") == version(digest, p.color):
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    else:
+        response["Cache-Control"] = "no-cache"
+    return response
+
+
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+def _upload_data(upload, offset: int):
+    return {
+        "upload_id": str(upload.pk),
+        "printable_id": upload.printable_id,
+        "size": upload.size,
+        "offset": offset,
+    }
+
+
+@csrf_exempt
+def create_upload(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        payload = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "Invalid JSON"}}, status=400
+        )
+
+    name = payload.get("name")
+    filename = payload.get("filename")
+    color = payload.get("color", "")
+    size = payload.get("size")
+    max_size = getattr(settings, "UPLOAD_MAX_SIZE", 1 << 30)
+    if not isinstance(name, str) or not name.strip() or len(name) > 128:
+        message = "name required (at most 128 characters)"
+    elif not isinstance(color, str) or len(color) > 32:
+        message = "color must be a string of at most 32 characters"
+    elif (
+        not isinstance(filename, str)
+        or not filename.lower().endswith(".stl")
+        or "/" in filename
+        or len(filename) > 255
+    ):
+        message = "filename must be an .stl file name"
+    elif (
+        not isinstance(size, int) or isinstance(size, bool) or not 0 < size <= max_size
+    ):
+        message = f"size must be between 1 and {max_size} bytes"
+    else:
+        message = None
+    if message:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": message}}, status=400
+        )
+
+    upload = uploads.start(name.strip(), color, filename, size)
+    response = JsonResponse(_upload_data(upload, 0), status=201)
+    response["Location"] = f"/api/uploads/{upload.pk}"
+    return response
+
+
+@csrf_exempt
+def upload_detail(request, upload_id):
+    """GET: how much has arrived. PUT: the next chunk, with Content-Range."""
+    if request.method not in ("GET", "PUT"):
+        return HttpResponseNotAllowed(["GET", "PUT"])
+    upload = Upload.objects.filter(pk=upload_id).first()
+    if upload is None:
+        return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    if request.method == "GET":
+        return JsonResponse(_upload_data(upload, uploads.offset(upload)))
+
+    match = _CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+    if not match or int(match[3]) != upload.size or int(match[2]) < int(match[1]):
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": f"Content-Range: bytes <first>-<last>/{upload.size}"
+                    " required",
+                }
+            },
+            status=400,
+        )
+    start, last = int(match[1]), int(match[2])
+    if start >= upload.size:
+        # Complete already. The last chunk started processing, but a restart
+        # loses the job, so a complete part is submitted again; submit skips
+        # uploads that are still being worked on
+        if uploads.offset(upload) == upload.size:
+            uploads.submit(upload)
+        return JsonResponse(_upload_data(upload, upload.size), status=202)
+    try:
+        offset = uploads.write_chunk(upload, start, request, last - start + 1)
+    except uploads.OffsetMismatch as e:
+        return JsonResponse(
+            {
+                "error": {"code": "OFFSET_MISMATCH", "message": str(e)},
+                "offset": e.offset,
+            },
+            status=409,
+        )
+    except uploads.UploadBusy:
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "UPLOAD_BUSY",
+                    "message": "another request is writing to this upload",
+                }
+            },
+            status=409,
+        )
+    if offset < upload.size:
+        return JsonResponse(_upload_data(upload, offset))
+    uploads.submit(upload)
+    return JsonResponse(_upload_data(upload, offset), status=202)
 
 
 @csrf_exempt
@@ -85,56 +539,253 @@ def create_order(request):
             status=400,
         )
 
-    cleaned = []
-    for it in items:
-        try:
-            pid = int(it.get("printable_id"))
-            qty = int(it.get("qty", 1))
-        except Exception:
-            return JsonResponse(
-                {"error": {"code": "BAD_REQUEST", "message": "Invalid item"}},
-                status=400,
-            )
-        if qty <= 0:
-            return JsonResponse(
-                {"error": {"code": "BAD_REQUEST", "message": "qty must be > 0"}},
-                status=400,
-            )
-        # Ensure printable exists
-        if not Printable.objects.filter(id=pid).exists():
-            return JsonResponse(
-                {
-                    "error": {
-                        "code": "BAD_REQUEST",
-                        "message": f"printable_id {pid} not found",
-                    }
-                },
-                status=400,
-            )
-        cleaned.append({"printable_id": pid, "qty": qty})
+    try:
+        cleaned = validate_items(items, known_ids=catalog.printable_ids())
+    except InvalidItem as e:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": str(e)}}, status=400
+        )
 
     order = Order.objects.create(status="queued", items=cleaned)
     return JsonResponse({"order_id": order.id, "status": order.status}, status=201)
 
 
-def order_status(request, order_id: int):
+@csrf_exempt
+def create_orders_bulk(request):
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        payload = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "Invalid JSON"}}, status=400
+        )
+
+    orders = payload.get("orders")
+    if not isinstance(orders, list) or not orders:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "orders[] required"}},
+            status=400,
+        )
+    max_orders = getattr(settings, "BULK_ORDERS_MAX", 10000)
+    if len(orders) > max_orders:
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": f"at most {max_orders} orders per request",
+                }
+            },
+            status=400,
+        )
+
+    # Parse everything first so all printable ids are checked in one pass
+    parsed = []
+    for entry in orders:
+        items = entry.get("items") if isinstance(entry, dict) else None
+        if not isinstance(items, list) or not items:
+            parsed.append(None)
+        else:
+            parsed.append(parse_items(items))
+    existing = existing_printable_ids(
+        (pid for p in parsed if p for pid, _ in p[0]),
+        known_ids=catalog.printable_ids(),
+    )
+
+    results = []
+    to_create = []
+    for p in parsed:
+        try:
+            if p is None:
+                raise InvalidItem("items[] required")
+            cleaned = clean_items(*p, existing)
+        except InvalidItem as e:
+            results.append({"error": {"code": "BAD_REQUEST", "message": str(e)}})
+            continue
+        order = Order(status="queued", items=cleaned)
+        to_create.append(order)
+        results.append(order)
+
+    with transaction.atomic():
+        Order.objects.bulk_create(to_create)
+    # bulk_create skips the signals that normally feed the dispatcher
+    for order in to_create:
+        dispatcher.push(order.id, order.created_at)
+
+    results = [
+        {"order_id": r.id, "status": r.status} if isinstance(r, Order) else r
+        for r in results
+    ]
+    return JsonResponse({"orders": results}, status=201 if to_create else 400)
+
+
+def _wait_timeout(request) -> float:
+    limit = float(getattr(settings, "ORDER_WAIT_MAX_TIMEOUT", 25.0))
+    timeout = float(request.GET.get("timeout", limit))
+    if not timeout >= 0:
+        raise ValueError(timeout)
+    return min(timeout, limit)
+
+
+async def _order_event(order_id: int) -> OrderEvent | None:
+    row = await Order.objects.filter(pk=order_id).values(*ORDER_FIELDS).afirst()
+    return OrderEvent.from_row(row) if row else None
+
+
+async def order_status(request, order_id: int):
+    """The order's state; with ``?since=<version>``, a long poll.
+
+    A long poll is answered as soon as the order's status has changed since
+    ``version``, or with the unchanged state after ``?timeout=`` seconds.
+    """
     if request.method != "GET":
         return HttpResponseNotAllowed(["GET"])
+    event = await _order_event(order_id)
+    if event is None:
+        return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    if "since" not in request.GET:
+        return JsonResponse(event.data())
     try:
-        o = Order.objects.get(pk=order_id)
+        since = int(request.GET["since"])
+        timeout = _wait_timeout(request)
+    except ValueError:
         return JsonResponse(
             {
-                "id": o.id,
-                "status": o.status,
-                "assigned_printer_id": o.assigned_printer_id,
-            }
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": "since must be a version, timeout in seconds",
+                }
+            },
+            status=400,
         )
-    except Order.DoesNotExist:
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # A stale version is answered right away; updates that keep the status
+    # don't end the wait
+    while event.version == since and (remaining := deadline - loop.time()) > 0:
+        changed = await order_events.wait(order_id, since, remaining)
+        if changed is None:
+            break
+        if changed.status == event.status:
+            since = changed.version
+        event = changed
+    response = JsonResponse(event.data())
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def _sse(event: OrderEvent) -> str:
+    return f"id: {event.version}\ndata: {json.dumps(event.data())}\n\n"
+
+
+async def _order_stream(event: OrderEvent, resumed: bool):
+    keepalive = float(getattr(settings, "ORDER_EVENTS_KEEPALIVE", 15.0))
+    if not resumed:
+        yield _sse(event)
+    sent = event.status
+    while sent not in TERMINAL_STATUSES:
+        changed = await order_events.wait(event.id, event.version, keepalive)
+        if changed is None:
+            yield ": keepalive\n\n"
+            continue
+        event = changed
+        if event.status != sent:
+            yield _sse(event)
+            sent = event.status
+
+
+async def order_stream(request, order_id: int):
+    """Server-sent events: the order's state, then each change of its status.
+
+    The stream ends after a final status. Clients reconnecting with the
+    ``Last-Event-ID`` of the current state only get what comes after it.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    event = await _order_event(order_id)
+    if event is None:
         return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    resumed = request.headers.get("Last-Event-ID") == str(event.version)
+    if resumed and event.status in TERMINAL_STATUSES:
+        # Nothing more will come; 204 tells EventSource to stop reconnecting
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        _order_stream(event, resumed), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: pass events on as they come
+    return response
+
+
+def order_progress(request, order_id: int):
+    """The order's latest print progress, and its history in ``?points=``.
+
+    With ``?points=0`` the latest value of a job in progress is answered
+    from memory.
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    try:
+        points = int(
+            request.GET.get("points", getattr(settings, "PROGRESS_HISTORY_POINTS", 200))
+        )
+        if points < 0:
+            raise ValueError(points)
+    except ValueError:
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": "points must be a non-negative integer",
+                }
+            },
+            status=400,
+        )
+
+    latest = job_progress.latest(order_id)
+    history = []
+    if points or latest is None:
+        unflushed = job_progress.unflushed(order_id)
+        history = list(
+            ProgressSample.objects.filter(order_id=order_id)
+            .order_by("recorded_at")
+            .values_list("recorded_at", "progress")
+        )
+        # Skip what a flush may have stored in between
+        history += [s for s in unflushed if not history or s[0] > history[-1][0]]
+        latest = latest or (history[-1] if history else None)
+        if latest is None and not Order.objects.filter(pk=order_id).exists():
+            return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
+    at, value = latest or (None, None)
+    return JsonResponse(
+        {
+            "order_id": order_id,
+            "progress": value,
+            "at": at,
+            "history": [{"at": t, "progress": p} for t, p in decimate(history, points)],
+        }
+    )
+
+
+def _heartbeat_only(printer, name: str, status: str) -> bool:
+    """Whether a ping from ``printer`` changes nothing but its heartbeat."""
+    if printer.name != name or printer.status != status:
+        return False
+    if status == "idle" and not printer.current_order_id:
+        # Free for work: only an empty queue known to be current will do
+        return len(dispatcher) == 0 and not dispatcher.needs_sync()
+    return True
 
 
 @csrf_exempt
-def printer_ping(request):
+async def printer_ping(request):
+    """Printer heartbeat; the answer carries a job when one is assigned, and
+    when to ping next.
+
+    Pings that change nothing, the bulk of the traffic, are answered on the
+    event loop from the fleet registry. The rest go to ``_ping`` in a thread.
+    """
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
     try:
@@ -144,74 +795,287 @@ def printer_ping(request):
             {"error": {"code": "BAD_REQUEST", "message": "Invalid JSON"}}, status=400
         )
 
-    printer_id = payload.get("printer_id")
-    name = payload.get("name") or "printer"
-    status = payload.get("status") or "idle"
+    printer_id, name, status, value = _ping_fields(payload)
+    printer = fleet.cached(printer_id) if printer_id else None
+    if printer is not None and _heartbeat_only(printer, name, status):
+        now = clock.now()
+        if fleet.heartbeat_nowait(printer, now):
+            await sync_to_async(heartbeats.flush)()
+        if _record_progress(printer, status, value, now):
+            await sync_to_async(job_progress.flush)()
+        return JsonResponse(_answer(printer.id, status, now))
+    return JsonResponse(await sync_to_async(_ping)(printer_id, name, status, value))
 
-    from .models import Printer  # local import to avoid circular issues in some tools
 
-    if printer_id:
-        try:
-            printer = Printer.objects.get(pk=int(printer_id))
-        except (Printer.DoesNotExist, ValueError):
-            # Create if unknown id sent
-            printer = Printer.objects.create(name=name)
-    else:
-        printer = Printer.objects.create(name=name)
+def _ping_fields(payload: dict) -> tuple[int | None, str, str, int | None]:
+    """``(printer_id, name, status, progress)`` of a ping; an unusable id is None."""
+    try:
+        printer_id = int(payload.get("printer_id") or 0) or None
+    except (TypeError, ValueError):
+        printer_id = None
+    return (
+        printer_id,
+        payload.get("name") or "printer",
+        payload.get("status") or "idle",
+        parse_progress(payload.get("progress")),
+    )
+
+
+def _instruction(job) -> dict:
+    return {
+        "job_id": job.id,
+        "order_id": job.id,
+        "items": job.items,
+        "started_at": clock.now().isoformat(),
+    }
+
+
+def _answer(printer_id: int, status: str, at, instruction=None) -> dict:
+    answer = {"printer_id": printer_id}
+    if instruction:
+        answer["instruction"] = instruction
+        status = "printing"
+    answer["next_ping_in"] = next_ping_in(printer_id, status, at)
+    return answer
 
-    # Update printer heartbeat
-    printer.name = name or printer.name
-    printer.status = status
-    printer.last_ping_at = timezone.now()
 
-    # If printer reports printing, update current order progress
-    if printer.current_order and status == "printing":
+def _record_progress(printer, status: str, value: int | None, at) -> bool:
+    """Buffer the progress of the printer's job; returns whether to flush."""
+    if value is None or status != "printing" or not printer.current_order_id:
+        return False
+    return job_progress.record(printer.current_order_id, at, value)
+
+
+def _ping(printer_id: int | None, name: str, status: str, value: int | None) -> dict:
+    """A ping that needs the database; returns the response body."""
+    now = clock.now()
+    printer = fleet.get(printer_id) if printer_id else None
+    created = printer is None
+    if created:
+        # Create if unknown id sent
+        printer = fleet.create(name=name, status=status, last_ping_at=now)
+
+    # Only columns that actually changed are written; the heartbeat itself
+    # goes through the coalescing buffer.
+    changed = {}
+    if name and printer.name != name:
+        changed["name"] = name
+    if printer.status != status:
+        changed["status"] = status
+
+    # If printer starts printing, make sure its current order reflects it
+    if printer.current_order_id and status == "printing" and "status" in changed:
+        started = (
+            Order.objects.filter(pk=printer.current_order_id)
+            .exclude(status="printing")
+            .update(status="printing", updated_at=now)
+        )
+        if started:
+            order_events.publish(
+                OrderEvent(
+                    id=printer.current_order_id,
+                    status="printing",
+                    assigned_printer_id=printer.id,
+                    version=order_version(now),
+                )
+            )
+
+    # Assign new job if idle and no current job. The claim and the printer
+    # row are written together, so an order is never left printing on a
+    # printer that doesn't know it.
+    claiming = status == "idle" and not printer.current_order_id
+    job = None
+    if claiming or changed:
         try:
-            o = printer.current_order
-            o.status = "printing"
-            o.save(update_fields=["status", "updated_at"])
-        except Order.DoesNotExist:
-            pass
+            with transaction.atomic():
+                job = dispatcher.claim(printer.id) if claiming else None
+                if job:
+                    changed["current_order_id"] = job.id
+                    changed["status"] = "printing"
+                if changed:
+                    fleet.update(printer, **changed)
+        except Exception:
+            if job:
+                dispatcher.push(job.id, job.created_at)
+            fleet.invalidate(printer.id)
+            raise
 
     instruction = None
-    # Assign new job if idle and no current job
-    if status == "idle" and not printer.current_order:
+    if job:
+        order_events.publish(OrderEvent.from_order(job))
+        instruction = _instruction(job)
+    if not created:
+        fleet.heartbeat(printer, now)
+    if _record_progress(printer, status, value, now):
+        job_progress.flush()
+
+    return _answer(printer.id, status, now, instruction)
+
+
+@csrf_exempt
+async def printer_ping_batch(request):
+    """Pings for many printers at once, e.g. from a gateway: ``{"pings": [...]}``.
+
+    Answers ``{"results": [...]}`` with what ``printer_ping`` would have
+    answered each ping, in order. Heartbeat-only pings are answered on the
+    event loop; the rest share one thread and one transaction in
+    ``_ping_batch``.
+    """
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    try:
+        payload = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "Invalid JSON"}}, status=400
+        )
+
+    pings = payload.get("pings")
+    if not isinstance(pings, list) or not pings:
+        return JsonResponse(
+            {"error": {"code": "BAD_REQUEST", "message": "pings[] required"}},
+            status=400,
+        )
+    max_pings = getattr(settings, "PING_BATCH_MAX", 1000)
+    if len(pings) > max_pings:
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": f"at most {max_pings} pings per request",
+                }
+            },
+            status=400,
+        )
+
+    now = clock.now()
+    results = [None] * len(pings)
+    rest = []
+    flush_heartbeats = flush_progress = False
+    for i, ping in enumerate(pings):
+        if not isinstance(ping, dict):
+            results[i] = {
+                "error": {"code": "BAD_REQUEST", "message": "ping must be an object"}
+            }
+            continue
+        printer_id, name, status, value = fields = _ping_fields(ping)
+        printer = fleet.cached(printer_id) if printer_id else None
+        if printer is not None and _heartbeat_only(printer, name, status):
+            flush_heartbeats |= fleet.heartbeat_nowait(printer, now)
+            flush_progress |= _record_progress(printer, status, value, now)
+            results[i] = _answer(printer.id, status, now)
+        else:
+            rest.append((i, fields))
+
+    if rest:
+        answers = await sync_to_async(_ping_batch)([f for _, f in rest], now)
+        for (i, _), answer in zip(rest, answers):
+            results[i] = answer
+    else:
+        if flush_heartbeats:
+            await sync_to_async(heartbeats.flush)()
+        if flush_progress:
+            await sync_to_async(job_progress.flush)()
+    return JsonResponse({"results": results})
+
+
+def _ping_batch(pings: list[tuple], now) -> list[dict]:
+    """Pings that need the database; returns the response bodies.
+
+    Does what ``_ping`` does for each, with one query per kind of change:
+    registering, updating printers, starting and claiming orders. Heartbeats
+    and progress are flushed at most once.
+
+    All of it is one transaction, so a claimed order and the printer that
+    holds it are written together.
+    """
+    known = fleet.get_many([printer_id for printer_id, *_ in pings if printer_id])
+    changes = {}
+    starting = {}
+    for printer_id, name, status, _ in pings:
+        printer = known.get(printer_id)
+        if printer is None:
+            continue
+        changed = changes.setdefault(printer.id, {})
+        if name and printer.name != name:
+            changed["name"] = name
+        if printer.status != status:
+            changed["status"] = status
+        if printer.current_order_id and status == "printing" and "status" in changed:
+            starting[printer.current_order_id] = printer.id
+
+    events = []
+    created = []
+    jobs = {}
+    try:
         with transaction.atomic():
-            job = (
-                Order.objects.select_for_update()
-                .filter(status="queued")
-                .order_by("created_at")
-                .first()
+            unknown = [(n, s) for i, n, s, _ in pings if known.get(i) is None]
+            created = fleet.create_many(unknown, now) if unknown else []
+            if starting:
+                Order.objects.filter(pk__in=starting).exclude(status="printing").update(
+                    status="printing", updated_at=now
+                )
+                for order_id in Order.objects.filter(
+                    pk__in=starting, status="printing", updated_at=now
+                ).values_list("id", flat=True):
+                    events.append(
+                        OrderEvent(
+                            id=order_id,
+                            status="printing",
+                            assigned_printer_id=starting[order_id],
+                            version=order_version(now),
+                        )
+                    )
+
+            new = iter(created)
+            printers = [known.get(i) or next(new) for i, *_ in pings]
+            # A printer pinging twice in one batch still gets one job
+            idle = dict.fromkeys(
+                printer.id
+                for printer, (_, _, status, _) in zip(printers, pings)
+                if status == "idle" and not printer.current_order_id
             )
-            if job:
-                job.status = "printing"
-                job.assigned_printer_id = printer.id
-                job.save(
-                    update_fields=[
-                        "status",
-                        "assigned_printer_id",
-                        "updated_at",
-                    ]
+            jobs = dispatcher.claim_many(list(idle)) if idle else {}
+            for printer_id, job in jobs.items():
+                events.append(OrderEvent.from_order(job))
+                changes.setdefault(printer_id, {}).update(
+                    current_order_id=job.id, status="printing"
                 )
-                printer.current_order = job
-                printer.status = "printing"
-                instruction = {
-                    "job_id": job.id,
-                    "order_id": job.id,
-                    "items": job.items,
-                    "started_at": timezone.now().isoformat(),
-                }
+            by_id = {printer.id: printer for printer in printers}
+            fleet.update_many([(by_id[i], c) for i, c in changes.items() if c])
+    except Exception:
+        for job in jobs.values():
+            dispatcher.push(job.id, job.created_at)
+        for printer_id in [*changes, *(printer.id for printer in created)]:
+            fleet.invalidate(printer_id)
+        raise
+    for event in events:
+        order_events.publish(event)
 
-    printer.save()
+    new_ids = {printer.id for printer in created}
+    flush_heartbeats = flush_progress = False
+    for printer, (_, _, status, value) in zip(printers, pings):
+        if printer.id not in new_ids:
+            flush_heartbeats |= fleet.heartbeat_nowait(printer, now)
+        flush_progress |= _record_progress(printer, status, value, now)
+    if flush_heartbeats:
+        heartbeats.flush()
+    if flush_progress:
+        job_progress.flush()
 
-    resp = {"printer_id": printer.id}
-    if instruction:
-        resp["instruction"] = instruction
-    return JsonResponse(resp)
+    instructions = {i: _instruction(job) for i, job in jobs.items()}
+    return [
+        _answer(printer.id, status, now, instructions.get(printer.id))
+        for printer, (_, _, status, _) in zip(printers, pings)
+    ]
 
 
 @csrf_exempt
-def job_complete(request, job_id: int):
+async def job_complete(request, job_id: int):
+    """The printer is done with the job: ``{"printer_id", "status"}``.
+
+    ``status`` is ``complete`` (the default) or ``failed``.
+    """
     if request.method != "POST":
         return HttpResponseNotAllowed(["POST"])
     try:
@@ -227,9 +1091,20 @@ def job_complete(request, job_id: int):
             {"error": {"code": "BAD_REQUEST", "message": "printer_id required"}},
             status=400,
         )
+    result = payload.get("status") or "complete"
+    if result not in ("complete", "failed"):
+        return JsonResponse(
+            {
+                "error": {
+                    "code": "BAD_REQUEST",
+                    "message": "status must be complete or failed",
+                }
+            },
+            status=400,
+        )
 
     try:
-        order = Order.objects.get(pk=job_id)
+        order = await Order.objects.aget(pk=job_id)
     except Order.DoesNotExist:
         return JsonResponse({"error": {"code": "NOT_FOUND"}}, status=404)
 
@@ -239,19 +1114,21 @@ def job_complete(request, job_id: int):
             status=400,
         )
 
-    # Mark order complete
-    order.status = "complete"
-    order.save(update_fields=["status", "updated_at"])
-
-    from .models import Printer  # local import as above
+    order.status = result
+    await order.asave(update_fields=["status", "updated_at"])
+    if result == "complete":
+        await sync_to_async(job_progress.finish)(order.id, order.updated_at)
+    elif (latest := job_progress.latest(order.id)) is not None:
+        # Where the failed print stopped
+        await sync_to_async(job_progress.finish)(order.id, order.updated_at, latest[1])
 
     try:
-        pr = Printer.objects.get(pk=int(printer_id))
-        if pr.current_order_id == order.id:
-            pr.current_order = None
-            pr.status = "idle"
-            pr.save(update_fields=["current_order", "status", "last_ping_at"])
-    except (Printer.DoesNotExist, ValueError):
-        pass
+        pr = fleet.cached(int(printer_id)) or await sync_to_async(fleet.get)(
+            int(printer_id)
+        )
+    except ValueError:
+        pr = None
+    if pr and pr.current_order_id == order.id:
+        await sync_to_async(fleet.update)(pr, current_order_id=None, status="idle")
 
     return JsonResponse({"ok": True})
@@ -0,0 +1,479 @@
+"""Simulate a fleet of printers from one process with asyncio.
+
+Each virtual printer is a coroutine following the same protocol as
+``PrinterMock``: it pings, takes the job it is handed, reports progress while
+printing and completes the job when its print time is up. All printers share
+a small pool of keep-alive HTTP connections, so thousands of them cost a few
+sockets and no threads.
+
+With ``FleetConfig.gateway`` set, printers are grouped behind
+``VirtualGateway``s, which send their pings in one batch request each.
+
+Printers ping again when the API's answer says to (``next_ping_in``), or
+every ``FleetConfig.interval`` with ``adaptive`` off, and back off
+exponentially after failed pings. A job whose completion couldn't be
+reported is kept, and reported again on a later ping, also with backoff.
+"""
+
+import asyncio
+import json
+import os
+import random
+import ssl
+import sys
+import time
+import urllib.parse
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    from printer import backoff  # type: ignore
+except Exception:  # pragma: no cover - fallback for direct execution
+    sys.path.append(str(Path(__file__).parent))
+    from printer import backoff  # type: ignore
+
+ADJECTIVES = [
+    "Sleepy",
+    "Happy",
+    "Grumpy",
+    "Silly",
+    "Brave",
+    "Clever",
+    "Witty",
+    "Funky",
+    "Jolly",
+    "Zippy",
+]
+ANIMALS = [
+    "Panda",
+    "Otter",
+    "Llama",
+    "Penguin",
+    "Koala",
+    "Giraffe",
+    "Sloth",
+    "Moose",
+    "Ferret",
+    "Hedgehog",
+]
+
+
+def printer_names(count: int, seed: int | None = None) -> list[str]:
+    """``count`` distinct printer names, the same ones for the same seed."""
+    rng = random.Random(seed)
+    combos = [f"{a}-{b}" for a in ADJECTIVES for b in ANIMALS]
+    rng.shuffle(combos)
+    # Past the plain combinations, number them
+    return [
+        combos[i % len(combos)]
+        + (f"-{i // len(combos) + 1}" if i >= len(combos) else "")
+        for i in range(count)
+    ]
+
+
+class HttpError(Exception):
+    pass
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    status_line = await reader.readuntil(b"\r\n")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError):
+        raise HttpError(f"bad status line {status_line!r}")
+    headers = {}
+    while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while size := int((await reader.readuntil(b"\r\n")).split(b";")[0], 16):
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        while await reader.readuntil(b"\r\n") != b"\r\n":
+            pass  # trailers
+        body = b"".join(chunks)
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return status, headers, body
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to the API, shared by many printers.
+
+    At most ``size`` requests are in flight; each reuses an idle connection
+    when there is one. Latencies go to ``stats``, not counting the wait for
+    a free slot.
+    """
+
+    def __init__(
+        self, api_base: str, size: int = 100, timeout: float = 5.0, stats=None
+    ):
+        url = urllib.parse.urlsplit(api_base)
+        self.host = url.hostname or "127.0.0.1"
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: list = []
+        self._slots = asyncio.Semaphore(size)
+        self.stats = stats
+
+    async def _connect(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+            self.timeout,
+        )
+
+    async def request(self, method: str, path: str, payload=None) -> tuple[int, dict]:
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        head = (
+            f"{method} {self.prefix}{path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        ).encode("latin-1")
+        async with self._slots:
+            start = time.monotonic()
+            try:
+                status, data = await self._send(head + body)
+            except BaseException:
+                if self.stats:
+                    self.stats.request(time.monotonic() - start, ok=False, path=path)
+                raise
+            if self.stats:
+                self.stats.request(time.monotonic() - start, status < 400, path)
+        try:
+            return status, json.loads(data) if data else {}
+        except ValueError:
+            return status, {}
+
+    async def _send(self, request: bytes) -> tuple[int, bytes]:
+        while True:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._connect()
+            try:
+                writer.write(request)
+                status, headers, data = await asyncio.wait_for(
+                    _read_response(reader), self.timeout
+                )
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue  # closed by the server while idle; try a new one
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return status, data
+
+    def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+class Stats:
+    """Request counts and latencies, reported and reset every window."""
+
+    def __init__(self, window_samples: int = 100_000):
+        self.started = time.monotonic()
+        self.total = {
+            "requests": 0,
+            "errors": 0,
+            "pings": 0,
+            "jobs_started": 0,
+            "jobs_completed": 0,
+        }
+        self._latencies = deque(maxlen=window_samples)
+        self._window = dict.fromkeys(self.total, 0)
+        self._window_started = self.started
+
+    def count(self, key: str, n: int = 1) -> None:
+        self.total[key] += n
+        self._window[key] += n
+
+    def request(self, seconds: float, ok: bool, path: str = "") -> None:
+        self.count("requests")
+        if not ok:
+            self.count("errors")
+        self._latencies.append(seconds)
+
+    def job_started(self, job_id: int) -> None:
+        self.count("jobs_started")
+
+    def job_completed(self, job_id: int) -> None:
+        self.count("jobs_completed")
+
+    def report(self) -> str:
+        now = time.monotonic()
+        elapsed = max(now - self._window_started, 1e-9)
+        latencies = sorted(self._latencies)
+
+        def pct(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        line = (
+            f"{self._window['requests'] / elapsed:7.1f} req/s  "
+            f"{self._window['pings'] / elapsed:7.1f} pings/s  "
+            f"p50 {pct(0.5):6.1f} ms  p99 {pct(0.99):6.1f} ms  "
+            f"errors {self._window['errors']}  "
+            f"jobs +{self._window['jobs_started']}/-{self._window['jobs_completed']}"
+        )
+        self._latencies.clear()
+        self._window = dict.fromkeys(self.total, 0)
+        self._window_started = now
+        return line
+
+
+@dataclass
+class FleetConfig:
+    printers: int = 2
+    interval: float = 5.0  # seconds between pings, unless the API says otherwise
+    jitter: float = 0.1  # +/- fraction of the interval
+    adaptive: bool = True  # ping when the API says to, rather than every interval
+    backoff_max: float = 60.0  # seconds between pings at most, after errors
+    print_time: tuple[float, float] = (15.0, 25.0)  # seconds, uniform
+    connections: int = 100
+    timeout: float = 5.0
+    seed: int | None = None
+    gateway: int = 0  # printers per batch ping, 0 for one ping per printer
+
+
+class VirtualPrinter:
+    def __init__(self, name: str, printer_id, pool, stats, config, rng):
+        self.name = name
+        self.printer_id = printer_id
+        self.pool = pool
+        self.stats = stats
+        self.config = config
+        self.rng = rng
+        self.job_id: int | None = None
+        self.job_started = 0.0
+        self.job_ends = 0.0
+        self.failures = 0
+        self.complete_failures = 0
+        self.complete_retry_at = 0.0
+
+    async def _call(self, path: str, payload: dict) -> tuple[int, dict]:
+        try:
+            return await self.pool.request("POST", path, payload)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HttpError):
+            return 0, {}
+
+    def progress(self, now: float) -> int:
+        if self.job_id is None:
+            return 0
+        elapsed = (now - self.job_started) / (self.job_ends - self.job_started)
+        return min(100, int(elapsed * 100))
+
+    async def complete(self) -> None:
+        """Report the current job done if its print time is up.
+
+        If the report doesn't get through, the printer keeps the job (and
+        pings as printing it) and tries again once its backoff is over.
+        """
+        now = asyncio.get_running_loop().time()
+        if self.job_id is None or now < max(self.job_ends, self.complete_retry_at):
+            return
+        status, _ = await self._call(
+            f"/api/jobs/{self.job_id}/complete", {"printer_id": self.printer_id}
+        )
+        if status == 0 or status >= 500:
+            self.complete_failures += 1
+            self.complete_retry_at = now + backoff(
+                self.complete_failures,
+                self.config.interval,
+                self.config.backoff_max,
+                self.rng,
+            )
+            return
+        if status == 200:
+            self.stats.job_completed(self.job_id)
+        # Any other answer won't change on a retry (e.g. the job is gone)
+        self.job_id = None
+        self.complete_failures = 0
+        self.complete_retry_at = 0.0
+
+    def ping(self) -> dict:
+        self.stats.count("pings")
+        return {
+            "printer_id": self.printer_id,
+            "name": self.name,
+            "status": "printing" if self.job_id is not None else "idle",
+            "progress": self.progress(asyncio.get_running_loop().time()),
+        }
+
+    def answered(self, body: dict) -> float:
+        """Act on the API's answer to a ping; returns seconds until the next."""
+        self.failures = 0
+        self.printer_id = body.get("printer_id", self.printer_id)
+        instruction = body.get("instruction")
+        if instruction and self.job_id is None:
+            self.job_id = int(instruction["job_id"])
+            self.job_started = asyncio.get_running_loop().time()
+            self.job_ends = self.job_started + self.rng.uniform(*self.config.print_time)
+            self.stats.job_started(self.job_id)
+        return _next_ping(self.config, self.rng, body.get("next_ping_in"))
+
+    def failed(self) -> float:
+        """Count a failed ping; returns seconds until the next."""
+        self.failures += 1
+        return backoff(
+            self.failures, self.config.interval, self.config.backoff_max, self.rng
+        )
+
+    async def step(self) -> float:
+        await self.complete()
+        status, body = await self._call("/api/printers/ping", self.ping())
+        return self.answered(body) if status == 200 else self.failed()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await _every(self.config, self.rng, self.step, stop)
+
+
+class VirtualGateway:
+    """Pings for several ``VirtualPrinter``s with one batch request."""
+
+    def __init__(self, printers: list[VirtualPrinter], pool, config, rng):
+        self.printers = printers
+        self.pool = pool
+        self.config = config
+        self.rng = rng
+        self.failures = 0
+
+    async def step(self) -> float:
+        await asyncio.gather(*(p.complete() for p in self.printers))
+        try:
+            status, body = await self.pool.request(
+                "POST",
+                "/api/printers/ping/batch",
+                {"pings": [p.ping() for p in self.printers]},
+            )
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HttpError):
+            status = 0
+        if status != 200:
+            self.failures += 1
+            return backoff(
+                self.failures, self.config.interval, self.config.backoff_max, self.rng
+            )
+        self.failures = 0
+        # As often as the most pressing of its printers is asked to
+        return min(
+            (
+                printer.answered(result)
+                for printer, result in zip(self.printers, body.get("results", []))
+                if "error" not in result
+            ),
+            default=_next_ping(self.config, self.rng, None),
+        )
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await _every(self.config, self.rng, self.step, stop)
+
+
+def _next_ping(config, rng, hint: float | None) -> float:
+    if config.adaptive and hint:
+        return hint
+    return config.interval * (1 + rng.uniform(-config.jitter, config.jitter))
+
+
+async def _every(config, rng, step, stop: asyncio.Event) -> None:
+    """Call ``step`` until ``stop``, waiting as long as it returns."""
+    # Spread the first pings over an interval rather than all at once
+    delay = rng.uniform(0, config.interval)
+    while True:
+        try:
+            await asyncio.wait_for(stop.wait(), delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+        delay = await step()
+
+
+def start(printers: list[VirtualPrinter], config, rng, stop) -> list[asyncio.Task]:
+    """Tasks running ``printers``, behind gateways if ``config.gateway`` is set."""
+    if not config.gateway:
+        return [asyncio.create_task(p.run(stop)) for p in printers]
+    return [
+        asyncio.create_task(
+            VirtualGateway(
+                printers[i : i + config.gateway],
+                printers[i].pool,
+                config,
+                random.Random(rng.random()),
+            ).run(stop)
+        )
+        for i in range(0, len(printers), config.gateway)
+    ]
+
+
+def load_ids(path: str | None) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_ids(path: str | None, printers) -> None:
+    if path:
+        ids = {p.name: p.printer_id for p in printers if p.printer_id}
+        with open(path, "w") as f:
+            json.dump(ids, f)
+
+
+async def run_fleet(
+    api_base: str,
+    config: FleetConfig,
+    duration: float | None = None,
+    report_every: float = 10.0,
+    state_file: str | None = None,
+) -> Stats:
+    """Run ``config.printers`` virtual printers until ``duration`` is up.
+
+    Prints a line of stats every ``report_every`` seconds. Printer ids are
+    kept in ``state_file`` (by name) so a rerun reuses the same printers.
+    """
+    rng = random.Random(config.seed)
+    stats = Stats()
+    pool = ConnectionPool(api_base, config.connections, config.timeout, stats)
+    ids = load_ids(state_file)
+    printers = [
+        VirtualPrinter(
+            name, ids.get(name), pool, stats, config, random.Random(rng.random())
+        )
+        for name in printer_names(config.printers, config.seed)
+    ]
+    stop = asyncio.Event()
+    tasks = start(printers, config, rng, stop)
+
+    async def report():
+        while True:
+            await asyncio.sleep(report_every)
+            print(f"[fleet x{config.printers}] {stats.report()}", flush=True)
+
+    reporter = asyncio.create_task(report()) if report_every else None
+    try:
+        if duration is None:
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.sleep(duration)
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if reporter:
+            reporter.cancel()
+        pool.close()
+        save_ids(state_file, printers)
+    return stats
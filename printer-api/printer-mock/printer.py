@@ -1,130 +1,324 @@
 #!/usr/bin/env python3
 import json
 import os
+import random
 import time
 import urllib.request
 import urllib.error
+from dataclasses import dataclass
+
+
+class SystemClock:
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+@dataclass
+class Behavior:
+    """How a printer prints, with its randomness drawn from ``seed``.
+
+    The defaults are the demo printer: a job advances 25% per ping and
+    nothing goes wrong.
+    """
+
+    interval: float = 5.0  # seconds between pings, unless the API says otherwise
+    print_time: tuple[float, float] | None = None  # seconds, uniform
+    failure_rate: float = 0.0  # chance that a job fails partway through
+    disconnect_rate: float = 0.0  # chance, per ping, of dropping off the network
+    offline_time: tuple[float, float] = (60.0, 600.0)  # seconds, uniform
+    backoff_max: float = 300.0  # seconds between pings at most, after errors
+    seed: int | float | None = None
+
+
+def backoff(failures: int, base: float, cap: float, rng) -> float:
+    """Seconds to wait after ``failures`` failed pings in a row.
+
+    Doubles with each failure up to ``cap``, and is drawn from the upper half
+    of that so printers that failed together do not come back together.
+    """
+    delay = min(cap, base * 2 ** (failures - 1))
+    return delay / 2 + rng.uniform(0, delay / 2)
 
 
 class PrinterMock:
+    """A printer talking to the API.
+
+    ``clock`` (``time()``, ``sleep()``) and ``transport`` (``post(path,
+    payload) -> (status, body)``) default to the real ones; a simulation
+    passes its own, see ``core.simulation`` in the API.
+    """
+
     def __init__(
         self,
         api_base: str | None = None,
         printer_name: str | None = None,
         state_file: str | None = None,
+        clock=None,
+        behavior: Behavior | None = None,
+        transport=None,
+        quiet: bool = False,
     ):
         self.api_base = api_base or os.environ.get("API_BASE", "http://127.0.0.1:8000")
         self.printer_name = printer_name or os.environ.get("PRINTER_NAME", "mock-01")
-        self.state_file = state_file or os.environ.get(
-            "PRINTER_STATE_FILE", ".printer_id"
+        # "" keeps the id in memory only
+        self.state_file = (
+            state_file
+            if state_file is not None
+            else os.environ.get("PRINTER_STATE_FILE", ".printer_id")
         )
         self.printer_id: str | None = None
+        self.clock = clock or SystemClock()
+        self.behavior = behavior or Behavior()
+        self.rng = random.Random(self.behavior.seed)
+        self.transport = transport or self._post
+        self.quiet = quiet
+        self.failures = 0
+
+        self.printing = False
+        self.current_job_id: int | None = None
+        self.progress = 0
+        self.job_started = 0.0
+        self.job_time = 0.0
+        self.fails_at: float | None = None
+
+    def log(self, *args) -> None:
+        if not self.quiet:
+            print(*args)
 
     # --- State helpers ---
     def load_printer_id(self):
-        if os.path.exists(self.state_file):
+        if self.state_file and os.path.exists(self.state_file):
             with open(self.state_file, "r") as f:
                 return f.read().strip() or None
         return None
 
     def save_printer_id(self, pid: str):
-        with open(self.state_file, "w") as f:
-            f.write(str(pid))
+        if self.state_file:
+            with open(self.state_file, "w") as f:
+                f.write(str(pid))
 
     # --- HTTP helpers ---
-    def ping(self, status: str = "idle", progress: int = 0):
-        url = f"{self.api_base}/api/printers/ping"
-        payload = {
-            "printer_id": self.printer_id,
-            "name": self.printer_name,
-            "status": status,
-            "progress": progress,
-        }
+    def _post(self, path: str, payload: dict) -> tuple[int, str]:
         data = json.dumps(payload).encode("utf-8")
         req = urllib.request.Request(
-            url, data=data, headers={"Content-Type": "application/json"}, method="POST"
-        )
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            body = resp.read().decode("utf-8")
-            return resp.status, json.loads(body) if body else {}
-
-    def complete_job(self, job_id: int):
-        url = f"{self.api_base}/api/jobs/{job_id}/complete"
-        payload = {"printer_id": self.printer_id}
-        data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(
-            url, data=data, headers={"Content-Type": "application/json"}, method="POST"
+            f"{self.api_base}{path}",
+            data=data,
+            headers={"Content-Type": "application/json"},
+            method="POST",
         )
         with urllib.request.urlopen(req, timeout=5) as resp:
             return resp.status, resp.read().decode("utf-8")
 
+    def ping_payload(self) -> dict:
+        return {
+            "printer_id": self.printer_id,
+            "name": self.printer_name,
+            "status": "printing" if self.printing else "idle",
+            "progress": self.progress,
+        }
+
+    def ping(self):
+        status, body = self.transport("/api/printers/ping", self.ping_payload())
+        return status, json.loads(body) if body else {}
+
+    def complete_job(self, job_id: int, status: str = "complete"):
+        payload = {"printer_id": self.printer_id, "status": status}
+        return self.transport(f"/api/jobs/{job_id}/complete", payload)
+
     # --- Main loop ---
+    def _start_job(self, instruction: dict) -> None:
+        self.current_job_id = int(instruction["job_id"])
+        self.printing = True
+        self.progress = 0
+        self.job_started = self.clock.time()
+        if self.behavior.print_time:
+            self.job_time = self.rng.uniform(*self.behavior.print_time)
+        fails = self.rng.random() < self.behavior.failure_rate
+        self.fails_at = self.rng.uniform(0, 100) if fails else None
+        self.log(f"[{self.printer_name}] Assigned job {self.current_job_id}")
+
+    def _advance(self) -> None:
+        if self.behavior.print_time:
+            elapsed = self.clock.time() - self.job_started
+            self.progress = min(100, int(elapsed / self.job_time * 100))
+        else:
+            # Advance progress ~every ping
+            self.progress = min(100, self.progress + 25)
+        if self.fails_at is not None and self.progress >= self.fails_at:
+            self._finish("failed")
+        elif self.progress >= 100 and self.current_job_id and self.printer_id:
+            self._finish("complete")
+
+    def _finish(self, result: str) -> None:
+        # Notify completion
+        try:
+            cstatus, cbody = self.complete_job(self.current_job_id, result)
+            self.log(
+                f"[{self.printer_name}] Job {self.current_job_id} {result}: HTTP {cstatus} {cbody}"
+            )
+        except Exception as e:
+            self.log(f"[{self.printer_name}] Completion failed:", e)
+        # Reset
+        self.printing = False
+        self.current_job_id = None
+        self.progress = 0
+        self.fails_at = None
+
+    def disconnects(self) -> float | None:
+        """Seconds this printer drops off the network for, if it does now."""
+        if self.rng.random() < self.behavior.disconnect_rate:
+            offline = self.rng.uniform(*self.behavior.offline_time)
+            self.log(f"[{self.printer_name}] Offline for {offline:.0f}s")
+            return offline
+        return None
+
+    def answered(self, body: dict) -> float:
+        """Act on the API's answer to a ping; returns seconds until the next."""
+        self.failures = 0
+        if not self.printer_id and "printer_id" in body:
+            self.printer_id = str(body["printer_id"]) or self.printer_id
+            if self.printer_id:
+                self.save_printer_id(self.printer_id)
+        if body.get("instruction") and not self.printing:
+            self._start_job(body["instruction"])
+        elif self.printing:
+            self._advance()
+        return body.get("next_ping_in") or self.behavior.interval
+
+    def failed(self) -> float:
+        """Count a failed ping; returns seconds until the next."""
+        self.failures += 1
+        return backoff(
+            self.failures, self.behavior.interval, self.behavior.backoff_max, self.rng
+        )
+
+    def step(self) -> float:
+        """Ping once and act on the answer; returns seconds until the next ping."""
+        offline = self.disconnects()
+        if offline is not None:
+            return offline
+        try:
+            status, body = self.ping()
+            if status == 200:
+                return self.answered(body)
+            self.log(f"[{self.printer_name}] Ping HTTP {status}", body)
+        except urllib.error.HTTPError as e:
+            self.log(f"[{self.printer_name}] Ping failed: HTTP {e.code} {_body(e)}")
+        except Exception as e:
+            self.log(f"[{self.printer_name}] Ping exception:", e)
+        return self.failed()
+
     def run(self):
         # Initialize state
         self.printer_id = self.load_printer_id()
-        print(
+        self.log(
             f"Printer mock started. API_BASE={self.api_base}, name={self.printer_name}, printer_id={self.printer_id}"
         )
         try:
-            printing = False
-            current_job_id = None
-            progress = 0
             while True:
-                try:
-                    status, body = self.ping(
-                        "printing" if printing else "idle", progress
-                    )
-                    if status == 200:
-                        if not self.printer_id and "printer_id" in body:
-                            self.printer_id = str(body["printer_id"]) or self.printer_id
-                            if self.printer_id:
-                                self.save_printer_id(self.printer_id)
-                        if body.get("instruction") and not printing:
-                            # Start a new job
-                            current_job_id = int(body["instruction"]["job_id"])  # type: ignore
-                            printing = True
-                            progress = 0
-                            print(
-                                f"[{self.printer_name}] Assigned job {current_job_id}"
-                            )
-                        elif printing:
-                            # Advance progress ~every ping
-                            progress = min(100, progress + 25)
-                            if progress >= 100 and current_job_id and self.printer_id:
-                                # Notify completion
-                                try:
-                                    cstatus, cbody = self.complete_job(current_job_id)
-                                    print(
-                                        f"[{self.printer_name}] Completed job {current_job_id}: HTTP {cstatus} {cbody}"
-                                    )
-                                except Exception as e:
-                                    print(
-                                        f"[{self.printer_name}] Completion failed:", e
-                                    )
-                                # Reset
-                                printing = False
-                                current_job_id = None
-                                progress = 0
-                        else:
-                            # Idle and no assignment
-                            pass
-                    else:
-                        print(f"[{self.printer_name}] Ping HTTP {status}", body)
-                except urllib.error.HTTPError as e:
-                    try:
-                        body = e.read().decode("utf-8")
-                    except Exception:
-                        body = "<no body>"
-                    print(f"[{self.printer_name}] Ping failed: HTTP {e.code} {body}")
-                except Exception as e:
-                    print(f"[{self.printer_name}] Ping exception:", e)
-                time.sleep(5)
+                self.clock.sleep(self.step())
         except KeyboardInterrupt:
-            print(f"[{self.printer_name}] Shutting down printer mock.")
+            self.log(f"[{self.printer_name}] Shutting down printer mock.")
+
+
+class Gateway:
+    """Several printers behind one connection, pinging the API together.
+
+    Each ``step`` sends the pings of the printers that are online in one
+    request to ``/api/printers/ping/batch``, as often as the most pressing of
+    them is asked to; jobs are still completed one by one.
+    """
+
+    def __init__(self, printers: list[PrinterMock], clock=None, transport=None):
+        self.printers = printers
+        self.clock = clock or printers[0].clock
+        self.transport = transport or printers[0].transport
+        self.behavior = printers[0].behavior
+        self.rng = random.Random(printers[0].rng.random())
+        self.failures = 0
+        self.back_at = [0.0] * len(printers)
+        self.log = printers[0].log
+
+    def step(self) -> float:
+        """Ping for the printers once; returns seconds until the next batch."""
+        now = self.clock.time()
+        online = []
+        for i, printer in enumerate(self.printers):
+            if self.back_at[i] > now:
+                continue
+            offline = printer.disconnects()
+            if offline is not None:
+                self.back_at[i] = now + offline
+            else:
+                online.append(printer)
+        if not online:
+            return self.behavior.interval
+        pings = [printer.ping_payload() for printer in online]
+        try:
+            status, body = self.transport("/api/printers/ping/batch", {"pings": pings})
+            results = json.loads(body)["results"] if status == 200 else None
+        except urllib.error.HTTPError as e:
+            self.log(f"[gateway] Ping failed: HTTP {e.code} {_body(e)}")
+            return self.failed()
+        except Exception as e:
+            self.log("[gateway] Ping exception:", e)
+            return self.failed()
+        if results is None:
+            self.log(f"[gateway] Ping HTTP {status}", body)
+            return self.failed()
+        self.failures = 0
+        delays = []
+        for printer, result in zip(online, results):
+            if "error" in result:
+                printer.log(f"[{printer.printer_name}] Ping rejected", result["error"])
+            else:
+                delays.append(printer.answered(result))
+        return min(delays, default=self.behavior.interval)
+
+    def failed(self) -> float:
+        self.failures += 1
+        return backoff(
+            self.failures, self.behavior.interval, self.behavior.backoff_max, self.rng
+        )
+
+    def run(self):
+        for printer in self.printers:
+            printer.printer_id = printer.load_printer_id()
+        self.log(f"Gateway started for {len(self.printers)} printers")
+        try:
+            while True:
+                self.clock.sleep(self.step())
+        except KeyboardInterrupt:
+            self.log("[gateway] Shutting down printer mocks.")
+
+
+def _body(error: urllib.error.HTTPError) -> str:
+    try:
+        return error.read().decode("utf-8")
+    except Exception:
+        return "<no body>"
 
 
 def main():
-    PrinterMock().run()
+    # GATEWAY_SIZE=N runs N printers, named and stored with a -01.. suffix
+    size = int(os.environ.get("GATEWAY_SIZE", "0"))
+    if size < 1:
+        PrinterMock().run()
+        return
+    name = os.environ.get("PRINTER_NAME", "mock")
+    state_file = os.environ.get("PRINTER_STATE_FILE", ".printer_id")
+    Gateway(
+        [
+            PrinterMock(
+                printer_name=f"{name}-{i:02d}",
+                state_file=f"{state_file}-{i:02d}" if state_file else "",
+            )
+            for i in range(1, size + 1)
+        ]
+    ).run()
 
 
 if __name__ == "__main__":
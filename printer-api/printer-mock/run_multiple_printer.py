@@ -1,75 +1,103 @@
-import threading
+import argparse
+import asyncio
 import os
-import random
-import time
 import sys
 from pathlib import Path
 
 try:
-    from printer import PrinterMock  # type: ignore
+    from fleet import FleetConfig, run_fleet  # type: ignore
 except Exception:  # pragma: no cover - fallback for direct execution
     sys.path.append(str(Path(__file__).parent))
-    from printer import PrinterMock  # type: ignore
+    from fleet import FleetConfig, run_fleet  # type: ignore
 
-ADJECTIVES = [
-    "Sleepy",
-    "Happy",
-    "Grumpy",
-    "Silly",
-    "Brave",
-    "Clever",
-    "Witty",
-    "Funky",
-    "Jolly",
-    "Zippy",
-]
-ANIMALS = [
-    "Panda",
-    "Otter",
-    "Llama",
-    "Penguin",
-    "Koala",
-    "Giraffe",
-    "Sloth",
-    "Moose",
-    "Ferret",
-    "Hedgehog",
-]
 
+def parse_args(argv=None):
+    defaults = FleetConfig()
+    parser = argparse.ArgumentParser(
+        description="Run a fleet of simulated printers against the API."
+    )
+    parser.add_argument("-n", "--printers", type=int, default=defaults.printers)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=defaults.interval,
+        help="seconds between pings when the API does not say (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=defaults.jitter,
+        help="random +/- fraction of the interval (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fixed-interval",
+        action="store_true",
+        help="ping every --interval, ignoring when the API asks printers to ping",
+    )
+    parser.add_argument(
+        "--print-time",
+        type=float,
+        nargs=2,
+        metavar=("MIN", "MAX"),
+        default=defaults.print_time,
+        help="seconds a job takes, uniformly distributed (default: 15 25)",
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=defaults.connections,
+        help="keep-alive connections shared by the fleet (default: %(default)s)",
+    )
+    parser.add_argument("--timeout", type=float, default=defaults.timeout)
+    parser.add_argument(
+        "--gateway",
+        type=int,
+        default=defaults.gateway,
+        metavar="N",
+        help="send the pings of N printers at a time in one batch request",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument(
+        "--report", type=float, default=10.0, help="seconds between stats lines"
+    )
+    parser.add_argument(
+        "--state-file",
+        default=".printer_ids.json",
+        help="printer ids by name, reused across runs ('' to disable)",
+    )
+    return parser.parse_args(argv)
 
-def random_name(existing=None):
-    rng = random.Random(42)  # deterministic seed
-    while True:
 
-        name = f"{rng.choice(ADJECTIVES)}-{rng.choice(ANIMALS)}"
-        if not existing or name not in existing:
-            return name
-
-
-def run_printer(printer_name, idx):
+def main(argv=None):
+    args = parse_args(argv)
     api_base = os.environ.get("API_BASE", "http://127.0.0.1:8000")
-    state_file = f".printer_id_{printer_name}"
-    print(f"[Thread-{idx}] Starting printer: {printer_name}")
-    PrinterMock(
-        api_base=api_base, printer_name=printer_name, state_file=state_file
-    ).run()
-
-
-def main():
-    num_printers = 2
-    names = set()
-    threads = []
-    for i in range(num_printers):
-        name = random_name(names)
-        names.add(name)
-        t = threading.Thread(target=run_printer, args=(name, i + 1), daemon=True)
-        threads.append(t)
-        t.start()
+    config = FleetConfig(
+        printers=args.printers,
+        interval=args.interval,
+        jitter=args.jitter,
+        adaptive=not args.fixed_interval,
+        print_time=tuple(args.print_time),
+        connections=args.connections,
+        timeout=args.timeout,
+        seed=args.seed,
+        gateway=args.gateway,
+    )
+    print(f"Starting {config.printers} printers against {api_base}")
     try:
-        while any(t.is_alive() for t in threads):
-            time.sleep(1)
+        stats = asyncio.run(
+            run_fleet(
+                api_base,
+                config,
+                duration=args.duration,
+                report_every=args.report,
+                state_file=args.state_file or None,
+            )
+        )
     except KeyboardInterrupt:
         print("Shutting down all printers.")
+        return
+    print(f"Done: {stats.total}")
 
 
 if __name__ == "__main__":